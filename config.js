@@ -5,6 +5,7 @@ const TONA_CONFIG = {
     MODAL_WIDTH: '1200px',
     MODAL_HEIGHT: '85vh',
     ENABLE_REAL_TIME_ANALYSIS: true,
+    ENABLE_STREAMING: true,
     ENABLE_MEMORY: true,
     DEBUG_MODE: false,
     FEATURES: {
@@ -1105,7 +1105,10 @@ function initializeModal() {
             messagesContainer.scrollTop = messagesContainer.scrollHeight;
             
             try {
-                const response = await callLLMServer(userQuery);
+                const response = await callLLMServer(userQuery, (text, suggestions) => {
+                    renderStreamingProgress(loadingMsg, text, suggestions);
+                    messagesContainer.scrollTop = messagesContainer.scrollHeight;
+                });
                 
                 loadingMsg.remove();
                 
@@ -1194,7 +1197,16 @@ function copyToClipboard(text) {
     });
 }
 
-async function callLLMServer(userQuery) {
+function getTonaUserId() {
+    let userId = localStorage.getItem('tona_user_id');
+    if (!userId) {
+        userId = 'tona_user_' + crypto.randomUUID();
+        localStorage.setItem('tona_user_id', userId);
+    }
+    return userId;
+}
+
+async function callLLMServer(userQuery, onProgress) {
     const serverUrl = TONA_CONFIG.SERVER_URL;
     
     const chatHistory = window.tonaExtractedMessages || [];
@@ -1209,11 +1221,15 @@ async function callLLMServer(userQuery) {
     const requestData = {
         chat_history: serverMessages,
         user_query: userQuery,
-        user_id: 'tona_user_' + Date.now()
+        user_id: getTonaUserId()
     };
     
     console.log('Tona: Sending request to LLM server:', requestData);
     
+    if (TONA_CONFIG.ENABLE_STREAMING && onProgress) {
+        return callLLMServerStream(serverUrl, requestData, onProgress);
+    }
+    
     const response = await fetch(`${serverUrl}/analyze_chat`, {
         method: 'POST',
         headers: {
@@ -1232,6 +1248,74 @@ async function callLLMServer(userQuery) {
     return result;
 }
 
+async function callLLMServerStream(serverUrl, requestData, onProgress) {
+    const response = await fetch(`${serverUrl}/analyze_chat/stream`, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        },
+        body: JSON.stringify(requestData)
+    });
+    
+    if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status}`);
+    }
+    
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let streamedText = '';
+    const streamedSuggestions = [];
+    
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        
+        buffer += decoder.decode(value, { stream: true });
+        const events = buffer.split('\n\n');
+        buffer = events.pop();
+        
+        for (const rawEvent of events) {
+            const eventName = (rawEvent.match(/^event: (.*)$/m) || [])[1];
+            const dataLine = (rawEvent.match(/^data: (.*)$/m) || [])[1];
+            if (!eventName || dataLine === undefined) continue;
+            
+            const data = JSON.parse(dataLine);
+            if (eventName === 'token') {
+                streamedText += data.text;
+                onProgress(streamedText, streamedSuggestions);
+            } else if (eventName === 'suggestion') {
+                streamedSuggestions.push(data.text);
+                onProgress(streamedText, streamedSuggestions);
+            } else if (eventName === 'result') {
+                console.log('Tona: Received streamed LLM response:', data);
+                return data;
+            } else if (eventName === 'error') {
+                throw new Error(data.detail);
+            }
+        }
+    }
+    
+    throw new Error('Stream ended without a result');
+}
+
+function renderStreamingProgress(loadingMsg, text, suggestions) {
+    const bubble = loadingMsg.querySelector('.assistant-bubble');
+    if (!bubble) return;
+    
+    bubble.innerHTML = `
+        <div style="white-space: pre-wrap;"></div>
+        <div style="margin-top: 12px;"></div>
+    `;
+    bubble.children[0].textContent = text;
+    suggestions.forEach(suggestion => {
+        const suggestionDiv = document.createElement('div');
+        suggestionDiv.style.cssText = 'background: rgba(243, 156, 18, 0.1); padding: 8px; margin: 4px 0; border-radius: 4px; font-size: 13px; border: 1px solid rgba(243, 156, 18, 0.3);';
+        suggestionDiv.textContent = suggestion;
+        bubble.children[1].appendChild(suggestionDiv);
+    });
+}
+
 async function generateInitialAnalysis() {
     const assistantMessages = document.getElementById('assistantMessages');
     if (!assistantMessages) return;
@@ -1254,7 +1338,10 @@ async function generateInitialAnalysis() {
     const statsPromise = updateStatisticsTabWithStats();
     
     try {
-        const response = await callLLMServer("What are some good responses I could send to continue this conversation?");
+        const response = await callLLMServer(
+            "What are some good responses I could send to continue this conversation?",
+            (text, suggestions) => renderStreamingProgress(loadingMsg, text, suggestions)
+        );
         
         loadingMsg.remove();
         
@@ -1308,10 +1395,13 @@ async function generateInitialAnalysis() {
 }
 
 let isStatsUpdateInProgress = false;
+let tonaStatsSession = null;
 
-async function callStatsServer() {
-    const statsServerUrl = TONA_CONFIG.STATS_SERVER_URL || 'http://localhost:8001';
-    
+function statsMessageKey(msg) {
+    return `${msg.isOutgoing ? 1 : 0}|${msg.timestamp}|${msg.text}`;
+}
+
+function buildStatsRequest() {
     const chatHistory = window.tonaExtractedMessages || [];
     
     const serverMessages = chatHistory.map(msg => ({
@@ -1323,37 +1413,109 @@ async function callStatsServer() {
     
     const requestData = {
         chat_history: serverMessages,
-        user_id: 'tona_user_' + Date.now()
+        user_id: getTonaUserId()
     };
     
+    if (tonaStatsSession) {
+        const lastSentIndex = serverMessages.map(statsMessageKey).lastIndexOf(tonaStatsSession.lastMessageKey);
+        if (lastSentIndex !== -1) {
+            requestData.chat_history = serverMessages.slice(lastSentIndex + 1);
+            requestData.session_id = tonaStatsSession.sessionId;
+            requestData.cursor = tonaStatsSession.cursor;
+        }
+    }
+    
+    return { requestData, serverMessages };
+}
+
+async function callStatsMetrics() {
+    const statsServerUrl = TONA_CONFIG.STATS_SERVER_URL || 'http://localhost:8001';
+    const { requestData } = buildStatsRequest();
+    
+    const response = await fetch(`${statsServerUrl}/generate_stats/metrics`, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        },
+        body: JSON.stringify(requestData)
+    });
+    
+    if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status}`);
+    }
+    
+    return response.json();
+}
+
+const STATS_JOB_POLL_WAIT_SECONDS = 25;
+const STATS_JOB_MAX_SECONDS = 180;
+
+async function waitForStatsJob(statsServerUrl, job) {
+    const giveUpAt = Date.now() + STATS_JOB_MAX_SECONDS * 1000;
+    
+    // each poll is held open by the server until the job finishes or the wait runs out
+    while (job.status === 'queued' || job.status === 'running') {
+        if (Date.now() > giveUpAt) {
+            throw new Error(`Stats job ${job.job_id} did not finish in ${STATS_JOB_MAX_SECONDS}s`);
+        }
+        
+        const response = await fetch(
+            `${statsServerUrl}/generate_stats/jobs/${job.job_id}?wait=${STATS_JOB_POLL_WAIT_SECONDS}`
+        );
+        if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
+        job = await response.json();
+    }
+    
+    return job;
+}
+
+async function callStatsServer() {
+    const statsServerUrl = TONA_CONFIG.STATS_SERVER_URL || 'http://localhost:8001';
+    const { requestData, serverMessages } = buildStatsRequest();
+    
     console.log('Tona: Sending request to stats server:', requestData);
     
     try {
-        console.log('Tona: Making request to stats server at:', statsServerUrl);
-        
-        const controller = new AbortController();
-        const timeoutId = setTimeout(() => controller.abort(), 10000);
+        console.log('Tona: Submitting stats job to:', statsServerUrl);
         
-        const response = await fetch(`${statsServerUrl}/generate_stats`, {
+        const response = await fetch(`${statsServerUrl}/generate_stats/jobs`, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
             },
-            body: JSON.stringify(requestData),
-            signal: controller.signal
+            body: JSON.stringify(requestData)
         });
         
-        clearTimeout(timeoutId);
-        
-        console.log('Tona: Stats server response status:', response.status);
+        console.log('Tona: Stats job submit status:', response.status);
         
         if (!response.ok) {
             throw new Error(`HTTP error! status: ${response.status}`);
         }
         
-        const result = await response.json();
+        const job = await waitForStatsJob(statsServerUrl, await response.json());
+        
+        if (job.status === 'failed') {
+            if (job.error && job.error.status_code === 409 && requestData.cursor !== undefined) {
+                console.log('Tona: Stats session out of sync, resending full history');
+                tonaStatsSession = null;
+                return callStatsServer();
+            }
+            throw new Error(`Stats job failed: ${job.error ? job.error.detail : 'unknown error'}`);
+        }
+        
+        const result = job.result;
         console.log('Tona: Received stats response:', result);
         
+        if (result.session_id && serverMessages.length > 0) {
+            tonaStatsSession = {
+                sessionId: result.session_id,
+                cursor: result.cursor,
+                lastMessageKey: statsMessageKey(serverMessages[serverMessages.length - 1])
+            };
+        }
+        
         return result;
     } catch (error) {
         console.error('Tona: Stats server error:', error);
@@ -1373,6 +1535,13 @@ async function updateStatisticsTabWithStats() {
         showStatisticsLoadingAnimation();
         showInsightsLoadingAnimation();
         
+        callStatsMetrics().then(metrics => {
+            hideStatisticsLoadingAnimation();
+            updateStatisticsTabFromData(metrics);
+        }).catch(error => {
+            console.error('Tona: Local metrics failed:', error);
+        });
+        
         const statsData = await callStatsServer();
         
         hideStatisticsLoadingAnimation();
@@ -2074,6 +2243,7 @@ function startChatChangeMonitoring() {
             console.log('Tona: Chat changed from', currentChatId, 'to', newChatId);
             
             window.tonaExtractedMessages = null;
+            tonaStatsSession = null;
             
             const modalOverlay = document.getElementById('tona-modal-overlay');
             if (modalOverlay && modalOverlay.style.display === 'flex') {
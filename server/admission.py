@@ -0,0 +1,320 @@
+import asyncio
+import logging
+import math
+import os
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+
+from cache import LRUCache
+from deadline import remaining_seconds
+from telemetry import ADMISSION_QUEUE, RATE_LIMITED
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_USER_PER_MINUTE = float(os.getenv("RATE_LIMIT_USER_PER_MINUTE", 30))
+RATE_LIMIT_USER_BURST = int(os.getenv("RATE_LIMIT_USER_BURST", 10))
+RATE_LIMIT_IP_PER_MINUTE = float(os.getenv("RATE_LIMIT_IP_PER_MINUTE", 120))
+RATE_LIMIT_IP_BURST = int(os.getenv("RATE_LIMIT_IP_BURST", 30))
+RATE_LIMIT_TRUST_FORWARDED_FOR = os.getenv("RATE_LIMIT_TRUST_FORWARDED_FOR", "false").lower() == "true"
+ADMISSION_MAX_ACTIVE = int(os.getenv("ADMISSION_MAX_ACTIVE", 32))
+ADMISSION_MAX_WAITING = int(os.getenv("ADMISSION_MAX_WAITING", 64))
+ADMISSION_MAX_WAIT_SECONDS = float(os.getenv("ADMISSION_MAX_WAIT_SECONDS", 5))
+
+# refill and take in one round trip; Redis' own clock keeps every worker on the same timeline
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(bucket[1]) or capacity
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate / 1000)
+
+local allowed = 0
+local retry_after_ms = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+else
+    retry_after_ms = math.ceil((cost - tokens) * 1000 / rate)
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity * 1000 / rate) + 1000)
+return {allowed, retry_after_ms}
+"""
+
+# gives back tokens taken for a request another bucket then rejected; never above capacity
+REFUND_SCRIPT = """
+local tokens = tonumber(redis.call('HGET', KEYS[1], 'tokens'))
+if tokens then
+    redis.call('HSET', KEYS[1], 'tokens', tostring(math.min(tonumber(ARGV[1]), tokens + tonumber(ARGV[2]))))
+end
+return 1
+"""
+
+class RateLimited(Exception):
+    def __init__(self, scope: str, retry_after: float):
+        super().__init__(f"Rate limit exceeded for {scope}")
+        self.scope = scope
+        self.retry_after = retry_after
+
+class TokenBucketLimiter:
+    def __init__(self, namespace: str, per_minute: float, burst: int, redis_client=None, local_max_keys: int = 10000):
+        self.namespace = namespace
+        self.rate = per_minute / 60
+        self.capacity = burst
+        self.redis_client = redis_client
+        self.allowed = 0
+        self.limited = 0
+        self.refunded = 0
+        self.redis_errors = 0
+        self._scripts = None
+        self._script_client = None
+        # per-process buckets when Redis is unavailable; limits then apply per worker
+        self.local = LRUCache(local_max_keys, ttl_seconds=max(60.0, burst / self.rate))
+
+    def _redis_scripts(self):
+        if self._scripts is None or self._script_client is not self.redis_client:
+            self._scripts = (
+                self.redis_client.register_script(TOKEN_BUCKET_SCRIPT),
+                self.redis_client.register_script(REFUND_SCRIPT)
+            )
+            self._script_client = self.redis_client
+        return self._scripts
+
+    def _take_local(self, key: str, cost: int) -> Tuple[bool, float]:
+        now = time.monotonic()
+        tokens, updated = self.local.get(key) or (float(self.capacity), now)
+        tokens = min(self.capacity, tokens + (now - updated) * self.rate)
+        if tokens >= cost:
+            self.local.set(key, (tokens - cost, now))
+            return True, 0.0
+        self.local.set(key, (tokens, now))
+        return False, (cost - tokens) / self.rate
+
+    async def take(self, key: str, cost: int = 1) -> Tuple[bool, float]:
+        # a request costing more than the whole bucket could never be admitted
+        cost = min(cost, self.capacity)
+        if self.redis_client:
+            try:
+                take_script, _ = self._redis_scripts()
+                allowed, retry_after_ms = await take_script(
+                    keys=[f"{self.namespace}:{key}"], args=[self.rate, self.capacity, cost]
+                )
+                result = (bool(allowed), retry_after_ms / 1000)
+            except Exception as e:
+                self.redis_errors += 1
+                logger.error(f"Error checking rate limit in Redis: {e}")
+                result = self._take_local(key, cost)
+        else:
+            result = self._take_local(key, cost)
+
+        if result[0]:
+            self.allowed += 1
+        else:
+            self.limited += 1
+        return result
+
+    async def refund(self, key: str, cost: int = 1):
+        cost = min(cost, self.capacity)
+        self.refunded += 1
+        if self.redis_client:
+            try:
+                _, refund_script = self._redis_scripts()
+                await refund_script(keys=[f"{self.namespace}:{key}"], args=[self.capacity, cost])
+                return
+            except Exception as e:
+                self.redis_errors += 1
+                logger.error(f"Error refunding rate limit in Redis: {e}")
+
+        bucket = self.local.get(key)
+        if bucket:
+            tokens, updated = bucket
+            self.local.set(key, (min(self.capacity, tokens + cost), updated))
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "per_minute": round(self.rate * 60, 2),
+            "burst": self.capacity,
+            "allowed": self.allowed,
+            "limited": self.limited,
+            "refunded": self.refunded,
+            "redis_errors": self.redis_errors,
+            "local_buckets": len(self.local)
+        }
+
+class QueueFull(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__("Server is busy")
+        self.retry_after = retry_after
+
+class AdmissionQueue:
+    def __init__(self, name: str, max_active: int = ADMISSION_MAX_ACTIVE, max_waiting: int = ADMISSION_MAX_WAITING,
+                 max_wait_seconds: float = ADMISSION_MAX_WAIT_SECONDS):
+        self.name = name
+        self.max_active = max_active
+        self.max_waiting = max_waiting
+        self.max_wait_seconds = max_wait_seconds
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.avg_service_seconds = 1.0
+        self._semaphore = asyncio.Semaphore(max_active)
+
+    def retry_after(self) -> float:
+        # roughly how long until the current backlog drains through the active slots
+        return max(1.0, (self.waiting + 1) * self.avg_service_seconds / self.max_active)
+
+    def _publish(self):
+        ADMISSION_QUEUE.labels(self.name, "active").set(self.active)
+        ADMISSION_QUEUE.labels(self.name, "waiting").set(self.waiting)
+
+    async def acquire(self) -> float:
+        if self._semaphore.locked() and self.waiting >= self.max_waiting:
+            self.rejected += 1
+            raise QueueFull(self.retry_after())
+
+        remaining = remaining_seconds()
+        timeout = self.max_wait_seconds if remaining is None else min(self.max_wait_seconds, remaining)
+        self.waiting += 1
+        self._publish()
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise QueueFull(self.retry_after()) from None
+        finally:
+            self.waiting -= 1
+            self._publish()
+
+        self.active += 1
+        self.admitted += 1
+        self._publish()
+        return time.monotonic()
+
+    def release(self, admitted_at: float):
+        self.active -= 1
+        self._semaphore.release()
+        self.avg_service_seconds = 0.9 * self.avg_service_seconds + 0.1 * (time.monotonic() - admitted_at)
+        self._publish()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "active": self.active,
+            "max_active": self.max_active,
+            "waiting": self.waiting,
+            "max_waiting": self.max_waiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "avg_service_seconds": round(self.avg_service_seconds, 3)
+        }
+
+class AdmissionController:
+    def __init__(self, app_name: str):
+        self.app_name = app_name
+        self.user_limiter = TokenBucketLimiter(f"tona_rl_{app_name}_user", RATE_LIMIT_USER_PER_MINUTE, RATE_LIMIT_USER_BURST)
+        self.ip_limiter = TokenBucketLimiter(f"tona_rl_{app_name}_ip", RATE_LIMIT_IP_PER_MINUTE, RATE_LIMIT_IP_BURST)
+        self.queue = AdmissionQueue(app_name)
+
+    def set_redis(self, redis_client):
+        self.user_limiter.redis_client = redis_client
+        self.ip_limiter.redis_client = redis_client
+
+    async def check_rate_limits(self, user_id: Optional[str], client_ip: Optional[str], cost: int = 1):
+        checks = []
+        # requests without a user id all share "default", so only the IP bucket applies to them
+        if user_id and user_id != "default":
+            checks.append(("user", self.user_limiter, user_id))
+        if client_ip:
+            checks.append(("ip", self.ip_limiter, client_ip))
+
+        taken = []
+        for scope, limiter, key in checks:
+            allowed, retry_after = await limiter.take(key, cost)
+            if not allowed:
+                # a request the IP bucket turns away must not use up the user's quota too
+                for taken_limiter, taken_key in taken:
+                    await taken_limiter.refund(taken_key, cost)
+                RATE_LIMITED.labels(self.app_name, scope).inc()
+                raise RateLimited(scope, retry_after)
+            taken.append((limiter, key))
+
+    async def admit(self, user_id: Optional[str], client_ip: Optional[str], cost: int = 1) -> float:
+        await self.check_rate_limits(user_id, client_ip, cost)
+        try:
+            return await self.queue.acquire()
+        except QueueFull:
+            RATE_LIMITED.labels(self.app_name, "queue").inc()
+            raise
+
+    def release(self, admitted_at: float):
+        self.queue.release(admitted_at)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "user_limiter": self.user_limiter.get_stats(),
+            "ip_limiter": self.ip_limiter.get_stats(),
+            "queue": self.queue.get_stats()
+        }
+
+def client_ip(request: Any) -> Optional[str]:
+    if RATE_LIMIT_TRUST_FORWARDED_FOR:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else None
+
+def retry_after_header(seconds: float) -> Dict[str, str]:
+    return {"Retry-After": str(max(1, math.ceil(seconds)))}
+
+def rate_limited_error(e: RateLimited) -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail=f"Too many requests for this {e.scope}; retry later",
+        headers=retry_after_header(e.retry_after)
+    )
+
+def busy_error(e: QueueFull) -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail="Server is busy; retry later",
+        headers=retry_after_header(e.retry_after)
+    )
+
+async def admit_or_reject(controller: AdmissionController, user_id: Optional[str], request: Any, cost: int = 1) -> float:
+    try:
+        return await controller.admit(user_id, client_ip(request), cost)
+    except RateLimited as e:
+        raise rate_limited_error(e)
+    except QueueFull as e:
+        raise busy_error(e)
+
+async def rate_limit_or_reject(controller: AdmissionController, user_id: Optional[str], request: Any, cost: int = 1):
+    # for work that is queued elsewhere, so the request itself never holds an admission slot
+    try:
+        await controller.check_rate_limits(user_id, client_ip(request), cost)
+    except RateLimited as e:
+        raise rate_limited_error(e)
+
+class AdmittedStreamingResponse(StreamingResponse):
+    # the body generator may never start (client gone, send failed), so the slot is released here instead
+    def __init__(self, content: Any, controller: AdmissionController, admitted_at: float, **kwargs: Any):
+        super().__init__(content, **kwargs)
+        self.controller = controller
+        self.admitted_at = admitted_at
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.controller.release(self.admitted_at)
@@ -0,0 +1,76 @@
+import json
+import logging
+import os
+from typing import Any, Dict, Sequence
+
+from cache import LRUCache, content_hash
+from metrics_engine import RECENT_WINDOW
+
+logger = logging.getLogger(__name__)
+
+ANALYSIS_STORE_TTL_SECONDS = int(os.getenv("ANALYSIS_STORE_TTL_SECONDS", 3600))
+
+def chat_fingerprint(recent: Sequence[Dict[str, Any]], total_messages: int) -> str:
+    # the stats server may only hold the recent window of a chat, so both sides hash that plus the length
+    normalized = [str(total_messages)]
+    for msg in recent[-RECENT_WINDOW:]:
+        sender = "You" if msg["isOutgoing"] else "Them"
+        normalized.append(f"{sender}|{(msg.get('timestamp') or '').strip()}|{' '.join(msg['text'].split())}")
+    return content_hash(normalized)
+
+class SharedAnalysisStore:
+    FIELDS = ("tone_profile", "local_metrics", "topics")
+
+    def __init__(self, namespace: str = "tona_analysis_v1", redis_client=None,
+                 ttl_seconds: int = ANALYSIS_STORE_TTL_SECONDS, local_max_entries: int = 1024):
+        self.namespace = namespace
+        self.redis_client = redis_client
+        self.ttl_seconds = ttl_seconds
+        self.local = LRUCache(local_max_entries, ttl_seconds)
+        self.lookups = 0
+        self.publishes = 0
+        self.hits = {field: 0 for field in self.FIELDS}
+
+    def _redis_key(self, fingerprint: str) -> str:
+        return f"{self.namespace}:{fingerprint}"
+
+    async def get(self, fingerprint: str) -> Dict[str, Any]:
+        self.lookups += 1
+        entry = None
+        if self.redis_client:
+            try:
+                stored = await self.redis_client.hgetall(self._redis_key(fingerprint))
+                entry = {field: json.loads(value) for field, value in stored.items()}
+            except Exception as e:
+                logger.error(f"Error reading shared analysis from Redis: {e}")
+        if entry is None:
+            entry = dict(self.local.get(fingerprint) or {})
+
+        for field in entry:
+            if field in self.hits:
+                self.hits[field] += 1
+        return entry
+
+    async def publish(self, fingerprint: str, **fields: Any):
+        values = {field: value for field, value in fields.items() if value is not None}
+        if not values:
+            return
+        self.publishes += 1
+        self.local.set(fingerprint, {**(self.local.get(fingerprint) or {}), **values})
+        if self.redis_client:
+            try:
+                key = self._redis_key(fingerprint)
+                pipe = self.redis_client.pipeline(transaction=False)
+                pipe.hset(key, mapping={field: json.dumps(value) for field, value in values.items()})
+                pipe.expire(key, self.ttl_seconds)
+                await pipe.execute()
+            except Exception as e:
+                logger.error(f"Error writing shared analysis to Redis: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "lookups": self.lookups,
+            "publishes": self.publishes,
+            "hits": dict(self.hits),
+            "local_entries": len(self.local)
+        }
@@ -0,0 +1,23 @@
+from fastapi import FastAPI
+
+import main
+import stats_server
+
+# Mounted apps don't receive lifespan events, so their startup/shutdown hooks are driven from here.
+app = FastAPI(title="Tona Servers", version="1.0.0")
+app.mount("/stats", stats_server.app)
+app.mount("/", main.app)
+
+@app.on_event("startup")
+async def startup():
+    await main.app.router.startup()
+    await stats_server.app.router.startup()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await main.app.router.shutdown()
+    await stats_server.app.router.shutdown()
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+# the servers build their OpenAI client at import time; the benchmarks never call it
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+import logging
+logging.disable(logging.WARNING)
+
+import main
+import stats_server
+from load_test import generate_chat
+from metrics_engine import ConversationAggregates
+
+DEFAULT_SIZES = [10, 100, 1000, 10000, 100000]
+DEFAULT_BASELINE = Path(__file__).parent / "benchmark_baseline.json"
+
+LLM_RESPONSE_HEAD = "They sound keen and relaxed, so a light, friendly reply with a concrete next step will land well.\n\n"
+LLM_RESPONSE_SUGGESTIONS = """Suggestions:
+- Sounds great! What time works for you?
+- I'm in! Want to grab food after?
+- Love that idea, count me in 😊
+- Perfect, let's lock in Saturday morning
+
+Feel free to choose one that fits your style!"""
+
+class Context:
+    def __init__(self, size: int, seed: int):
+        rng = random.Random(seed)
+        self.messages = [main.ChatMessage(**msg) for msg in generate_chat(rng, size)]
+        self.user_messages = [msg for msg in self.messages if msg.isOutgoing] or self.messages[:1]
+        self.tone = main._fallback_tone_analysis(self.user_messages)
+        self.summary = main.generate_chat_summary(self.messages)
+        self.aggregates = ConversationAggregates()
+        self.aggregates.add(self.messages)
+        self.metrics = stats_server.analyze_conversation_metrics(self.aggregates)
+        # LLM output is capped by max_tokens in production, so this grows with size only up to a point
+        analysis_lines = "".join(
+            f"Observation {i}: they reply quickly and ask questions, which shows interest.\n" for i in range(min(size, 200))
+        )
+        self.llm_text = LLM_RESPONSE_HEAD + analysis_lines + "\n" + LLM_RESPONSE_SUGGESTIONS
+
+CASES: Dict[str, Callable[[Context], Any]] = {
+    "fallback_tone_analysis": lambda ctx: main._fallback_tone_analysis(ctx.user_messages),
+    "generate_chat_summary": lambda ctx: main.generate_chat_summary(ctx.messages),
+    "create_analysis_messages": lambda ctx: main.create_analysis_messages(
+        ctx.messages, "What should I reply?", ctx.tone, ctx.summary
+    ),
+    "aggregates_add": lambda ctx: ConversationAggregates().add(ctx.messages),
+    "analyze_conversation_metrics": lambda ctx: stats_server.analyze_conversation_metrics(ctx.aggregates),
+    "create_stats_messages": lambda ctx: stats_server.create_stats_messages(ctx.metrics),
+    "suggestions_and_cleaning": lambda ctx: main.parse_llm_response(ctx.llm_text)
+}
+
+def time_case(func: Callable[[], Any], min_time: float, repeats: int) -> float:
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time or number >= 1_000_000:
+            break
+        number *= 10 if elapsed < min_time / 10 else 2
+
+    best = elapsed / number
+    for _ in range(repeats - 1):
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, (time.perf_counter() - started) / number)
+    return best
+
+def run_benchmarks(sizes: List[int], cases: List[str], min_time: float, repeats: int, seed: int) -> Dict[str, float]:
+    results = {}
+    for size in sizes:
+        ctx = Context(size, seed)
+        for name in cases:
+            seconds = time_case(lambda: CASES[name](ctx), min_time, repeats)
+            results[f"{name}@{size}"] = seconds
+            print(f"  {name:<30}{size:>8} msgs {format_seconds(seconds):>12}", flush=True)
+    return results
+
+def format_seconds(seconds: float) -> str:
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:.1f} us"
+    if seconds < 1:
+        return f"{seconds * 1e3:.2f} ms"
+    return f"{seconds:.2f} s"
+
+def compare(results: Dict[str, float], baseline: Dict[str, float], threshold: float) -> List[str]:
+    regressions = []
+    print(f"\n{'benchmark':<40}{'current':>12}{'baseline':>12}{'ratio':>8}  status")
+    for key, seconds in results.items():
+        base = baseline.get(key)
+        if base is None:
+            print(f"{key:<40}{format_seconds(seconds):>12}{'-':>12}{'-':>8}  new")
+            continue
+        ratio = seconds / base if base else float("inf")
+        if ratio > threshold:
+            status = "REGRESSION"
+            regressions.append(key)
+        elif ratio < 1 / threshold:
+            status = "faster"
+        else:
+            status = "ok"
+        print(f"{key:<40}{format_seconds(seconds):>12}{format_seconds(base):>12}{ratio:>8.2f}  {status}")
+    return regressions
+
+def parse_args(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Microbenchmarks for the per-request pure-Python paths")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="conversation lengths in messages")
+    parser.add_argument("--only", nargs="+", choices=sorted(CASES), help="run a subset of the benchmarks")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="overwrite the baseline with this run")
+    parser.add_argument("--threshold", type=float, default=1.25, help="slowdown ratio reported as a regression")
+    parser.add_argument("--min-time", type=float, default=0.05, help="minimum seconds per timing run")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", type=Path, help="write this run's results as JSON")
+    return parser.parse_args(argv)
+
+def main_cli():
+    args = parse_args()
+    cases = args.only or list(CASES)
+
+    print(f"Running {len(cases)} benchmarks at sizes {args.sizes}")
+    results = run_benchmarks(args.sizes, cases, args.min_time, args.repeats, args.seed)
+
+    run = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results
+    }
+    if args.output:
+        args.output.write_text(json.dumps(run, indent=2) + "\n")
+
+    if args.save_baseline:
+        if args.baseline.exists():
+            # keep entries for benchmarks or sizes not part of this run
+            run["results"] = {**json.loads(args.baseline.read_text()).get("results", {}), **results}
+        args.baseline.write_text(json.dumps(run, indent=2) + "\n")
+        print(f"\nBaseline written to {args.baseline}")
+        return
+
+    if not args.baseline.exists():
+        print(f"\nNo baseline at {args.baseline}; run with --save-baseline to create one")
+        return
+
+    baseline = json.loads(args.baseline.read_text())
+    print(f"\nComparing against baseline from {baseline.get('created')} (Python {baseline.get('python')})")
+    regressions = compare(results, baseline.get("results", {}), args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) over {args.threshold}x: {', '.join(regressions)}")
+        sys.exit(1)
+    print("\nNo regressions")
+
+if __name__ == "__main__":
+    main_cli()
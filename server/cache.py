@@ -0,0 +1,213 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+def content_hash(parts: Iterable[str]) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+class LRUCache:
+    def __init__(self, max_entries: int, ttl_seconds: float, max_bytes: Optional[int] = None,
+                 sizeof: Optional[Callable[[Any], int]] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof or (lambda value: len(json.dumps(value, default=str)))
+        self.total_bytes = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value, _ = entry
+        if expires_at <= time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any):
+        if key in self._entries:
+            self._remove(key)
+        size = self.sizeof(value) if self.max_bytes is not None else 0
+        if self.max_bytes is not None and size > self.max_bytes:
+            # never flush the whole cache for one value that could not fit anyway
+            self.evictions += 1
+            return
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value, size)
+        self.total_bytes += size
+        self._evict()
+
+    def _remove(self, key: str):
+        _, _, size = self._entries.pop(key)
+        self.total_bytes -= size
+
+    def _evict(self):
+        now = time.monotonic()
+        while self._entries:
+            oldest_key = next(iter(self._entries))
+            if self._entries[oldest_key][0] <= now:
+                self._remove(oldest_key)
+                self.expirations += 1
+            elif (len(self._entries) > self.max_entries or
+                  (self.max_bytes is not None and self.total_bytes > self.max_bytes)):
+                self._remove(oldest_key)
+                self.evictions += 1
+            else:
+                break
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+            "expirations": self.expirations
+        }
+
+class TieredCache:
+    def __init__(self, namespace: str, redis_client=None, max_entries: int = 1024, ttl_seconds: float = 3600):
+        self.namespace = namespace
+        self.redis_client = redis_client
+        self.ttl_seconds = ttl_seconds
+        self.local = LRUCache(max_entries, ttl_seconds)
+        self.local_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+
+    def _redis_key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    async def get(self, key: str) -> Optional[Any]:
+        value = self.local.get(key)
+        if value is not None:
+            self.local_hits += 1
+            return value
+
+        if self.redis_client:
+            try:
+                cached = await self.redis_client.get(self._redis_key(key))
+                if cached:
+                    value = json.loads(cached)
+                    self.local.set(key, value)
+                    self.redis_hits += 1
+                    return value
+            except Exception as e:
+                logger.error(f"Error reading cache from Redis: {e}")
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: Any):
+        self.local.set(key, value)
+        if self.redis_client:
+            try:
+                await self.redis_client.setex(self._redis_key(key), int(self.ttl_seconds), json.dumps(value))
+            except Exception as e:
+                logger.error(f"Error writing cache to Redis: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.local_hits + self.redis_hits + self.misses
+        return {
+            "local_hits": self.local_hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.local_hits + self.redis_hits) / lookups, 3) if lookups else 0.0,
+            "local_entries": len(self.local),
+            "local_max_entries": self.local.max_entries,
+            "evictions": self.local.evictions,
+            "expirations": self.local.expirations
+        }
+
+class StaleWhileRevalidateCache(TieredCache):
+    def __init__(self, namespace: str, redis_client=None, max_entries: int = 1024,
+                 fresh_seconds: float = 600, stale_seconds: float = 86400):
+        super().__init__(namespace, redis_client, max_entries, fresh_seconds + stale_seconds)
+        self.fresh_seconds = fresh_seconds
+        self.stale_hits = 0
+        self.refreshes = 0
+        self.refresh_failures = 0
+        self._refreshing: Dict[str, asyncio.Task] = {}
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+        entry = await self.get(key)
+        if entry is not None:
+            if entry["fresh_until"] <= time.time():
+                self.stale_hits += 1
+                self._schedule_refresh(key, compute)
+            return entry["value"]
+
+        return await self._compute_and_store(key, compute)
+
+    async def _compute_and_store(self, key: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+        value = await compute()
+        if value is not None:
+            await self.set(key, {"value": value, "fresh_until": time.time() + self.fresh_seconds})
+        return value
+
+    def _schedule_refresh(self, key: str, compute: Callable[[], Awaitable[Any]]):
+        if key in self._refreshing:
+            return
+        self._refreshing[key] = asyncio.create_task(self._refresh(key, compute))
+
+    async def _refresh(self, key: str, compute: Callable[[], Awaitable[Any]]):
+        self.refreshes += 1
+        try:
+            await self._compute_and_store(key, compute)
+        except Exception as e:
+            self.refresh_failures += 1
+            logger.error(f"Background cache refresh failed for {self.namespace}: {e}")
+        finally:
+            self._refreshing.pop(key, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = super().get_stats()
+        stats.update({
+            "stale_hits": self.stale_hits,
+            "refreshes": self.refreshes,
+            "refresh_failures": self.refresh_failures,
+            "refreshing": len(self._refreshing)
+        })
+        return stats
+
+class SingleFlight:
+    def __init__(self):
+        self.leaders = 0
+        self.coalesced = 0
+        self._in_flight: Dict[str, asyncio.Future] = {}
+
+    async def do(self, key: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+        future = self._in_flight.get(key)
+        if future is not None:
+            self.coalesced += 1
+        else:
+            self.leaders += 1
+            future = asyncio.ensure_future(compute())
+            self._in_flight[key] = future
+            future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        # shielded so a caller that disconnects doesn't cancel the work for everyone else waiting on it
+        return await asyncio.shield(future)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._in_flight)
+        }
@@ -0,0 +1,63 @@
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+MAX_LATENCY_BUDGET_MS = int(os.getenv("MAX_LATENCY_BUDGET_MS", 120000))
+
+class Budget:
+    def __init__(self, seconds: float, parent: Optional["Budget"] = None):
+        self.deadline = time.monotonic() + seconds
+        self.degraded = False
+        self.parent = parent
+
+    def remaining(self) -> float:
+        return max(0.0, self.deadline - time.monotonic())
+
+current_budget: ContextVar[Optional[Budget]] = ContextVar("current_budget", default=None)
+
+def budget_ms(header_value: Optional[str], default_ms: int) -> int:
+    try:
+        requested = int(header_value) if header_value else 0
+    except ValueError:
+        requested = 0
+    return min(requested if requested > 0 else default_ms, MAX_LATENCY_BUDGET_MS)
+
+@contextmanager
+def latency_budget(header_value: Optional[str], default_ms: int):
+    # the budget object is shared by tasks spawned inside, so a fallback anywhere marks the whole request
+    budget = Budget(budget_ms(header_value, default_ms) / 1000)
+    token = current_budget.set(budget)
+    try:
+        yield budget
+    finally:
+        current_budget.reset(token)
+
+@contextmanager
+def sub_budget(fraction: float):
+    # caps one step at a share of what is left, so it can't starve the steps after it
+    parent = current_budget.get()
+    if parent is None:
+        yield None
+        return
+    budget = Budget(parent.remaining() * fraction, parent=parent)
+    token = current_budget.set(budget)
+    try:
+        yield budget
+    finally:
+        current_budget.reset(token)
+
+def remaining_seconds() -> Optional[float]:
+    budget = current_budget.get()
+    return budget.remaining() if budget else None
+
+def mark_degraded():
+    budget = current_budget.get()
+    while budget:
+        budget.degraded = True
+        budget = budget.parent
+
+def is_degraded() -> bool:
+    budget = current_budget.get()
+    return bool(budget and budget.degraded)
@@ -0,0 +1,196 @@
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from fastapi import HTTPException
+
+from admission import QueueFull
+from cache import LRUCache
+from telemetry import JOBS, JOBS_FINISHED, stage
+
+logger = logging.getLogger(__name__)
+
+JOB_RESULT_TTL_SECONDS = int(os.getenv("JOB_RESULT_TTL_SECONDS", 3600))
+JOB_POLL_INTERVAL_SECONDS = float(os.getenv("JOB_POLL_INTERVAL_SECONDS", 0.25))
+JOB_MAX_WAIT_SECONDS = float(os.getenv("JOB_MAX_WAIT_SECONDS", 30))
+
+FINISHED_STATES = ("done", "failed")
+
+class JobStore:
+    def __init__(self, namespace: str, redis_client=None, ttl_seconds: int = JOB_RESULT_TTL_SECONDS,
+                 local_max_jobs: int = 1000):
+        self.namespace = namespace
+        self.redis_client = redis_client
+        self.ttl_seconds = ttl_seconds
+        # any worker may be asked about a job, so records live in Redis; this only covers an outage
+        self._local = LRUCache(local_max_jobs, ttl_seconds)
+
+    async def save(self, job: Dict[str, Any]):
+        if self.redis_client:
+            try:
+                await self.redis_client.setex(f"{self.namespace}_{job['job_id']}", self.ttl_seconds, json.dumps(job))
+                return
+            except Exception as e:
+                logger.error(f"Error writing job to Redis: {e}")
+
+        self._local.set(job["job_id"], dict(job))
+
+    async def load(self, job_id: str) -> Optional[Dict[str, Any]]:
+        if self.redis_client:
+            try:
+                data = await self.redis_client.get(f"{self.namespace}_{job_id}")
+                if data:
+                    return json.loads(data)
+            except Exception as e:
+                logger.error(f"Error reading job from Redis: {e}")
+
+        job = self._local.get(job_id)
+        return dict(job) if job else None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return self._local.get_stats()
+
+class JobPool:
+    def __init__(self, name: str, run: Callable[[Any], Awaitable[Dict[str, Any]]], store: JobStore,
+                 workers: int = 4, max_queued: int = 100):
+        self.name = name
+        self.run = run
+        self.store = store
+        self.workers = workers
+        self.max_queued = max_queued
+        self.running = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.avg_run_seconds = 5.0
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queued)
+        self._tasks: List[asyncio.Task] = []
+        self._finished: Dict[str, asyncio.Event] = {}
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # queued work dies with the process; say so rather than leaving clients polling until the TTL
+        while not self._queue.empty():
+            job, _ = self._queue.get_nowait()
+            await self._finish(job, "failed", error={"status_code": 503, "detail": "Server restarted; resubmit the job"})
+
+    def retry_after(self) -> float:
+        return max(1.0, (self._queue.qsize() + 1) * self.avg_run_seconds / self.workers)
+
+    def _publish(self):
+        JOBS.labels(self.name, "queued").set(self._queue.qsize())
+        JOBS.labels(self.name, "running").set(self.running)
+
+    async def submit(self, payload: Any, request_id: Optional[str] = None) -> Dict[str, Any]:
+        if self._queue.full():
+            self.rejected += 1
+            raise QueueFull(self.retry_after())
+
+        now = time.time()
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "status": "queued",
+            "created_at": now,
+            "updated_at": now,
+            "request_id": request_id,
+            "result": None,
+            "error": None
+        }
+        await self.store.save(job)
+        self._finished[job["job_id"]] = asyncio.Event()
+        self._queue.put_nowait((job, payload))
+        self.submitted += 1
+        self._publish()
+        return job
+
+    async def _worker(self):
+        while True:
+            job, payload = await self._queue.get()
+            try:
+                await self._run_job(job, payload)
+            finally:
+                self._queue.task_done()
+
+    async def _run_job(self, job: Dict[str, Any], payload: Any):
+        started = time.monotonic()
+        self.running += 1
+        self._publish()
+        job.update(status="running", updated_at=time.time())
+        await self.store.save(job)
+        try:
+            with stage(f"{self.name}.job"):
+                result = await self.run(payload)
+            await self._finish(job, "done", result=result)
+        except asyncio.CancelledError:
+            await self._finish(job, "failed", error={"status_code": 503, "detail": "Server restarted; resubmit the job"})
+            raise
+        except HTTPException as e:
+            await self._finish(job, "failed", error={"status_code": e.status_code, "detail": e.detail})
+        except Exception as e:
+            logger.error(f"Error in {self.name} job {job['job_id']}: {e}")
+            await self._finish(job, "failed", error={"status_code": 500, "detail": f"Job failed: {str(e)}"})
+        finally:
+            self.running -= 1
+            self.avg_run_seconds = 0.9 * self.avg_run_seconds + 0.1 * (time.monotonic() - started)
+            self._publish()
+
+    async def _finish(self, job: Dict[str, Any], status: str, result: Optional[Dict[str, Any]] = None,
+                      error: Optional[Dict[str, Any]] = None):
+        job.update(status=status, updated_at=time.time(), result=result, error=error)
+        await self.store.save(job)
+        if status == "done":
+            self.completed += 1
+        else:
+            self.failed += 1
+        JOBS_FINISHED.labels(self.name, status).inc()
+        event = self._finished.pop(job["job_id"], None)
+        if event is not None:
+            event.set()
+
+    async def wait(self, job_id: str, timeout: float) -> Optional[Dict[str, Any]]:
+        job = await self.store.load(job_id)
+        if job is None or job["status"] in FINISHED_STATES or timeout <= 0:
+            return job
+
+        deadline = time.monotonic() + min(timeout, JOB_MAX_WAIT_SECONDS)
+        event = self._finished.get(job_id)
+        if event is not None:
+            try:
+                await asyncio.wait_for(event.wait(), deadline - time.monotonic())
+            except asyncio.TimeoutError:
+                pass
+            return await self.store.load(job_id)
+
+        # the job runs in another worker process, so all that is shared is the stored record
+        while time.monotonic() < deadline:
+            await asyncio.sleep(min(JOB_POLL_INTERVAL_SECONDS, max(0.0, deadline - time.monotonic())))
+            job = await self.store.load(job_id)
+            if job is None or job["status"] in FINISHED_STATES:
+                break
+        return job
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "running": self.running,
+            "queued": self._queue.qsize(),
+            "max_queued": self.max_queued,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "avg_run_seconds": round(self.avg_run_seconds, 3),
+            "store_fallback": self.store.get_stats()
+        }
@@ -0,0 +1,89 @@
+import re
+from collections import Counter
+from typing import Dict, FrozenSet, Iterable
+
+class Lexicon:
+    def __init__(self, categories: Dict[str, Iterable[str]]):
+        phrase_categories: Dict[str, set] = {}
+        for category, phrases in categories.items():
+            for phrase in phrases:
+                phrase_categories.setdefault(phrase.lower(), set()).add(category)
+
+        # longest phrases first so the alternation prefers "here are some" over "here are"
+        phrases = sorted(phrase_categories, key=len, reverse=True)
+        self._pattern = re.compile(
+            r"(?<!\w)(?:" + "|".join(re.escape(phrase) for phrase in phrases) + r")(?!\w)",
+            re.IGNORECASE
+        )
+
+        # a match only reports the longest phrase at its position, so it also carries
+        # the categories of every shorter phrase nested inside it
+        self._categories: Dict[str, FrozenSet[str]] = {}
+        for phrase in phrases:
+            nested = set(phrase_categories[phrase])
+            for other in phrases:
+                if other != phrase and other in phrase and re.search(
+                        r"(?<!\w)" + re.escape(other) + r"(?!\w)", phrase):
+                    nested |= phrase_categories[other]
+            self._categories[phrase] = frozenset(nested)
+
+    def scan(self, text: str) -> Counter:
+        hits = Counter()
+        for match in self._pattern.finditer(text):
+            hits.update(self._categories[match.group(0).lower()])
+        return hits
+
+    def categories(self, text: str) -> FrozenSet[str]:
+        found = set()
+        for match in self._pattern.finditer(text):
+            found |= self._categories[match.group(0).lower()]
+        return frozenset(found)
+
+TOPIC_LABELS = {
+    "topic:work": "work",
+    "topic:social": "social plans",
+    "topic:sports": "sports",
+    "topic:personal": "personal life"
+}
+
+LEXICON = Lexicon({
+    "topic:work": [
+        "work", "works", "worked", "working", "coworker", "coworkers", "job", "jobs",
+        "project", "projects", "deadline", "deadlines"
+    ],
+    "topic:social": [
+        "weekend", "weekends", "plan", "plans", "planned", "planning", "meet", "meets", "meeting", "meetings",
+        "meetup", "dinner", "dinners", "lunch", "lunches"
+    ],
+    "topic:sports": [
+        "game", "games", "sport", "sports", "match", "matches", "team", "teams", "teammate", "teammates"
+    ],
+    "topic:personal": ["family", "families", "home", "homes", "house", "houses"],
+    "formal": ["indeed", "furthermore", "consequently", "therefore", "thus", "hence", "moreover"],
+    "casual": ["yeah", "cool", "awesome", "gonna", "wanna", "gotta", "hey", "hi", "yo"],
+    "tone_request": [
+        "cool", "casual", "formal", "professional", "friendly", "enthusiastic",
+        "serious", "funny", "playful", "romantic", "flirty", "business",
+        "tone", "style", "sound", "make it", "change", "different",
+        "casually", "formally", "professionally", "friendlier", "enthusiastically", "seriously",
+        "funnier", "playfully", "romantically", "flirtier", "tones", "styles", "sounds", "sounding",
+        "changed", "changing", "differently"
+    ],
+    "suggestion_header": ["suggestions:", "responses:", "options:", "you could say:", "try saying:"],
+    "analysis_phrase": [
+        "analysis", "insight", "observation", "assessment", "evaluation", "conclusion", "summary",
+        "here are", "here is", "some good", "good responses", "you could send", "feel free", "choose one",
+        "pick one", "mix and match", "options", "suggestions", "responses", "fits your style", "that fits",
+        "based on", "consider", "might want", "could try", "you can", "this shows", "this indicates",
+        "analyses", "insights", "observations", "assessments", "evaluations", "conclusions", "summaries",
+        "considering", "considered", "considers"
+    ],
+    "skip_phrase": [
+        "suggestions:", "responses:", "options:", "you could say:", "try saying:",
+        "here are a few", "here are some", "feel free to", "choose one", "pick one"
+    ]
+})
+
+def topic_hits(text: str) -> Dict[str, int]:
+    hits = LEXICON.scan(text)
+    return {label: hits[category] for category, label in TOPIC_LABELS.items() if hits[category]}
@@ -0,0 +1,263 @@
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Optional
+
+import httpx
+import openai
+from openai import AsyncOpenAI
+
+from deadline import remaining_seconds
+from llm_limiter import ClusterLLMLimiter
+from token_budget import estimate_tokens
+from telemetry import LLM_CALLS, LLM_CIRCUIT_STATE, LLM_IN_FLIGHT, LLM_TOKENS, stage
+
+logger = logging.getLogger(__name__)
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 8))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", 20))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", 10))
+LLM_REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", 60))
+LLM_MIN_CALL_SECONDS = float(os.getenv("LLM_MIN_CALL_SECONDS", 0.25))
+LLM_SLOW_CALL_SECONDS = float(os.getenv("LLM_SLOW_CALL_SECONDS", 5))
+LLM_BREAKER_FAILURE_THRESHOLD = int(os.getenv("LLM_BREAKER_FAILURE_THRESHOLD", 5))
+LLM_BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", 30))
+LLM_DEFAULT_MAX_TOKENS = int(os.getenv("LLM_DEFAULT_MAX_TOKENS", 1000))
+
+# failures that say something about the provider's health; a bad request does not
+PROVIDER_FAILURES = (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)
+
+class LLMUnavailable(Exception):
+    pass
+
+class DeadlineExceeded(LLMUnavailable):
+    pass
+
+class CircuitOpenError(LLMUnavailable):
+    pass
+
+def create_openai_client() -> AsyncOpenAI:
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS
+        ),
+        timeout=httpx.Timeout(LLM_REQUEST_TIMEOUT, connect=5.0)
+    )
+    base_url = os.getenv("OPENAI_BASE_URL")
+    if base_url:
+        logger.info(f"Using OpenAI-compatible endpoint at {base_url}")
+    return AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), base_url=base_url, http_client=http_client)
+
+class CircuitBreaker:
+    STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+    def __init__(self, failure_threshold: int = LLM_BREAKER_FAILURE_THRESHOLD,
+                 reset_seconds: float = LLM_BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.trips = 0
+        self.rejected = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+
+    def _set_state(self, state: str):
+        self.state = state
+        LLM_CIRCUIT_STATE.set(self.STATES[state])
+
+    def allow(self) -> bool:
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.reset_seconds:
+                self.rejected += 1
+                return False
+            self._set_state("half_open")
+        if self.state == "half_open":
+            # a single probe call decides whether the provider has recovered
+            if self._probe_in_flight:
+                self.rejected += 1
+                return False
+            self._probe_in_flight = True
+        return True
+
+    def record_success(self):
+        self.failures = 0
+        self._probe_in_flight = False
+        if self.state != "closed":
+            logger.info("LLM circuit breaker closed")
+            self._set_state("closed")
+
+    def record_failure(self):
+        self._probe_in_flight = False
+        self.failures += 1
+        if self.state == "half_open" or (self.state == "closed" and self.failures >= self.failure_threshold):
+            logger.warning(f"LLM circuit breaker opened after {self.failures} failure(s)")
+            self.trips += 1
+            self.opened_at = time.monotonic()
+            self._set_state("open")
+
+    def release(self):
+        self._probe_in_flight = False
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "trips": self.trips,
+            "rejected": self.rejected
+        }
+
+def estimate_call_tokens(kwargs: Dict[str, Any]) -> int:
+    # close enough to reserve quota up front; the real usage settles it afterwards
+    prompt_tokens = sum(
+        estimate_tokens(message["content"]) for message in kwargs.get("messages", [])
+        if isinstance(message.get("content"), str)
+    )
+    return prompt_tokens + (kwargs.get("max_tokens") or LLM_DEFAULT_MAX_TOKENS)
+
+class CallSlot:
+    def __init__(self, deadline: Optional[float]):
+        self.deadline = deadline
+        self.usage: Any = None
+
+    def time_left(self) -> Optional[float]:
+        return max(0.0, self.deadline - time.monotonic()) if self.deadline is not None else None
+
+class LLMClient:
+    def __init__(self, openai_client: Optional[AsyncOpenAI] = None, max_concurrency: int = LLM_MAX_CONCURRENCY,
+                 breaker: Optional[CircuitBreaker] = None, limiter: Optional[ClusterLLMLimiter] = None):
+        self.openai_client = openai_client or create_openai_client()
+        self.max_concurrency = max_concurrency
+        self.in_flight = 0
+        self.usage: Dict[str, Dict[str, int]] = {}
+        self.breaker = breaker or CircuitBreaker()
+        # shared by every worker of both servers once a Redis client is attached at startup
+        self.limiter = limiter or ClusterLLMLimiter()
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    def record_usage(self, call_name: str, usage: Any):
+        stats = self.usage.setdefault(call_name, {
+            "calls": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0
+        })
+        stats["calls"] += 1
+        if usage is None:
+            return
+        details = getattr(usage, "prompt_tokens_details", None)
+        tokens = {
+            "prompt": usage.prompt_tokens or 0,
+            "cached": getattr(details, "cached_tokens", None) or 0,
+            "completion": usage.completion_tokens or 0
+        }
+        for kind, count in tokens.items():
+            stats[f"{kind}_tokens"] += count
+            LLM_TOKENS.labels(call_name, kind).inc(count)
+
+    def get_usage_stats(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            call_name: {
+                **stats,
+                "cached_ratio": round(stats["cached_tokens"] / stats["prompt_tokens"], 3) if stats["prompt_tokens"] else 0.0
+            }
+            for call_name, stats in self.usage.items()
+        }
+
+    def _admit(self, call_name: str) -> Optional[float]:
+        remaining = remaining_seconds()
+        if remaining is not None and remaining < LLM_MIN_CALL_SECONDS:
+            LLM_CALLS.labels(call_name, "deadline").inc()
+            raise DeadlineExceeded(f"{call_name}: latency budget exhausted")
+        if not self.breaker.allow():
+            LLM_CALLS.labels(call_name, "circuit_open").inc()
+            raise CircuitOpenError(f"{call_name}: LLM circuit breaker is open")
+        return remaining
+
+    @asynccontextmanager
+    async def _slot(self, call_name: str, token_estimate: int):
+        remaining = self._admit(call_name)
+        slot = CallSlot(time.monotonic() + remaining if remaining is not None else None)
+
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), slot.time_left())
+        except asyncio.TimeoutError:
+            self.breaker.release()
+            LLM_CALLS.labels(call_name, "deadline").inc()
+            raise DeadlineExceeded(f"{call_name}: latency budget spent waiting for a free LLM slot") from None
+
+        try:
+            with stage("llm.queue"):
+                lease_id = await self.limiter.acquire(token_estimate, slot.time_left())
+        except BaseException as e:
+            self.breaker.release()
+            self._semaphore.release()
+            if isinstance(e, asyncio.TimeoutError):
+                LLM_CALLS.labels(call_name, "deadline").inc()
+                raise DeadlineExceeded(f"{call_name}: timed out waiting for a cluster-wide LLM slot") from None
+            raise
+
+        self.in_flight += 1
+        LLM_IN_FLIGHT.inc()
+        sent_at = time.monotonic()
+        outcome = "error"
+        drain = False
+        try:
+            with stage(f"llm.{call_name}"):
+                yield slot
+            outcome = "ok"
+            self.breaker.record_success()
+        except asyncio.TimeoutError:
+            outcome = "deadline"
+            # a tight client budget says nothing about the provider; only a long wait counts against it
+            if time.monotonic() - sent_at >= LLM_SLOW_CALL_SECONDS:
+                self.breaker.record_failure()
+            raise DeadlineExceeded(f"{call_name}: exceeded its latency budget") from None
+        except (asyncio.CancelledError, GeneratorExit):
+            outcome = "cancelled"
+            raise
+        except PROVIDER_FAILURES as e:
+            self.breaker.record_failure()
+            # the provider's own 429 means the shared quota is spent, whatever the bucket says
+            drain = isinstance(e, openai.RateLimitError)
+            raise
+        finally:
+            self.breaker.release()
+            tokens_used = getattr(slot.usage, "total_tokens", None) if slot.usage is not None else None
+            await self.limiter.release(lease_id, token_estimate, tokens_used, drain)
+            self._semaphore.release()
+            self.in_flight -= 1
+            LLM_IN_FLIGHT.dec()
+            LLM_CALLS.labels(call_name, outcome).inc()
+
+    async def chat_completion(self, call_name: str = "default", **kwargs: Any):
+        async with self._slot(call_name, estimate_call_tokens(kwargs)) as slot:
+            response = await asyncio.wait_for(self.openai_client.chat.completions.create(**kwargs), slot.time_left())
+            slot.usage = getattr(response, "usage", None)
+        self.record_usage(call_name, slot.usage)
+        return response
+
+    async def stream_chat_completion(self, call_name: str = "default", on_usage: Optional[Callable[[Any], None]] = None,
+                                     **kwargs: Any) -> AsyncIterator[str]:
+        async with self._slot(call_name, estimate_call_tokens(kwargs)) as slot:
+            stream = await asyncio.wait_for(
+                self.openai_client.chat.completions.create(stream=True, stream_options={"include_usage": True}, **kwargs),
+                slot.time_left()
+            )
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(stream.__anext__(), slot.time_left())
+                except StopAsyncIteration:
+                    break
+                # with include_usage the final chunk carries the usage and no choices
+                if getattr(chunk, "usage", None):
+                    slot.usage = chunk.usage
+                    # the caller gets the usage chunk so it can report tokens like a non-streamed response
+                    if on_usage:
+                        on_usage(chunk)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        self.record_usage(call_name, slot.usage)
+
+    async def close(self):
+        await self.openai_client.close()
@@ -0,0 +1,226 @@
+import asyncio
+import logging
+import os
+import random
+import time
+import uuid
+from typing import Any, Dict, Optional
+
+from telemetry import LLM_CLUSTER_SLOTS, LLM_CLUSTER_TOKENS
+
+logger = logging.getLogger(__name__)
+
+LLM_CLUSTER_MAX_CONCURRENCY = int(os.getenv("LLM_CLUSTER_MAX_CONCURRENCY", 16))
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", 0))
+LLM_QUOTA_HEADROOM = float(os.getenv("LLM_QUOTA_HEADROOM", 0.9))
+LLM_LIMITER_LEASE_SECONDS = float(os.getenv("LLM_LIMITER_LEASE_SECONDS", 120))
+LLM_LIMITER_MAX_WAIT_SECONDS = float(os.getenv("LLM_LIMITER_MAX_WAIT_SECONDS", 30))
+LLM_LIMITER_POLL_SECONDS = float(os.getenv("LLM_LIMITER_POLL_SECONDS", 0.05))
+
+# KEYS: leases, queue, queue heartbeats, ticket counter, token bucket
+# leases and queue entries carry expiries so a crashed worker can't hold a slot forever
+ACQUIRE_SCRIPT = """
+local id = ARGV[1]
+local limit = tonumber(ARGV[2])
+local lease_ms = tonumber(ARGV[3])
+local wait_ttl_ms = tonumber(ARGV[4])
+local rate = tonumber(ARGV[5]) / 60000
+local cost = tonumber(ARGV[6])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+local stale = redis.call('ZRANGEBYSCORE', KEYS[3], '-inf', now)
+if #stale > 0 then
+    redis.call('ZREM', KEYS[2], unpack(stale))
+    redis.call('ZREM', KEYS[3], unpack(stale))
+end
+
+if not redis.call('ZSCORE', KEYS[2], id) then
+    redis.call('ZADD', KEYS[2], redis.call('INCR', KEYS[4]), id)
+end
+redis.call('ZADD', KEYS[3], now + wait_ttl_ms, id)
+
+local tokens = -1
+local capacity = rate * 60000
+if rate > 0 then
+    local bucket = redis.call('HMGET', KEYS[5], 'tokens', 'updated')
+    tokens = tonumber(bucket[1]) or capacity
+    local updated = tonumber(bucket[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+    cost = math.min(cost, capacity)
+end
+
+local held = redis.call('ZCARD', KEYS[1])
+local position = redis.call('ZRANK', KEYS[2], id)
+local admitted = 0
+local wait_ms = 0
+if limit <= 0 or position < limit - held then
+    -- with a token quota only the head may go, so a large request isn't overtaken forever
+    if rate <= 0 then
+        admitted = 1
+    elseif position == 0 and tokens >= cost then
+        admitted = 1
+        tokens = tokens - cost
+    elseif position == 0 then
+        wait_ms = math.ceil((cost - tokens) / rate)
+    end
+end
+
+if admitted == 1 then
+    redis.call('ZREM', KEYS[2], id)
+    redis.call('ZREM', KEYS[3], id)
+    redis.call('ZADD', KEYS[1], now + lease_ms, id)
+    held = held + 1
+end
+if rate > 0 then
+    redis.call('HSET', KEYS[5], 'tokens', tostring(tokens), 'updated', now)
+    redis.call('PEXPIRE', KEYS[5], 120000)
+end
+redis.call('PEXPIRE', KEYS[4], lease_ms + wait_ttl_ms)
+return {admitted, position, held, redis.call('ZCARD', KEYS[2]), tostring(tokens), wait_ms}
+"""
+
+# KEYS: leases, queue, queue heartbeats, token bucket
+# settles the reservation against real usage; drain empties the bucket after a provider 429
+RELEASE_SCRIPT = """
+redis.call('ZREM', KEYS[1], ARGV[1])
+redis.call('ZREM', KEYS[2], ARGV[1])
+redis.call('ZREM', KEYS[3], ARGV[1])
+local rate = tonumber(ARGV[2]) / 60000
+if rate > 0 then
+    local tokens = tonumber(redis.call('HGET', KEYS[4], 'tokens'))
+    if tokens then
+        tokens = math.min(rate * 60000, tokens - tonumber(ARGV[3]))
+        if ARGV[4] == '1' then
+            tokens = math.min(tokens, 0)
+        end
+        redis.call('HSET', KEYS[4], 'tokens', tostring(tokens))
+    end
+end
+return redis.call('ZCARD', KEYS[1])
+"""
+
+class ClusterLLMLimiter:
+    def __init__(self, namespace: str = "tona_llm_limiter", max_concurrency: int = LLM_CLUSTER_MAX_CONCURRENCY,
+                 tokens_per_minute: int = LLM_TOKENS_PER_MINUTE, redis_client=None):
+        self.namespace = namespace
+        self.max_concurrency = max_concurrency
+        # aim just under the provider quota so bursts from other workers don't tip it over
+        self.tokens_per_minute = int(tokens_per_minute * LLM_QUOTA_HEADROOM)
+        self.redis_client = redis_client
+        self.keys = [f"{namespace}:{suffix}" for suffix in ("leases", "queue", "heartbeats", "ticket", "tokens")]
+        self.admitted = 0
+        self.timed_out = 0
+        self.redis_errors = 0
+        self.total_wait_seconds = 0.0
+        self._scripts = None
+        self._script_client = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.redis_client) and (self.max_concurrency > 0 or self.tokens_per_minute > 0)
+
+    def _redis_scripts(self):
+        if self._scripts is None or self._script_client is not self.redis_client:
+            self._scripts = (
+                self.redis_client.register_script(ACQUIRE_SCRIPT),
+                self.redis_client.register_script(RELEASE_SCRIPT)
+            )
+            self._script_client = self.redis_client
+        return self._scripts
+
+    def _publish(self, held: int, waiting: int, tokens: float):
+        LLM_CLUSTER_SLOTS.labels("held").set(held)
+        LLM_CLUSTER_SLOTS.labels("waiting").set(waiting)
+        if self.tokens_per_minute > 0:
+            LLM_CLUSTER_TOKENS.set(tokens)
+
+    async def acquire(self, token_estimate: int, timeout: Optional[float] = None) -> Optional[str]:
+        if not self.enabled:
+            return None
+
+        lease_id = uuid.uuid4().hex
+        timeout = LLM_LIMITER_MAX_WAIT_SECONDS if timeout is None else min(timeout, LLM_LIMITER_MAX_WAIT_SECONDS)
+        started = time.monotonic()
+        deadline = started + timeout
+        acquire_script, _ = self._redis_scripts()
+        args = [
+            lease_id, self.max_concurrency, int(LLM_LIMITER_LEASE_SECONDS * 1000),
+            int(max(5.0, LLM_LIMITER_POLL_SECONDS * 20) * 1000), self.tokens_per_minute, token_estimate
+        ]
+        try:
+            while True:
+                admitted, _, held, waiting, tokens, wait_ms = await acquire_script(keys=self.keys, args=args)
+                self._publish(held, waiting, float(tokens))
+                if admitted:
+                    self.admitted += 1
+                    self.total_wait_seconds += time.monotonic() - started
+                    return lease_id
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.timed_out += 1
+                    await self._release(lease_id, 0)
+                    raise asyncio.TimeoutError()
+                # jitter keeps workers from polling Redis in lockstep; the refill wait is capped
+                # because finishing calls refund unused reservations well before the bucket refills
+                poll = LLM_LIMITER_POLL_SECONDS * random.uniform(0.5, 1.5)
+                await asyncio.sleep(min(remaining, max(poll, min(wait_ms / 1000, LLM_LIMITER_POLL_SECONDS * 4))))
+        except asyncio.CancelledError:
+            await asyncio.shield(self._release(lease_id, 0))
+            raise
+        except asyncio.TimeoutError:
+            raise
+        except Exception as e:
+            # fail open: the per-process semaphore in LLMClient still bounds concurrency
+            self.redis_errors += 1
+            logger.error(f"Error acquiring cluster LLM slot: {e}")
+            return None
+
+    async def _release(self, lease_id: str, token_adjustment: int, drain: bool = False):
+        _, release_script = self._redis_scripts()
+        try:
+            await release_script(
+                keys=[self.keys[0], self.keys[1], self.keys[2], self.keys[4]],
+                args=[lease_id, self.tokens_per_minute, token_adjustment, 1 if drain else 0]
+            )
+        except Exception as e:
+            self.redis_errors += 1
+            logger.error(f"Error releasing cluster LLM slot: {e}")
+
+    async def release(self, lease_id: Optional[str], token_estimate: int, tokens_used: Optional[int] = None,
+                      drain: bool = False):
+        if lease_id is None or not self.redis_client:
+            return
+        # without usage (failed call) the estimate stays charged
+        adjustment = tokens_used - token_estimate if tokens_used is not None else 0
+        # shielded so a cancelled request still hands its slot back instead of waiting out the lease
+        await asyncio.shield(self._release(lease_id, adjustment, drain))
+
+    async def get_stats(self) -> Dict[str, Any]:
+        stats: Dict[str, Any] = {
+            "enabled": self.enabled,
+            "max_concurrency": self.max_concurrency,
+            "tokens_per_minute": self.tokens_per_minute,
+            "admitted": self.admitted,
+            "timed_out": self.timed_out,
+            "redis_errors": self.redis_errors,
+            "avg_wait_seconds": round(self.total_wait_seconds / self.admitted, 3) if self.admitted else 0.0
+        }
+        if not self.enabled:
+            return stats
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.zcard(self.keys[0])
+            pipe.zcard(self.keys[1])
+            pipe.hget(self.keys[4], "tokens")
+            held, waiting, tokens = await pipe.execute()
+            stats["held"] = held
+            stats["waiting"] = waiting
+            stats["utilization"] = round(held / self.max_concurrency, 3) if self.max_concurrency > 0 else None
+            if self.tokens_per_minute > 0:
+                stats["tokens_available"] = round(float(tokens), 1) if tokens is not None else self.tokens_per_minute
+        except Exception as e:
+            logger.error(f"Error reading cluster LLM limiter state: {e}")
+        return stats
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+OPENERS = [
+    "Hey! How's your day going?", "Morning!", "Are you around later?", "Guess what happened today",
+    "Did you see the game last night?", "How did the interview go?", "Heyyy", "Quick question"
+]
+REPLIES = [
+    "Pretty good! Just finished a workout.", "Haha yes, that was wild", "Not bad, busy day at work",
+    "I'm free after 6 if you want to call", "Sounds great! What time?", "Ugh, the deadline got moved up again",
+    "That's awesome 😊", "Can't this weekend, family stuff", "Wait really?? Tell me everything",
+    "Let's do dinner on Friday 🍕", "I think so, will confirm tomorrow", "lol same", "Thanks so much! 🙏",
+    "We should go for a run this weekend! 🏃‍♀️", "How's the new project going?", "Miss you! When are you back home?"
+]
+LONG_MESSAGES = [
+    "So basically the whole team got pulled into a meeting this morning and they announced that the project "
+    "is being restructured, which means half of what we did last month is getting thrown out. I'm honestly "
+    "not sure how I feel about it yet, part of me is relieved because it was a mess, but it also means the "
+    "next few weeks are going to be pretty intense. Anyway, how are things on your side?",
+    "I was thinking about what you said the other day and I think you're right, I've been putting off the "
+    "conversation with my landlord for way too long. The heating has been broken for two weeks and every "
+    "time I bring it up they just say someone will come by. Do you think I should put it in writing?"
+]
+QUERIES = [
+    "What should I reply?", "How do I keep this conversation going?", "Make it sound more casual",
+    "Is this going well?", "Give me a funny response", "How do I suggest meeting up?"
+]
+
+def generate_chat(rng: random.Random, length: int) -> List[Dict[str, Any]]:
+    start = datetime(2024, 1, 15, 9, 0) + timedelta(minutes=rng.randint(0, 600))
+    chat = []
+    is_outgoing = rng.random() < 0.5
+    timestamp = start
+    for i in range(length):
+        if i == 0:
+            text = rng.choice(OPENERS)
+        elif rng.random() < 0.05:
+            text = rng.choice(LONG_MESSAGES)
+        else:
+            text = rng.choice(REPLIES)
+        chat.append({
+            "text": text,
+            "timestamp": timestamp.isoformat() + "Z",
+            "isOutgoing": is_outgoing,
+            "sender": "you" if is_outgoing else "them"
+        })
+        timestamp += timedelta(seconds=rng.randint(10, 900))
+        if rng.random() < 0.7:
+            is_outgoing = not is_outgoing
+    return chat
+
+def build_corpus(size: int, min_length: int, max_length: int, seed: int) -> List[List[Dict[str, Any]]]:
+    rng = random.Random(seed)
+    return [generate_chat(rng, rng.randint(min_length, max_length)) for _ in range(size)]
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+LOAD_USERS = 50
+
+def rate_limit_overrides(per_server_rate: float) -> Dict[str, int]:
+    # every request comes from this one IP, so the default per-IP bucket (120/min) would be what gets measured
+    per_minute = math.ceil(per_server_rate * 60 * 1.2)
+    return {
+        "RATE_LIMIT_IP_PER_MINUTE": per_minute,
+        "RATE_LIMIT_IP_BURST": max(30, math.ceil(per_server_rate * 5)),
+        "RATE_LIMIT_USER_PER_MINUTE": max(30, math.ceil(per_minute / LOAD_USERS)),
+        "RATE_LIMIT_USER_BURST": max(10, math.ceil(per_server_rate * 5 / LOAD_USERS))
+    }
+
+class Target:
+    def __init__(self, name: str, url: str, corpus: List[List[Dict[str, Any]]], seed: int, unique: bool = False):
+        self.name = name
+        self.url = url
+        self.corpus = corpus
+        self.unique = unique
+        self.rng = random.Random(seed)
+        self.latencies: List[float] = []
+        self.errors: Dict[str, int] = {}
+        self.rate_limited = 0
+
+    def payload(self, sequence: int) -> Dict[str, Any]:
+        chat = self.rng.choice(self.corpus)
+        if self.unique:
+            # a distinct last message defeats the response caches and request coalescing
+            chat = chat + [{"text": f"ok {sequence}", "timestamp": chat[-1]["timestamp"], "isOutgoing": True, "sender": "you"}]
+        if self.name == "analyze_chat":
+            return {"chat_history": chat, "user_query": self.rng.choice(QUERIES), "user_id": f"load_{sequence % LOAD_USERS}"}
+        return {"chat_history": chat, "user_id": f"load_{sequence % LOAD_USERS}"}
+
+    def report(self, duration: float) -> Dict[str, Any]:
+        latencies = sorted(self.latencies)
+        return {
+            "target": self.name,
+            "completed": len(latencies),
+            "rate_limited": self.rate_limited,
+            "errors": dict(self.errors),
+            "throughput_rps": round(len(latencies) / duration, 2) if duration else 0.0,
+            "latency_ms": {
+                "mean": round(statistics.mean(latencies) * 1000, 1) if latencies else 0.0,
+                "p50": round(percentile(latencies, 50) * 1000, 1),
+                "p95": round(percentile(latencies, 95) * 1000, 1),
+                "p99": round(percentile(latencies, 99) * 1000, 1),
+                "max": round(latencies[-1] * 1000, 1) if latencies else 0.0
+            }
+        }
+
+async def send(http: httpx.AsyncClient, target: Target, sequence: int):
+    started = time.perf_counter()
+    try:
+        response = await http.post(target.url, json=target.payload(sequence))
+        if response.status_code == 200:
+            target.latencies.append(time.perf_counter() - started)
+        elif response.status_code == 429:
+            target.rate_limited += 1
+        else:
+            key = str(response.status_code)
+            target.errors[key] = target.errors.get(key, 0) + 1
+    except httpx.HTTPError as e:
+        key = type(e).__name__
+        target.errors[key] = target.errors.get(key, 0) + 1
+
+async def run_load(targets: List[Target], rate: float, duration: float, timeout: float) -> Dict[str, Any]:
+    # open loop: requests go out on a fixed schedule whether or not earlier ones have finished,
+    # so a slow server shows up as latency instead of silently lowering the offered load
+    interval = 1.0 / rate
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=200)
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as http:
+        tasks = []
+        started = time.perf_counter()
+        sequence = 0
+        while True:
+            scheduled = started + sequence * interval
+            if scheduled - started >= duration:
+                break
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            target = targets[sequence % len(targets)]
+            tasks.append(asyncio.create_task(send(http, target, sequence)))
+            sequence += 1
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+
+    return {
+        "offered_rps": rate,
+        "duration_s": round(elapsed, 2),
+        "requests": sequence,
+        "targets": [target.report(elapsed) for target in targets]
+    }
+
+def print_overrides(overrides: Dict[str, int]):
+    print("Start the servers with these rate limits so the limiter isn't what gets measured:")
+    print("  " + " ".join(f"{name}={value}" for name, value in overrides.items()))
+
+def print_report(report: Dict[str, Any], overrides: Dict[str, int]):
+    print(f"\nOffered {report['offered_rps']} req/s for {report['duration_s']}s ({report['requests']} requests)")
+    print(f"{'target':<16}{'ok':>7}{'429':>7}{'errors':>8}{'rps':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+    for target in report["targets"]:
+        latency = target["latency_ms"]
+        errors = sum(target["errors"].values())
+        print(f"{target['target']:<16}{target['completed']:>7}{target['rate_limited']:>7}{errors:>8}{target['throughput_rps']:>8}"
+              f"{latency['p50']:>9}{latency['p95']:>9}{latency['p99']:>9}{latency['max']:>9}")
+        if target["errors"]:
+            print(f"{'':<16}errors: {target['errors']}")
+    if any(target["rate_limited"] for target in report["targets"]):
+        print("\nSome requests were rejected by the servers' rate limiter (429); latency covers admitted requests only.")
+        print_overrides(overrides)
+
+def parse_args(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Open-loop load test for the Tona servers")
+    parser.add_argument("--main-url", default="http://localhost:8000")
+    parser.add_argument("--stats-url", default="http://localhost:8001")
+    parser.add_argument("--target", choices=["analyze", "stats", "both"], default="both")
+    parser.add_argument("--rate", type=float, default=10.0, help="requests per second across all targets")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds to keep sending")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--corpus-size", type=int, default=200)
+    parser.add_argument("--min-messages", type=int, default=10)
+    parser.add_argument("--max-messages", type=int, default=60)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--unique", action="store_true", help="make every payload distinct so each request reaches the LLM")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    return parser.parse_args(argv)
+
+def main():
+    args = parse_args()
+    corpus = build_corpus(args.corpus_size, args.min_messages, args.max_messages, args.seed)
+
+    targets = []
+    if args.target in ("analyze", "both"):
+        targets.append(Target("analyze_chat", f"{args.main_url}/analyze_chat", corpus, args.seed, args.unique))
+    if args.target in ("stats", "both"):
+        targets.append(Target("generate_stats", f"{args.stats_url}/generate_stats", corpus, args.seed + 1, args.unique))
+
+    overrides = rate_limit_overrides(args.rate / len(targets))
+    print(f"Load testing {', '.join(t.url for t in targets)} at {args.rate} req/s for {args.duration}s")
+    print_overrides(overrides)
+    report = asyncio.run(run_load(targets, args.rate, args.duration, args.timeout))
+    print_report(report, overrides)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.output}")
+
+if __name__ == "__main__":
+    main()
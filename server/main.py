@@ -1,14 +1,13 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
-import openai
+from typing import List, Optional, Dict, Any, FrozenSet, Tuple
 import os
 import json
-import redis
 import re
 from datetime import datetime
 import logging
+import asyncio
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -24,26 +23,56 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Request-ID", "Server-Timing"],
 )
 
-from openai import OpenAI
+from llm_client import LLMClient, LLMUnavailable
+from cache import SingleFlight, TieredCache, content_hash
+from memory_store import MemoryLog
+from redis_pool import REDIS_SHARED_DB, connect_redis
+from deadline import is_degraded, latency_budget, mark_degraded, sub_budget
+from admission import AdmissionController, AdmittedStreamingResponse, admit_or_reject
+from analysis_store import SharedAnalysisStore, chat_fingerprint
+from metrics_engine import RECENT_WINDOW
+from telemetry import FALLBACKS, instrument_app, stage, timed
+from lexicon import LEXICON, topic_hits
+from token_budget import (ANALYSIS_HISTORY_TOKENS, SUMMARY_HISTORY_TOKENS, TONE_HISTORY_TOKENS,
+                          prompt_tokens_used, window_texts)
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+instrument_app(app, "main")
+
+client = LLMClient()
 if not os.getenv("OPENAI_API_KEY"):
     logger.warning("OPENAI_API_KEY not found in environment variables")
 
-redis_client = None
-try:
-    redis_client = redis.Redis(
-        host=os.getenv("REDIS_HOST", "localhost"),
-        port=int(os.getenv("REDIS_PORT", 6379)),
-        db=0,
-        decode_responses=True
-    )
-    redis_client.ping()
-    logger.info("Redis connection established")
-except Exception as e:
-    logger.warning(f"Redis connection failed: {e}. Using in-memory storage.")
+def set_llm_client(llm_client: LLMClient):
+    global client
+    client = llm_client
+
+redis_client = None  # connected in the startup hook
+shared_redis_client = None
+
+tone_cache = TieredCache(
+    "tona_tone_v1",
+    redis_client=redis_client,
+    max_entries=int(os.getenv("TONE_CACHE_MAX_ENTRIES", 1024)),
+    ttl_seconds=float(os.getenv("TONE_CACHE_TTL_SECONDS", 3600))
+)
+
+analysis_flights = SingleFlight()
+
+# shared with the stats server, which publishes local metrics and topics for the same chats
+analysis_store = SharedAnalysisStore()
+
+admission = AdmissionController("main")
+
+user_memory_log = MemoryLog(
+    "tona_user_memory",
+    max_entries=50,
+    ttl_seconds=86400 * 30,
+    local_max_users=int(os.getenv("MEMORY_FALLBACK_MAX_USERS", 1000)),
+    local_max_bytes=int(os.getenv("MEMORY_FALLBACK_MAX_BYTES", 16 * 1024 * 1024))
+)
 
 class ChatMessage(BaseModel):
     text: str
@@ -55,83 +84,68 @@ class AnalysisRequest(BaseModel):
     chat_history: List[ChatMessage]
     user_query: str
     user_id: Optional[str] = "default"
+    single_pass: Optional[bool] = None  # defaults to SINGLE_PASS_ANALYSIS
 
 class AnalysisResponse(BaseModel):
     response: str
     suggestions: List[str]
     conversation_summary: str
     user_tone_analysis: Dict[str, Any]
+    prompt_tokens: Optional[int] = None
+    degraded: bool = False
 
-memory_storage = {}
+SINGLE_PASS_ANALYSIS = os.getenv("SINGLE_PASS_ANALYSIS", "false").lower() == "true"
+STRUCTURED_SUGGESTIONS = os.getenv("STRUCTURED_SUGGESTIONS", "true").lower() == "true"
 
-def get_user_memory(user_id: str) -> List[Dict[str, Any]]:
-    if redis_client:
-        try:
-            memory_data = redis_client.get(f"tona_user_{user_id}")
-            if memory_data:
-                return json.loads(memory_data)
-        except Exception as e:
-            logger.error(f"Error reading from Redis: {e}")
-    
-    return memory_storage.get(user_id, [])
+# the extension gives up after about 10s, so answer with a fallback before that
+ANALYZE_LATENCY_BUDGET_MS = int(os.getenv("ANALYZE_LATENCY_BUDGET_MS", 9000))
+ANALYZE_STREAM_LATENCY_BUDGET_MS = int(os.getenv("ANALYZE_STREAM_LATENCY_BUDGET_MS", 30000))
+TONE_BUDGET_FRACTION = float(os.getenv("TONE_BUDGET_FRACTION", 0.5))
 
-def save_user_memory(user_id: str, memory: List[Dict[str, Any]]):
-    if redis_client:
-        try:
-            redis_client.setex(
-                f"tona_user_{user_id}",
-                86400 * 30,  # 30 days expiration
-                json.dumps(memory)
-            )
-        except Exception as e:
-            logger.error(f"Error writing to Redis: {e}")
-    
-    memory_storage[user_id] = memory
+DEFAULT_TONE_PROFILE = {
+    "formality_level": "medium",
+    "response_length": "short",
+    "emoji_usage": "low",
+    "engagement_style": "reserved",
+    "avg_message_length": 0,
+    "question_rate": 0,
+    "exclamation_rate": 0,
+    "common_phrases": [],
+    "writing_style": "neutral",
+    "greeting_style": "standard",
+    "response_patterns": [],
+    "emotional_expression": "neutral",
+    "conversation_initiative": "reactive",
+    "punctuality_style": "standard",
+    "abbreviation_usage": "low",
+    "capitalization_style": "standard",
+    "sentence_structure": "simple",
+    "vocabulary_complexity": "medium",
+    "cultural_references": "none",
+    "humor_style": "none",
+    "empathy_level": "medium",
+    "assertiveness_level": "medium",
+    "social_distance": "medium",
+    "urgency_expression": "low",
+    "agreement_style": "neutral",
+    "disagreement_style": "neutral",
+    "apology_style": "standard",
+    "gratitude_style": "standard",
+    "compliment_style": "standard",
+    "boundary_setting": "medium"
+}
 
-def analyze_user_tone(messages: List[ChatMessage]) -> Dict[str, Any]:
-    user_messages = [msg for msg in messages if msg.isOutgoing]
-    
-    if not user_messages:
-        return {
-            "formality_level": "medium",
-            "response_length": "short",
-            "emoji_usage": "low",
-            "engagement_style": "reserved",
-            "avg_message_length": 0,
-            "question_rate": 0,
-            "exclamation_rate": 0,
-            "common_phrases": [],
-            "writing_style": "neutral",
-            "greeting_style": "standard",
-            "response_patterns": [],
-            "emotional_expression": "neutral",
-            "conversation_initiative": "reactive",
-            "punctuality_style": "standard",
-            "abbreviation_usage": "low",
-            "capitalization_style": "standard",
-            "sentence_structure": "simple",
-            "vocabulary_complexity": "medium",
-            "cultural_references": "none",
-            "humor_style": "none",
-            "empathy_level": "medium",
-            "assertiveness_level": "medium",
-            "social_distance": "medium",
-            "urgency_expression": "low",
-            "agreement_style": "neutral",
-            "disagreement_style": "neutral",
-            "apology_style": "standard",
-            "gratitude_style": "standard",
-            "compliment_style": "standard",
-            "boundary_setting": "medium"
-        }
-    
-    user_text_samples = [msg.text for msg in user_messages[-20:]]
-    conversation_context = "\n".join([f"Message {i+1}: {text}" for i, text in enumerate(user_text_samples)])
-    
-    tone_analysis_prompt = f"""You are an expert in communication analysis and psychology. Analyze the following WhatsApp messages from a user and provide a detailed assessment of their communication style, tone, and personality traits.
+def tone_samples(messages: List[ChatMessage]) -> List[str]:
+    return window_texts([msg.text for msg in messages if msg.isOutgoing], TONE_HISTORY_TOKENS)
+
+def format_history(messages: List[ChatMessage], budget: int) -> str:
+    window = window_texts([msg.text for msg in messages], budget)
+    recent_messages = messages[len(messages) - len(window):]
+    return "".join(f"{'You' if msg.isOutgoing else 'Them'}: {text}\n" for msg, text in zip(recent_messages, window))
+
+TONE_ANALYSIS_PROMPT = """You are an expert communication analyst. Provide accurate, objective analysis of communication patterns in JSON format.
 
-MESSAGES TO ANALYZE:
-{conversation_context}
+Drawing on communication analysis and psychology, analyze the WhatsApp messages from a user in the next message and provide a detailed assessment of their communication style, tone, and personality traits.
 
 Please analyze the user's communication patterns and provide a JSON response with the following fields:
 
@@ -188,19 +202,48 @@ IMPORTANT GUIDELINES:
 
 Provide your analysis as a valid JSON object with ONLY the structured categories listed above. Do NOT include flat fields at the root level. Be precise and accurate in your assessments."""
 
+def create_tone_messages(user_text_samples: List[str]) -> List[Dict[str, str]]:
+    conversation_context = "\n".join([f"Message {i+1}: {text}" for i, text in enumerate(user_text_samples)])
+    return [
+        {"role": "system", "content": TONE_ANALYSIS_PROMPT},
+        {"role": "user", "content": f"MESSAGES TO ANALYZE:\n{conversation_context}"}
+    ]
+
+def shared_fingerprint(messages: List[ChatMessage]) -> str:
+    return chat_fingerprint([msg.model_dump() for msg in messages[-RECENT_WINDOW:]], len(messages))
+
+async def analyze_user_tone(messages: List[ChatMessage], shared_tone: Optional[Dict[str, Any]] = None,
+                            fingerprint: Optional[str] = None) -> Dict[str, Any]:
+    user_messages = [msg for msg in messages if msg.isOutgoing]
+    
+    if not user_messages:
+        return dict(DEFAULT_TONE_PROFILE)
+    
+    if shared_tone:
+        return {**DEFAULT_TONE_PROFILE, **shared_tone}
+    
+    user_text_samples = tone_samples(messages)
+    
     try:
         if not os.getenv("OPENAI_API_KEY"):
+            FALLBACKS.labels("tone_analysis", "no_api_key").inc()
             return _fallback_tone_analysis(user_messages)
         
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "You are an expert communication analyst. Provide accurate, objective analysis of communication patterns in JSON format."},
-                {"role": "user", "content": tone_analysis_prompt}
-            ],
-            max_tokens=1000,
-            temperature=0.3  # lower temperature for more consistent analysis
-        )
+        cache_key = content_hash(user_text_samples)
+        cached_analysis = await tone_cache.get(cache_key)
+        if cached_analysis is not None:
+            if fingerprint:
+                await analysis_store.publish(fingerprint, tone_profile=cached_analysis)
+            return cached_analysis
+        
+        with sub_budget(TONE_BUDGET_FRACTION):
+            response = await client.chat_completion(
+                model="gpt-4o-mini",
+                call_name="tone_analysis",
+                messages=create_tone_messages(user_text_samples),
+                max_tokens=1000,
+                temperature=0.3  # lower temperature for more consistent analysis
+            )
         
         llm_response = response.choices[0].message.content.strip()
         
@@ -299,40 +342,7 @@ Provide your analysis as a valid JSON object with ONLY the structured categories
                     if field in raw_analysis:
                         tone_analysis[field] = raw_analysis[field]
             
-            required_fields = {
-                "formality_level": "medium",
-                "response_length": "short",
-                "emoji_usage": "low",
-                "engagement_style": "reserved",
-                "avg_message_length": 0,
-                "question_rate": 0,
-                "exclamation_rate": 0,
-                "common_phrases": [],
-                "writing_style": "neutral",
-                "greeting_style": "standard",
-                "response_patterns": [],
-                "emotional_expression": "neutral",
-                "conversation_initiative": "reactive",
-                "punctuality_style": "standard",
-                "abbreviation_usage": "low",
-                "capitalization_style": "standard",
-                "sentence_structure": "simple",
-                "vocabulary_complexity": "medium",
-                "cultural_references": "none",
-                "humor_style": "none",
-                "empathy_level": "medium",
-                "assertiveness_level": "medium",
-                "social_distance": "medium",
-                "urgency_expression": "low",
-                "agreement_style": "neutral",
-                "disagreement_style": "neutral",
-                "apology_style": "standard",
-                "gratitude_style": "standard",
-                "compliment_style": "standard",
-                "boundary_setting": "medium"
-            }
-            
-            for field, default_value in required_fields.items():
+            for field, default_value in DEFAULT_TONE_PROFILE.items():
                 if field not in tone_analysis:
                     tone_analysis[field] = default_value
             
@@ -340,14 +350,25 @@ Provide your analysis as a valid JSON object with ONLY the structured categories
             logger.info(f"Formality level: {tone_analysis.get('formality_level', 'N/A')}")
             logger.info(f"Emoji usage: {tone_analysis.get('emoji_usage', 'N/A')}")
             
+            await tone_cache.set(cache_key, tone_analysis)
+            if fingerprint:
+                await analysis_store.publish(fingerprint, tone_profile=tone_analysis)
+            
             return tone_analysis
             
         else:
             logger.warning("Could not parse JSON from LLM response, using fallback")
+            FALLBACKS.labels("tone_analysis", "unparseable").inc()
             return _fallback_tone_analysis(user_messages)
             
+    except LLMUnavailable as e:
+        logger.warning(f"Tone analysis degraded to heuristics: {e}")
+        FALLBACKS.labels("tone_analysis", "degraded").inc()
+        mark_degraded()
+        return _fallback_tone_analysis(user_messages)
     except Exception as e:
         logger.error(f"Error in LLM tone analysis: {e}")
+        FALLBACKS.labels("tone_analysis", "error").inc()
         return _fallback_tone_analysis(user_messages)
 
 def _fallback_tone_analysis(user_messages: List[ChatMessage]) -> Dict[str, Any]:
@@ -356,12 +377,9 @@ def _fallback_tone_analysis(user_messages: List[ChatMessage]) -> Dict[str, Any]:
     question_count = sum(1 for msg in user_messages if "?" in msg.text)
     exclamation_count = sum(1 for msg in user_messages if "!" in msg.text)
     
-    all_user_text = " ".join([msg.text.lower() for msg in user_messages])
-    formal_words = ["indeed", "furthermore", "consequently", "therefore", "thus", "hence", "moreover"]
-    casual_words = ["yeah", "cool", "awesome", "gonna", "wanna", "gotta", "hey", "hi", "yo"]
-    
-    formal_word_count = sum(1 for word in formal_words if word in all_user_text)
-    casual_word_count = sum(1 for word in casual_words if word in all_user_text)
+    word_hits = LEXICON.scan("\n".join(msg.text for msg in user_messages))
+    formal_word_count = word_hits["formal"]
+    casual_word_count = word_hits["casual"]
     
     formality_level = "formal" if formal_word_count > casual_word_count else "casual" if casual_word_count > formal_word_count else "medium"
     response_length = "long" if avg_length > 12 else "short" if avg_length < 5 else "medium"
@@ -401,26 +419,22 @@ def _fallback_tone_analysis(user_messages: List[ChatMessage]) -> Dict[str, Any]:
         "boundary_setting": "medium"
     }
 
-def generate_chat_summary(messages: List[ChatMessage]) -> str:
+def generate_chat_summary(messages: List[ChatMessage], shared: Optional[Dict[str, Any]] = None) -> str:
     if not messages:
         return "No conversation history available."
+    shared = shared or {}
     
-    recent_messages = messages[-15:]
+    window = window_texts([msg.text for msg in messages], SUMMARY_HISTORY_TOKENS)
+    recent_messages = messages[len(messages) - len(window):]
 
     user_messages = [msg for msg in recent_messages if msg.isOutgoing]
     other_messages = [msg for msg in recent_messages if not msg.isOutgoing]
     
-    all_text = " ".join([msg.text.lower() for msg in recent_messages])
-    topics = []
-    
-    if any(word in all_text for word in ["work", "job", "project", "deadline"]):
-        topics.append("work")
-    if any(word in all_text for word in ["weekend", "plan", "meet", "dinner", "lunch"]):
-        topics.append("social plans")
-    if any(word in all_text for word in ["game", "sport", "match", "team"]):
-        topics.append("sports")
-    if any(word in all_text for word in ["family", "home", "house"]):
-        topics.append("personal life")
+    # the stats server's LLM topic breakdown beats a keyword scan when it has already run
+    if shared.get("topics"):
+        topics = [entry["topic"] for entry in shared["topics"] if isinstance(entry, dict) and entry.get("topic")]
+    else:
+        topics = list(topic_hits("\n".join(window)))
     
     summary = f"Recent conversation with {len(other_messages)} messages from them and {len(user_messages)} from you. "
     if topics:
@@ -433,40 +447,41 @@ def generate_chat_summary(messages: List[ChatMessage]) -> str:
     else:
         summary += "You've maintained a balanced conversation flow."
     
+    their_reply_time = (shared.get("local_metrics") or {}).get("their_avg_response_time")
+    if their_reply_time:
+        summary += f" They usually reply within {their_reply_time}."
+    
     return summary
 
-def create_llm_prompt(messages: List[ChatMessage], user_query: str, user_tone: Dict[str, Any], conversation_summary: str) -> str:
-    conversation_text = ""
-    for msg in messages[-20:]:
-        sender = "You" if msg.isOutgoing else "Them"
-        conversation_text += f"{sender}: {msg.text}\n"
-    
-    tone_change_keywords = [
-        'cool', 'casual', 'formal', 'professional', 'friendly', 'enthusiastic',
-        'serious', 'funny', 'playful', 'romantic', 'flirty', 'business',
-        'tone', 'style', 'sound', 'make it', 'change', 'different'
-    ]
-    
-    is_tone_request = any(keyword in user_query.lower() for keyword in tone_change_keywords)
-    
-    if is_tone_request:
-        tone_instructions = f"""
-IMPORTANT: The user is requesting a specific tone/style change. Adapt your suggestions to match their request.
+ANALYSIS_GUIDANCE = """You are Tona, a helpful AI assistant that provides conversation advice for WhatsApp chats.
 
-User's request: "{user_query}"
+You help users improve their WhatsApp conversations. You have access to a chat history and should provide helpful, personalized advice.
 
-Base communication style analysis:
-- Formality level: {user_tone.get('formality_level', 'medium')}
-- Response length: {user_tone.get('response_length', 'short')}
-- Emoji usage: {user_tone.get('emoji_usage', 'low')}
-- Writing style: {user_tone.get('writing_style', 'balanced')}
-- Emotional expression: {user_tone.get('emotional_expression', 'neutral')}
-- Empathy level: {user_tone.get('empathy_level', 'medium')}
-- Assertiveness level: {user_tone.get('assertiveness_level', 'medium')}
-- Humor style: {user_tone.get('humor_style', 'none')}
-- Social distance: {user_tone.get('social_distance', 'medium')}
+The next message contains a conversation summary, the user's communication style analysis, the recent conversation and the user's question.
+
+MATCHING THE USER'S STYLE:
+- Use their preferred greeting style
+- Match their response length
+- Include emojis if they use them frequently
+- Use their formality level
+- Match their emotional expression
+- Use their empathy level
+- Match their assertiveness level
+- Incorporate their humor style
+- Use their vocabulary complexity
+- Match their sentence structure
+- Use their abbreviation style
+- Incorporate their common phrases and patterns
+- Match their question/exclamation frequency
+- Use their writing style
+- Consider their social distance preferences
+- Match their urgency expression
+- Use their agreement/disagreement styles
+- Incorporate their cultural references if any
+
+The suggestions should sound like they were written by the user themselves, matching their unique communication fingerprint.
 
-ADAPTIVE INSTRUCTIONS:
+WHEN THE USER REQUESTS A SPECIFIC TONE OR STYLE:
 - Prioritize the user's tone/style request over their historical patterns
 - Generate suggestions that match the requested tone/style
 - Keep suggestions authentic and natural
@@ -478,12 +493,59 @@ ADAPTIVE INSTRUCTIONS:
 - If they want to sound "empathetic", show more understanding and care
 - If they want to sound "assertive", be more direct and confident
 - Overall, adapt the suggestions to the user's requests as much as possible.
+
+Please provide a helpful response to their question about the conversation. Focus on giving actionable advice and specific suggestions for how they could respond to the other person in their WhatsApp chat.
+
 """
-    else:
-        tone_instructions = f"""
-Based on the user's comprehensive communication style analysis:
 
-COMMUNICATION METRICS:
+ANALYSIS_SYSTEM_PROMPT = ANALYSIS_GUIDANCE + """Your response should be conversational and helpful, not in JSON format. 
+
+IMPORTANT: 
+- Provide analysis and advice in the main response text (not numbered suggestions)
+- Include 3-4 specific response suggestions that can be copied and pasted directly into WhatsApp
+- Format suggestions as clear, actionable responses without quotes or numbering
+- Avoid analysis text like "This shows..." or "This indicates..." in the suggestions
+- Don't repeat the same text in both the response and suggestions
+- The main response should be analysis/advice, not numbered suggestions
+- ADAPT TO USER REQUESTS: If the user asks for a specific tone or style, prioritize their request over historical patterns
+
+Remember: The suggestions you provide are meant to be copied and pasted into their WhatsApp conversation with the other person. They should sound like the user wrote them themselves."""
+
+# the guidance stays first so both variants share a cacheable prompt prefix
+STRUCTURED_ANALYSIS_SYSTEM_PROMPT = ANALYSIS_GUIDANCE + """Answer with the two fields of the response schema:
+- response: conversational analysis and advice, without numbered suggestions or the suggestion texts
+- suggestions: 3-4 messages that can be copied and pasted directly into WhatsApp, without quotes, numbering or commentary
+- Avoid analysis text like "This shows..." or "This indicates..." in the suggestions
+- ADAPT TO USER REQUESTS: If the user asks for a specific tone or style, prioritize their request over historical patterns
+
+Remember: The suggestions are meant to be copied and pasted into their WhatsApp conversation with the other person. They should sound like the user wrote them themselves."""
+
+ADVICE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "response": {"type": "string"},
+        "suggestions": {"type": "array", "items": {"type": "string"}}
+    },
+    "required": ["response", "suggestions"],
+    "additionalProperties": False
+}
+
+def create_analysis_messages(messages: List[ChatMessage], user_query: str, user_tone: Dict[str, Any], conversation_summary: str,
+                             structured: bool = False) -> List[Dict[str, str]]:
+    conversation_text = format_history(messages, ANALYSIS_HISTORY_TOKENS)
+    
+    is_tone_request = "tone_request" in LEXICON.categories(user_query)
+    
+    if is_tone_request:
+        request_note = f"""IMPORTANT: The user is requesting a specific tone/style change. Adapt your suggestions to match their request.
+
+User's request: "{user_query}"
+
+"""
+    else:
+        request_note = ""
+    
+    style_profile = f"""COMMUNICATION METRICS:
 - Formality level: {user_tone.get('formality_level', 'medium')}
 - Response length: {user_tone.get('response_length', 'short')}
 - Emoji usage: {user_tone.get('emoji_usage', 'low')}
@@ -523,232 +585,589 @@ COMMUNICATION BEHAVIORS:
 
 PATTERNS AND PHRASES:
 - Common phrases: {', '.join(user_tone.get('common_phrases', []))}
-- Response patterns: {', '.join(user_tone.get('response_patterns', []))}
-
-GENERATE SUGGESTIONS THAT MATCH THE USER'S STYLE:
-- Use their preferred greeting style ({user_tone.get('greeting_style', 'standard')})
-- Match their response length ({user_tone.get('response_length', 'short')})
-- Include emojis if they use them frequently ({user_tone.get('emoji_usage', 'low')})
-- Use their formality level ({user_tone.get('formality_level', 'medium')})
-- Match their emotional expression ({user_tone.get('emotional_expression', 'neutral')})
-- Use their empathy level ({user_tone.get('empathy_level', 'medium')})
-- Match their assertiveness level ({user_tone.get('assertiveness_level', 'medium')})
-- Incorporate their humor style ({user_tone.get('humor_style', 'none')})
-- Use their vocabulary complexity ({user_tone.get('vocabulary_complexity', 'medium')})
-- Match their sentence structure ({user_tone.get('sentence_structure', 'simple')})
-- Use their abbreviation style ({user_tone.get('abbreviation_usage', 'low')})
-- Incorporate their common phrases and patterns
-- Match their question/exclamation frequency
-- Use their writing style ({user_tone.get('writing_style', 'balanced')})
-- Consider their social distance preferences ({user_tone.get('social_distance', 'medium')})
-- Match their urgency expression ({user_tone.get('urgency_expression', 'low')})
-- Use their agreement/disagreement styles
-- Incorporate their cultural references if any ({user_tone.get('cultural_references', 'none')})
+- Response patterns: {', '.join(user_tone.get('response_patterns', []))}"""
+    
+    prompt = f"""CONVERSATION SUMMARY:
+{conversation_summary}
 
-The suggestions should sound like they were written by the user themselves, matching their unique communication fingerprint.
-"""
+USER'S COMMUNICATION STYLE:
+{style_profile}
+
+{request_note}RECENT CONVERSATION:
+{conversation_text}
+
+USER'S QUESTION: {user_query}"""
     
-    prompt = f"""You are Tona, an AI assistant that helps users improve their WhatsApp conversations. You have access to a chat history and should provide helpful, personalized advice.
+    return [
+        {"role": "system", "content": STRUCTURED_ANALYSIS_SYSTEM_PROMPT if structured else ANALYSIS_SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+
+TONE_PROFILE_ENUMS = {
+    "formality_level": ["formal", "semi-formal", "casual", "very casual"],
+    "response_length": ["very short", "short", "medium", "long", "very long"],
+    "emoji_usage": ["none", "low", "medium", "high"],
+    "writing_style": ["concise", "detailed", "conversational", "formal", "casual", "enthusiastic", "reserved", "inquisitive", "assertive", "empathetic", "humorous", "professional"],
+    "greeting_style": ["formal", "casual", "friendly", "professional", "enthusiastic", "reserved"],
+    "engagement_style": ["highly engaged", "engaged", "moderately engaged", "reserved", "passive"],
+    "emotional_expression": ["expressive", "moderate", "reserved", "neutral", "minimal"],
+    "conversation_initiative": ["proactive", "balanced", "reactive", "passive"],
+    "abbreviation_usage": ["none", "low", "medium", "high"],
+    "capitalization_style": ["standard", "all caps", "minimal caps", "mixed"],
+    "sentence_structure": ["simple", "complex", "mixed", "fragmented"],
+    "vocabulary_complexity": ["simple", "medium", "advanced", "technical"],
+    "punctuality_style": ["immediate", "quick", "standard", "slow", "delayed"],
+    "cultural_references": ["none", "few", "moderate", "frequent"],
+    "humor_style": ["none", "dry", "playful", "sarcastic", "self-deprecating", "observational"],
+    "empathy_level": ["high", "medium", "low", "minimal"],
+    "assertiveness_level": ["high", "medium", "low", "passive"],
+    "social_distance": ["close", "medium", "formal", "distant"],
+    "urgency_expression": ["high", "medium", "low", "none"],
+    "agreement_style": ["enthusiastic", "polite", "neutral", "reluctant", "avoidant"],
+    "disagreement_style": ["direct", "polite", "avoidant", "passive-aggressive", "diplomatic"],
+    "apology_style": ["immediate", "polite", "reluctant", "detailed", "minimal"],
+    "gratitude_style": ["enthusiastic", "polite", "minimal", "detailed", "none"],
+    "compliment_style": ["enthusiastic", "polite", "minimal", "detailed", "none"],
+    "boundary_setting": ["clear", "moderate", "unclear", "none"]
+}
+
+def _tone_profile_property(field: str) -> Dict[str, Any]:
+    if field in TONE_PROFILE_ENUMS:
+        return {"type": "string", "enum": TONE_PROFILE_ENUMS[field]}
+    if isinstance(DEFAULT_TONE_PROFILE[field], list):
+        return {"type": "array", "items": {"type": "string"}}
+    return {"type": "number"}
+
+SINGLE_PASS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "tone_profile": {
+            "type": "object",
+            "properties": {field: _tone_profile_property(field) for field in DEFAULT_TONE_PROFILE},
+            "required": list(DEFAULT_TONE_PROFILE),
+            "additionalProperties": False
+        },
+        "response": {"type": "string"},
+        "suggestions": {"type": "array", "items": {"type": "string"}}
+    },
+    "required": ["tone_profile", "response", "suggestions"],
+    "additionalProperties": False
+}
+
+SINGLE_PASS_SYSTEM_PROMPT = """You are Tona, an expert communication analyst and conversation coach for WhatsApp chats.
+
+You help users improve their WhatsApp conversations. The next message contains the user's own messages, a conversation summary, the recent conversation and the user's question.
+
+Complete two steps in a single answer:
+
+1. TONE PROFILE: Analyze the user's own messages and fill in every tone_profile field.
+   - avg_message_length is the average words per message; question_rate and exclamation_rate are between 0.0 and 1.0
+   - common_phrases holds 3-5 phrases the user actually uses
+   - response_patterns holds short labels such as "asks_questions", "uses_emojis", "shows_gratitude"
+   - Be objective, look for consistent patterns and account for WhatsApp-specific norms
+
+2. ADVICE: Answer the user's question about the conversation.
+   - response: conversational analysis and advice, without numbered suggestions
+   - suggestions: 3-4 messages that can be pasted directly into WhatsApp, without quotes or numbering
+   - Suggestions must sound like the user wrote them, matching the tone profile from step 1
+   - If the user asks for a specific tone or style, prioritize their request over their historical patterns
+   - Don't repeat the same text in both the response and the suggestions"""
+
+def create_single_pass_messages(messages: List[ChatMessage], user_query: str, conversation_summary: str) -> List[Dict[str, str]]:
+    user_text_samples = tone_samples(messages)
+    user_samples_text = "\n".join([f"Message {i+1}: {text}" for i, text in enumerate(user_text_samples)])
+    
+    conversation_text = format_history(messages, ANALYSIS_HISTORY_TOKENS)
+    
+    prompt = f"""USER'S MESSAGES:
+{user_samples_text or "No messages from the user yet."}
 
 CONVERSATION SUMMARY:
 {conversation_summary}
 
-USER'S COMMUNICATION STYLE:
-{tone_instructions}
-
 RECENT CONVERSATION:
 {conversation_text}
 
-USER'S QUESTION: {user_query}
+USER'S QUESTION: {user_query}"""
+    
+    return [
+        {"role": "system", "content": SINGLE_PASS_SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
 
-Please provide a helpful response to their question about the conversation. Focus on giving actionable advice and specific suggestions for how they could respond to the other person in their WhatsApp chat.
+ENDINGS_TO_REMOVE = [
+    "Feel free to choose one that fits your style!",
+    "Feel free to pick one or mix and match!",
+    "Choose one that feels right for you!",
+    "Pick one that feels right for you!",
+    "Feel free to choose one!",
+    "Choose one that fits your style!",
+    "Feel free to choose any of these or adjust them slightly to match your tone!",
+    "Feel free to choose any of these!",
+    "Choose any of these or adjust them slightly to match your tone!",
+    "Choose one that feels right for the conversation!",
+    "Choose one that feels right!",
+    "These keep the vibe casual and enthusiastic, just like your style!",
+    "These suggestions match your style perfectly!",
+    "These options fit your communication style!",
+    "These suggestions align with your tone!"
+]
 
-Your response should be conversational and helpful, not in JSON format. 
+DEFAULT_SUGGESTIONS = [
+    "That sounds great!",
+    "I'd love to join you",
+    "What time were you thinking?",
+    "Thanks for thinking of me!"
+]
 
-IMPORTANT: 
-- Provide analysis and advice in the main response text (not numbered suggestions)
-- Include 3-4 specific response suggestions that can be copied and pasted directly into WhatsApp
-- Format suggestions as clear, actionable responses without quotes or numbering
-- Avoid analysis text like "This shows..." or "This indicates..." in the suggestions
-- Don't repeat the same text in both the response and suggestions
-- The main response should be analysis/advice, not numbered suggestions
-- ADAPT TO USER REQUESTS: If the user asks for a specific tone or style, prioritize their request over historical patterns
+# one alternation, longest first, so overlapping endings are removed in a single scan
+ENDINGS_PATTERN = re.compile("|".join(re.escape(ending) for ending in sorted(ENDINGS_TO_REMOVE, key=len, reverse=True)))
+NUMBERED_LINE = re.compile(r'^\d+\.\s*')
 
-Remember: The suggestions you provide are meant to be copied and pasted into their WhatsApp conversation with the other person. They should sound like the user wrote them themselves."""
-    
-    return prompt
+DEFAULT_RESPONSE_TEXT = "Based on your conversation style, here are some good response options."
 
-@app.post("/analyze_chat", response_model=AnalysisResponse)
-async def analyze_chat(request: AnalysisRequest):
+def parse_suggestion_line(line: str, in_suggestions_section: bool, line_categories: Optional[FrozenSet[str]] = None):
+    line = line.strip()
+    if line_categories is None:
+        line_categories = LEXICON.categories(line)
     
-    try:
-        user_memory = get_user_memory(request.user_id)
+    if "suggestion_header" in line_categories:
+        return None, True
+        
+    if (in_suggestions_section or line.startswith('•') or line.startswith('-') or line.startswith('*') or 
+        line.startswith('"') or line.startswith("'") or
+        (len(line) > 10 and len(line) < 200 and not line.startswith('You') and not line.startswith('Them'))):
         
-        user_tone = analyze_user_tone(request.chat_history)
+        clean_suggestion = line.lstrip('•-*"\' ')
+        clean_suggestion = NUMBERED_LINE.sub('', clean_suggestion)
+        clean_suggestion = clean_suggestion.strip('"\'')
         
-        conversation_summary = generate_chat_summary(request.chat_history)
+        if clean_suggestion and len(clean_suggestion) > 5 and "analysis_phrase" not in line_categories:
+            return clean_suggestion, in_suggestions_section
+    
+    return None, in_suggestions_section
+
+def streamable_suggestion(line: str, in_suggestions_section: bool):
+    # only a bulleted or numbered line under "Suggestions:" is sure to survive parse_llm_response's
+    # ranking; anything looser waits for the result event
+    line = ENDINGS_PATTERN.sub("", line).strip()
+    suggestion, in_suggestions_section = parse_suggestion_line(line, in_suggestions_section)
+    if not (in_suggestions_section and (line.startswith(('•', '-', '*')) or NUMBERED_LINE.match(line))):
+        return None, in_suggestions_section
+    if suggestion:
+        suggestion = suggestion.strip().strip('"\'')
+        if len(suggestion) <= 5 or len(suggestion) >= 200:
+            suggestion = None
+    return suggestion, in_suggestions_section
+
+def normalize_suggestions(suggestions: List[str]) -> List[str]:
+    normalized = []
+    seen = set()
+    for suggestion in suggestions:
+        suggestion = suggestion.strip().strip('"\'')
+        if suggestion in seen or len(suggestion) <= 5 or len(suggestion) >= 200:
+            continue
+        seen.add(suggestion)
+        normalized.append(suggestion)
+        if len(normalized) == 4:
+            break
+    
+    if not normalized:
+        normalized = list(DEFAULT_SUGGESTIONS)
+    
+    while len(normalized) < 3:
+        normalized.append("That sounds interesting! Tell me more.")
+    
+    return normalized
+
+def parse_llm_response(llm_text: str) -> Tuple[str, List[str]]:
+    text = ENDINGS_PATTERN.sub("", llm_text)
+    
+    # each line is scanned once; candidates are ranked so a "Suggestions:" section beats
+    # bulleted lines, which beat plain sentences that merely look like a message
+    parsed_lines = []
+    candidates: Dict[int, List[str]] = {0: [], 1: [], 2: []}
+    in_suggestions_section = False
+    for line in text.split('\n'):
+        line = line.strip()
+        line_categories = LEXICON.categories(line)
+        suggestion, in_suggestions_section = parse_suggestion_line(line, in_suggestions_section, line_categories)
+        if suggestion:
+            if in_suggestions_section:
+                rank = 2
+            elif line[:1] in '•-*"\'' or NUMBERED_LINE.match(line):
+                rank = 1
+            else:
+                rank = 0
+            candidates[rank].append(suggestion)
+        parsed_lines.append((line, suggestion, "skip_phrase" in line_categories))
+    
+    best = next((candidates[rank] for rank in (2, 1, 0) if candidates[rank]), [])
+    suggestions = normalize_suggestions(best)
+    chosen = set(suggestions)
+    
+    response_lines = [
+        line for line, suggestion, skip in parsed_lines
+        if line and not skip and suggestion not in chosen
+    ]
+    response_text = '\n'.join(response_lines) or DEFAULT_RESPONSE_TEXT
+    
+    return response_text, suggestions
+
+def parse_structured_advice(content: Optional[str]) -> Optional[Tuple[str, List[str]]]:
+    try:
+        result = json.loads(content or "")
+    except json.JSONDecodeError:
+        return None
+    
+    if not isinstance(result, dict) or not isinstance(result.get("suggestions"), list):
+        return None
+    
+    suggestions = normalize_suggestions([s for s in result["suggestions"] if isinstance(s, str)])
+    response_text = str(result.get("response") or "").strip() or DEFAULT_RESPONSE_TEXT
+    return response_text, suggestions
 
-        prompt = create_llm_prompt(
+def fallback_analysis_response(conversation_summary: str, user_tone: Dict[str, Any]) -> AnalysisResponse:
+    return AnalysisResponse(
+        response="I can see you're having a WhatsApp conversation! To get personalized advice, please set up the OpenAI API key in the server configuration.\n\nBased on what I can see, here are some general tips for your conversation:\n\n• Ask follow-up questions to show interest\n• Share your own experiences when relevant\n• Use emojis to match their energy level\n• Be genuine and authentic in your responses",
+        suggestions=[
+            "That sounds great! What time were you thinking?",
+            "I'd love to join you! Who else is coming?",
+            "Thanks for thinking of me! I'll try to make it work.",
+            "That's really interesting! Tell me more about that."
+        ],
+        conversation_summary=conversation_summary,
+        user_tone_analysis=user_tone
+    )
+
+def degraded_analysis_response(conversation_summary: str, user_tone: Dict[str, Any]) -> AnalysisResponse:
+    return AnalysisResponse(
+        response="Tona is taking longer than usual right now, so here are some quick ideas based on your conversation style. Try again in a moment for personalized advice.",
+        suggestions=list(DEFAULT_SUGGESTIONS),
+        conversation_summary=conversation_summary,
+        user_tone_analysis=user_tone,
+        degraded=True
+    )
+
+async def load_shared_analysis(messages: List[ChatMessage]) -> Tuple[str, Dict[str, Any]]:
+    with stage("analysis.shared"):
+        fingerprint = shared_fingerprint(messages)
+        return fingerprint, await analysis_store.get(fingerprint)
+
+async def prepare_analysis(request: AnalysisRequest, structured: bool = False):
+    fingerprint, shared = await load_shared_analysis(request.chat_history)
+    tone_task = asyncio.create_task(timed(
+        "analysis.tone", analyze_user_tone(request.chat_history, shared.get("tone_profile"), fingerprint)
+    ))
+    
+    with stage("analysis.summary"):
+        conversation_summary = await asyncio.to_thread(generate_chat_summary, request.chat_history, shared)
+    
+    user_tone = await tone_task
+
+    with stage("analysis.prompt"):
+        llm_messages = create_analysis_messages(
             request.chat_history,
             request.user_query,
             user_tone,
-            conversation_summary
+            conversation_summary,
+            structured=structured
         )
-        
-        if not os.getenv("OPENAI_API_KEY"):
-            return AnalysisResponse(
-                response="I can see you're having a WhatsApp conversation! To get personalized advice, please set up the OpenAI API key in the server configuration.\n\nBased on what I can see, here are some general tips for your conversation:\n\n• Ask follow-up questions to show interest\n• Share your own experiences when relevant\n• Use emojis to match their energy level\n• Be genuine and authentic in your responses",
-                suggestions=[
-                    "That sounds great! What time were you thinking?",
-                    "I'd love to join you! Who else is coming?",
-                    "Thanks for thinking of me! I'll try to make it work.",
-                    "That's really interesting! Tell me more about that."
-                ],
-                conversation_summary=conversation_summary,
-                user_tone_analysis=user_tone
-            )
-        
-        response = client.chat.completions.create(
+    
+    return user_tone, conversation_summary, llm_messages
+
+def build_analysis(llm_text: str, user_tone: Dict[str, Any], conversation_summary: str,
+                   prompt_tokens: Optional[int] = None) -> AnalysisResponse:
+    with stage("analysis.parse"):
+        cleaned_response, suggestions = parse_llm_response(llm_text)
+    
+    return AnalysisResponse(
+        response=cleaned_response,
+        suggestions=suggestions,
+        conversation_summary=conversation_summary,
+        user_tone_analysis=user_tone,
+        prompt_tokens=prompt_tokens
+    )
+
+async def record_analysis(request: AnalysisRequest, analysis: AnalysisResponse):
+    memory_entry = {
+        "timestamp": datetime.now().isoformat(),
+        "query": request.user_query,
+        "response": {
+            "response": analysis.response,
+            "suggestions": analysis.suggestions
+        },
+        "user_tone": analysis.user_tone_analysis,
+        "conversation_summary": analysis.conversation_summary
+    }
+    
+    with stage("analysis.memory_save"):
+        await user_memory_log.append(request.user_id, memory_entry)
+
+async def analyze_chat_single_pass(request: AnalysisRequest) -> Optional[AnalysisResponse]:
+    fingerprint, shared = await load_shared_analysis(request.chat_history)
+    with stage("analysis.summary"):
+        conversation_summary = await asyncio.to_thread(generate_chat_summary, request.chat_history, shared)
+    
+    with stage("analysis.prompt"):
+        llm_messages = create_single_pass_messages(request.chat_history, request.user_query, conversation_summary)
+    response = await client.chat_completion(
+        call_name="single_pass",
+        model="gpt-4o-mini",
+        messages=llm_messages,
+        max_tokens=1500,
+        temperature=0.5,
+        response_format={
+            "type": "json_schema",
+            "json_schema": {"name": "tona_analysis", "strict": True, "schema": SINGLE_PASS_SCHEMA}
+        }
+    )
+    
+    message = response.choices[0].message
+    if getattr(message, "refusal", None) or not message.content:
+        logger.warning("Single-pass analysis returned no content, using two-step analysis")
+        FALLBACKS.labels("single_pass", "no_content").inc()
+        return None
+    
+    try:
+        result = json.loads(message.content)
+    except json.JSONDecodeError:
+        logger.warning("Could not parse single-pass analysis, using two-step analysis")
+        FALLBACKS.labels("single_pass", "json_decode").inc()
+        return None
+    
+    if (not isinstance(result, dict) or not isinstance(result.get("response"), str)
+            or not isinstance(result.get("tone_profile"), dict) or not isinstance(result.get("suggestions"), list)
+            or not all(isinstance(s, str) for s in result["suggestions"])):
+        logger.warning("Single-pass analysis did not match the schema, using two-step analysis")
+        FALLBACKS.labels("single_pass", "schema_mismatch").inc()
+        return None
+    
+    user_tone = {**DEFAULT_TONE_PROFILE, **result["tone_profile"]}
+    
+    user_text_samples = tone_samples(request.chat_history)
+    if user_text_samples:
+        await tone_cache.set(content_hash(user_text_samples), user_tone)
+        await analysis_store.publish(fingerprint, tone_profile=user_tone)
+    
+    suggestions = normalize_suggestions(result["suggestions"])
+    cleaned_response = result["response"].strip() or DEFAULT_RESPONSE_TEXT
+    
+    return AnalysisResponse(
+        response=cleaned_response,
+        suggestions=suggestions,
+        conversation_summary=conversation_summary,
+        user_tone_analysis=user_tone,
+        prompt_tokens=prompt_tokens_used(response, llm_messages)
+    )
+
+async def compute_analysis(request: AnalysisRequest) -> Tuple[AnalysisResponse, bool]:
+    analysis, should_record = await run_analysis(request)
+    if is_degraded() and not analysis.degraded:
+        analysis = analysis.model_copy(update={"degraded": True})
+    return analysis, should_record
+
+async def run_analysis(request: AnalysisRequest) -> Tuple[AnalysisResponse, bool]:
+    single_pass = request.single_pass if request.single_pass is not None else SINGLE_PASS_ANALYSIS
+    if single_pass and os.getenv("OPENAI_API_KEY"):
+        try:
+            single_pass_response = await analyze_chat_single_pass(request)
+        except LLMUnavailable as e:
+            logger.warning(f"Single-pass analysis unavailable, using two-step analysis: {e}")
+            single_pass_response = None
+        if single_pass_response is not None:
+            return single_pass_response, True
+    
+    user_tone, conversation_summary, llm_messages = await prepare_analysis(request, structured=STRUCTURED_SUGGESTIONS)
+    
+    if not os.getenv("OPENAI_API_KEY"):
+        FALLBACKS.labels("analysis", "no_api_key").inc()
+        return fallback_analysis_response(conversation_summary, user_tone), False
+    
+    completion_options = {}
+    if STRUCTURED_SUGGESTIONS:
+        completion_options["response_format"] = {
+            "type": "json_schema",
+            "json_schema": {"name": "tona_advice", "strict": True, "schema": ADVICE_SCHEMA}
+        }
+    
+    try:
+        response = await client.chat_completion(
+            call_name="analysis",
             model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "You are Tona, a helpful AI assistant that provides conversation advice for WhatsApp chats. Respond conversationally and naturally, not in JSON format."},
-                {"role": "user", "content": prompt}
-            ],
+            messages=llm_messages,
             max_tokens=800,
-            temperature=0.7
+            temperature=0.7,
+            **completion_options
         )
+    except LLMUnavailable as e:
+        logger.warning(f"Analysis degraded to fallback suggestions: {e}")
+        FALLBACKS.labels("analysis", "degraded").inc()
+        mark_degraded()
+        return degraded_analysis_response(conversation_summary, user_tone), False
+    
+    llm_text = response.choices[0].message.content or ""
+    prompt_tokens = prompt_tokens_used(response, llm_messages)
+    
+    with stage("analysis.parse"):
+        structured = parse_structured_advice(llm_text) if STRUCTURED_SUGGESTIONS else None
+    if structured is None:
+        if STRUCTURED_SUGGESTIONS:
+            logger.warning("Structured suggestions were not valid JSON, parsing the free-text response")
+            FALLBACKS.labels("analysis", "unstructured_response").inc()
+        return build_analysis(llm_text, user_tone, conversation_summary, prompt_tokens), True
+    
+    cleaned_response, suggestions = structured
+    return AnalysisResponse(
+        response=cleaned_response,
+        suggestions=suggestions,
+        conversation_summary=conversation_summary,
+        user_tone_analysis=user_tone,
+        prompt_tokens=prompt_tokens
+    ), True
+
+def request_fingerprint(request: BaseModel) -> str:
+    # user_id only decides where memory is written, so it is left out of the coalescing key
+    return content_hash([json.dumps(request.model_dump(exclude={"user_id"}), sort_keys=True)])
+
+@app.post("/analyze_chat", response_model=AnalysisResponse)
+async def analyze_chat(request: AnalysisRequest, http_request: Request, x_deadline_ms: Optional[str] = Header(None)):
+    
+    try:
+        with latency_budget(x_deadline_ms, ANALYZE_LATENCY_BUDGET_MS):
+            admitted_at = await admit_or_reject(admission, request.user_id, http_request)
+            try:
+                analysis, should_record = await analysis_flights.do(
+                    request_fingerprint(request),
+                    lambda: compute_analysis(request)
+                )
+            finally:
+                admission.release(admitted_at)
         
-        llm_text = response.choices[0].message.content
-        
-        suggestions = []
-        lines = llm_text.split('\n')
-        in_suggestions_section = False
-        
-        for line in lines:
-            line = line.strip()
-            
-            if any(keyword in line.lower() for keyword in ['suggestions:', 'responses:', 'options:', 'you could say:', 'try saying:']):
-                in_suggestions_section = True
-                continue
-                
-            if (in_suggestions_section or line.startswith('•') or line.startswith('-') or line.startswith('*') or 
-                line.startswith('"') or line.startswith("'") or
-                (len(line) > 10 and len(line) < 200 and not line.startswith('You') and not line.startswith('Them'))):
-                
-                clean_suggestion = line.lstrip('•-*"\' ')
-                clean_suggestion = re.sub(r'^\d+\.\s*', '', clean_suggestion)
-                clean_suggestion = clean_suggestion.strip('"\'')
-                
-                if (clean_suggestion and len(clean_suggestion) > 5 and 
-                    not any(analysis_word in clean_suggestion.lower() for analysis_word in 
-                    ['analysis', 'insight', 'observation', 'assessment', 'evaluation', 'conclusion', 'summary', 
-                     'here are', 'here is', 'some good', 'good responses', 'you could send', 'feel free', 'choose one',
-                     'pick one', 'mix and match', 'options', 'suggestions', 'responses', 'fits your style', 'that fits',
-                     'based on', 'consider', 'might want', 'could try', 'you can', 'this shows', 'this indicates'])):
-                    suggestions.append(clean_suggestion)
-        
-        seen = set()
-        unique_suggestions = []
-        for suggestion in suggestions:
-            if suggestion not in seen:
-                seen.add(suggestion)
-                unique_suggestions.append(suggestion)
-        
-        suggestions = unique_suggestions
-        
-        if not suggestions:
-            suggestions = [
-                "That sounds great!",
-                "I'd love to join you",
-                "What time were you thinking?",
-                "Thanks for thinking of me!"
-            ]
-        
-        suggestions = [s for s in suggestions[:4] if s and len(s) > 5 and len(s) < 200]
-        
-        while len(suggestions) < 3:
-            suggestions.append("That sounds interesting! Tell me more.")
-        
-        cleaned_response = llm_text
-        
-        endings_to_remove = [
-            "Feel free to choose one that fits your style!",
-            "Feel free to pick one or mix and match!",
-            "Choose one that feels right for you!",
-            "Pick one that feels right for you!",
-            "Feel free to choose one!",
-            "Choose one that fits your style!",
-            "Feel free to choose any of these or adjust them slightly to match your tone!",
-            "Feel free to choose any of these!",
-            "Choose any of these or adjust them slightly to match your tone!",
-            "Choose one that feels right for the conversation!",
-            "Choose one that feels right!",
-            "These keep the vibe casual and enthusiastic, just like your style!",
-            "These suggestions match your style perfectly!",
-            "These options fit your communication style!",
-            "These suggestions align with your tone!"
-        ]
-        
-        for ending in endings_to_remove:
-            cleaned_response = cleaned_response.replace(ending, "")
-        
-        lines = cleaned_response.split('\n')
-        cleaned_lines = []
-        for line in lines:
-            line = line.strip()
-            if not any(skip_phrase in line.lower() for skip_phrase in [
-                'suggestions:', 'responses:', 'options:', 'you could say:', 'try saying:',
-                'here are a few', 'here are some', 'feel free to', 'choose one', 'pick one'
-            ]) and not any(suggestion.strip() in line for suggestion in suggestions):
-                cleaned_lines.append(line)
-        
-        cleaned_response = '\n'.join(cleaned_lines)
-        cleaned_response = re.sub(r'\n\s*\n', '\n', cleaned_response)
-        cleaned_response = cleaned_response.strip()
-        
-        if not cleaned_response.strip():
-            cleaned_response = "Based on your conversation style, here are some good response options."
-        
-        cleaned_response = cleaned_response.strip()
-        
-        llm_response = {
-            "response": cleaned_response,
-            "suggestions": suggestions
-        }
-        
-        memory_entry = {
-            "timestamp": datetime.now().isoformat(),
-            "query": request.user_query,
-            "response": llm_response,
-            "user_tone": user_tone,
-            "conversation_summary": conversation_summary
-        }
-        
-        user_memory.append(memory_entry)
-        if len(user_memory) > 50:
-            user_memory = user_memory[-50:]
-        
-        save_user_memory(request.user_id, user_memory)
+        if should_record:
+            await record_analysis(request, analysis)
         
-        return AnalysisResponse(
-            response=llm_response.get("response", "I'm here to help with your WhatsApp conversation! Ask me anything about how to respond or improve your communication."),
-            suggestions=llm_response.get("suggestions", ["That sounds great!", "I'd love to join you!", "Thanks for thinking of me!", "Tell me more about that!"]),
-            conversation_summary=conversation_summary,
-            user_tone_analysis=user_tone
-        )
+        return analysis
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in analyze_chat: {e}")
         raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
 
+def sse_event(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/analyze_chat/stream")
+async def analyze_chat_stream(request: AnalysisRequest, http_request: Request, x_deadline_ms: Optional[str] = Header(None)):
+    # admitted before the response starts so a rejection is still a plain 429
+    admitted_at = await admit_or_reject(admission, request.user_id, http_request)
+    
+    async def event_stream():
+        try:
+            with latency_budget(x_deadline_ms, ANALYZE_STREAM_LATENCY_BUDGET_MS):
+                user_tone, conversation_summary, llm_messages = await prepare_analysis(request)
+                
+                if not os.getenv("OPENAI_API_KEY"):
+                    yield sse_event("result", fallback_analysis_response(conversation_summary, user_tone).model_dump())
+                    return
+                
+                chunks = []
+                pending_line = ""
+                in_suggestions_section = False
+                streamed_suggestions = set()
+                usage_chunks = []
+                
+                try:
+                    async for token in client.stream_chat_completion(
+                        call_name="analysis_stream",
+                        on_usage=usage_chunks.append,
+                        model="gpt-4o-mini",
+                        messages=llm_messages,
+                        max_tokens=800,
+                        temperature=0.7
+                    ):
+                        chunks.append(token)
+                        yield sse_event("token", {"text": token})
+                        
+                        pending_line += token
+                        while '\n' in pending_line:
+                            line, pending_line = pending_line.split('\n', 1)
+                            suggestion, in_suggestions_section = streamable_suggestion(line, in_suggestions_section)
+                            if suggestion and suggestion not in streamed_suggestions and len(streamed_suggestions) < 4:
+                                streamed_suggestions.add(suggestion)
+                                yield sse_event("suggestion", {"text": suggestion})
+                except LLMUnavailable as e:
+                    logger.warning(f"Streaming analysis degraded: {e}")
+                    FALLBACKS.labels("analysis_stream", "degraded").inc()
+                    mark_degraded()
+                    if not chunks:
+                        yield sse_event("result", degraded_analysis_response(conversation_summary, user_tone).model_dump())
+                        return
+                
+                # a stream cut short by the budget still yields whatever suggestions it produced
+                final_response = build_analysis(
+                    "".join(chunks), user_tone, conversation_summary,
+                    prompt_tokens_used(usage_chunks[-1] if usage_chunks else None, llm_messages)
+                ).model_copy(update={"degraded": is_degraded()})
+                await record_analysis(request, final_response)
+                yield sse_event("result", final_response.model_dump())
+            
+        except Exception as e:
+            logger.error(f"Error in analyze_chat_stream: {e}")
+            yield sse_event("error", {"detail": f"Analysis failed: {str(e)}"})
+    
+    return AdmittedStreamingResponse(
+        event_stream(),
+        admission,
+        admitted_at,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.on_event("startup")
+async def startup():
+    global redis_client, shared_redis_client
+    redis_client = await connect_redis(db=0)
+    shared_redis_client = await connect_redis(db=REDIS_SHARED_DB)
+    client.limiter.redis_client = shared_redis_client
+    analysis_store.redis_client = shared_redis_client
+    tone_cache.redis_client = redis_client
+    admission.set_redis(redis_client)
+    user_memory_log.redis_client = redis_client
+
+@app.on_event("shutdown")
+async def shutdown():
+    await client.close()
+    if redis_client:
+        await redis_client.aclose()
+    if shared_redis_client:
+        await shared_redis_client.aclose()
+
 @app.get("/health")
 async def health_check():
     return {"status": "healthy", "timestamp": datetime.now().isoformat()}
 
+@app.get("/cache_stats")
+async def cache_stats():
+    return {
+        "llm_usage": client.get_usage_stats(),
+        "tone_cache": tone_cache.get_stats(),
+        "memory_fallback": user_memory_log.get_stats(),
+        "analysis_flights": analysis_flights.get_stats(),
+        "llm_breaker": client.breaker.get_stats(),
+        "llm_limiter": await client.limiter.get_stats(),
+        "analysis_store": analysis_store.get_stats(),
+        "admission": admission.get_stats()
+    }
+
 @app.get("/user_memory/{user_id}")
-async def get_memory(user_id: str):
-    memory = get_user_memory(user_id)
-    return {"user_id": user_id, "memory_entries": len(memory), "memory": memory}
+async def get_memory(user_id: str, offset: int = Query(0, ge=0), limit: int = Query(50, ge=1, le=500)):
+    memory_entries, memory = await asyncio.gather(
+        user_memory_log.count(user_id),
+        user_memory_log.read(user_id, offset, limit)
+    )
+    return {"user_id": user_id, "memory_entries": memory_entries, "offset": offset, "limit": limit, "memory": memory}
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,62 @@
+import json
+import logging
+from typing import Any, Dict, List, Optional
+
+from cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+class MemoryLog:
+    def __init__(self, prefix: str, redis_client=None, max_entries: int = 50, ttl_seconds: int = 86400 * 30,
+                 local_max_users: int = 1000, local_max_bytes: int = 16 * 1024 * 1024):
+        self.prefix = prefix
+        self.redis_client = redis_client
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # fallback when Redis is down; holds serialized entries so the byte budget is cheap to track
+        self._local = LRUCache(local_max_users, ttl_seconds, max_bytes=local_max_bytes,
+                               sizeof=lambda entries: sum(len(entry) for entry in entries))
+
+    def _redis_key(self, user_id: str) -> str:
+        return f"{self.prefix}:{user_id}"
+
+    async def append(self, user_id: str, entry: Dict[str, Any]):
+        if self.redis_client:
+            try:
+                key = self._redis_key(user_id)
+                async with self.redis_client.pipeline(transaction=True) as pipe:
+                    pipe.rpush(key, json.dumps(entry))
+                    pipe.ltrim(key, -self.max_entries, -1)
+                    pipe.expire(key, self.ttl_seconds)
+                    await pipe.execute()
+                return
+            except Exception as e:
+                logger.error(f"Error writing memory to Redis: {e}")
+
+        entries = self._local.get(user_id) or []
+        self._local.set(user_id, (entries + [json.dumps(entry)])[-self.max_entries:])
+
+    async def read(self, user_id: str, offset: int = 0, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        stop = -1 if limit is None else offset + limit - 1
+        if self.redis_client:
+            try:
+                entries = await self.redis_client.lrange(self._redis_key(user_id), offset, stop)
+                return [json.loads(entry) for entry in entries]
+            except Exception as e:
+                logger.error(f"Error reading memory from Redis: {e}")
+
+        entries = self._local.get(user_id) or []
+        entries = entries[offset:] if limit is None else entries[offset:offset + limit]
+        return [json.loads(entry) for entry in entries]
+
+    async def count(self, user_id: str) -> int:
+        if self.redis_client:
+            try:
+                return await self.redis_client.llen(self._redis_key(user_id))
+            except Exception as e:
+                logger.error(f"Error reading memory length from Redis: {e}")
+
+        return len(self._local.get(user_id) or [])
+
+    def get_stats(self) -> Dict[str, Any]:
+        return self._local.get_stats()
@@ -0,0 +1,215 @@
+import os
+import re
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+# the stats prompt trims this further by token budget
+RECENT_WINDOW = int(os.getenv("STATS_RECENT_WINDOW", 200))
+
+_EMOJI_BASE = (
+    "\U0001F300-\U0001F5FF"  # symbols & pictographs
+    "\U0001F600-\U0001F64F"  # emoticons
+    "\U0001F680-\U0001F6FF"  # transport & map
+    "\U0001F7E0-\U0001F7EB"  # coloured circles and squares
+    "\U0001F900-\U0001F9FF"  # supplemental symbols & pictographs
+    "\U0001FA70-\U0001FAFF"  # symbols & pictographs extended-A
+    "\u2300-\u23FF"  # misc technical (watch, hourglass, alarm clock)
+    "\u2600-\u27BF"  # misc symbols and dingbats
+    "\u2B05-\u2B07\u2B1B\u2B1C\u2B50\u2B55"
+    "\u3030\u303D\u3297\u3299"
+)
+_EMOJI_MODIFIERS = "\uFE0F\U0001F3FB-\U0001F3FF"
+
+EMOJI_PATTERN = re.compile(
+    "[\U0001F1E6-\U0001F1FF]{2}"  # flags
+    "|[0-9#*]\uFE0F?\u20E3"  # keycaps
+    f"|[{_EMOJI_BASE}][{_EMOJI_MODIFIERS}]*"
+    f"(?:\u200D[{_EMOJI_BASE}][{_EMOJI_MODIFIERS}]*)*"  # ZWJ sequences
+)
+
+CLOCK_PATTERN = re.compile(r"(\d{1,2}):(\d{2})(?::\d{2})?(?:\s*([AaPp])\.?\s*[Mm]\.?)?")
+
+SECONDS_PER_DAY = 86400
+
+def count_emojis(text: str) -> int:
+    return len(EMOJI_PATTERN.findall(text))
+
+def parse_timestamp(timestamp: Optional[str]) -> Optional[Tuple[str, float]]:
+    if not timestamp:
+        return None
+    timestamp = timestamp.strip()
+
+    try:
+        return ("absolute", datetime.fromisoformat(timestamp.replace("Z", "+00:00")).timestamp())
+    except ValueError:
+        pass
+
+    match = CLOCK_PATTERN.search(timestamp)
+    if not match:
+        return None
+    hour, minute, meridiem = int(match.group(1)), int(match.group(2)), match.group(3)
+    if minute > 59:
+        return None
+    if meridiem:
+        if not 1 <= hour <= 12:
+            return None
+        hour = hour % 12 + (12 if meridiem.lower() == "p" else 0)
+    elif hour > 23:
+        return None
+    return ("clock", float(hour * 3600 + minute * 60))
+
+def timestamp_gap(previous: Optional[Tuple[str, float]], current: Optional[Tuple[str, float]]) -> Optional[float]:
+    if not previous or not current or previous[0] != current[0]:
+        return None
+    gap = current[1] - previous[1]
+    if current[0] == "clock":
+        # "2:30 PM" style times carry no date, so a negative gap means the reply crossed midnight
+        return gap % SECONDS_PER_DAY
+    return gap if gap >= 0 else None
+
+def format_duration(seconds: float) -> str:
+    if seconds < 60:
+        return "<1m"
+    if seconds < 3600:
+        return f"{round(seconds / 60)}m"
+    return f"{round(seconds / 3600)}h"
+
+def usage_level(rate: float, medium_threshold: float, high_threshold: float) -> str:
+    if rate >= high_threshold:
+        return "High"
+    if rate >= medium_threshold:
+        return "Medium"
+    return "Low"
+
+class ConversationAggregates:
+    VERSION = 2
+
+    def __init__(self):
+        self.version = self.VERSION
+        self.total_messages = 0
+        self.user_messages = 0
+        self.other_messages = 0
+        self.user_words = 0
+        self.other_words = 0
+        self.user_questions = 0
+        self.other_questions = 0
+        self.user_exclamations = 0
+        self.other_exclamations = 0
+        self.user_emojis = 0
+        self.other_emojis = 0
+        self.user_emoji_messages = 0
+        self.other_emoji_messages = 0
+        self.user_response_seconds = 0.0
+        self.user_responses = 0
+        self.other_response_seconds = 0.0
+        self.other_responses = 0
+        self.last_is_outgoing: Optional[bool] = None
+        self.last_timestamp: Optional[str] = None
+        self.recent: List[Dict[str, Any]] = []
+
+    @property
+    def cursor(self) -> int:
+        return self.total_messages
+
+    def add(self, messages: List[Any]):
+        if not messages:
+            return
+
+        texts = [msg.text for msg in messages]
+        outgoing = [msg.isOutgoing for msg in messages]
+        words = [len(text.split()) for text in texts]
+        questions = ["?" in text for text in texts]
+        exclamations = ["!" in text for text in texts]
+        emojis = [count_emojis(text) for text in texts]
+        timestamps = [parse_timestamp(self.last_timestamp)] + [parse_timestamp(msg.timestamp) for msg in messages]
+        previous_outgoing = [self.last_is_outgoing] + outgoing[:-1]
+
+        for i, is_outgoing in enumerate(outgoing):
+            if is_outgoing:
+                self.user_messages += 1
+                self.user_words += words[i]
+                self.user_questions += questions[i]
+                self.user_exclamations += exclamations[i]
+                self.user_emojis += emojis[i]
+                self.user_emoji_messages += emojis[i] > 0
+            else:
+                self.other_messages += 1
+                self.other_words += words[i]
+                self.other_questions += questions[i]
+                self.other_exclamations += exclamations[i]
+                self.other_emojis += emojis[i]
+                self.other_emoji_messages += emojis[i] > 0
+
+            if previous_outgoing[i] is None or previous_outgoing[i] == is_outgoing:
+                continue
+            gap = timestamp_gap(timestamps[i], timestamps[i + 1])
+            if gap is None:
+                continue
+            if is_outgoing:
+                self.user_response_seconds += gap
+                self.user_responses += 1
+            else:
+                self.other_response_seconds += gap
+                self.other_responses += 1
+
+        self.total_messages += len(messages)
+        self.last_is_outgoing = outgoing[-1]
+        self.last_timestamp = messages[-1].timestamp
+        self.recent.extend({
+            "text": msg.text,
+            "timestamp": msg.timestamp,
+            "isOutgoing": msg.isOutgoing,
+            "sender": msg.sender
+        } for msg in messages[-RECENT_WINDOW:])
+        if len(self.recent) > RECENT_WINDOW:
+            self.recent = self.recent[-RECENT_WINDOW:]
+
+    def response_patterns(self) -> Dict[str, Any]:
+        patterns = {}
+        if self.user_messages:
+            patterns["words_per_message"] = round(self.user_words / self.user_messages)
+            patterns["question_rate"] = f"{round(100 * self.user_questions / self.user_messages)}%"
+            patterns["emoji_usage"] = usage_level(self.user_emoji_messages / self.user_messages, 0.1, 0.3)
+        if self.user_responses:
+            patterns["avg_response_time"] = format_duration(self.user_response_seconds / self.user_responses)
+        return patterns
+
+    def conversation_dynamics(self) -> Dict[str, Any]:
+        if not self.total_messages:
+            return {}
+
+        expressive_messages = (self.user_exclamations + self.other_exclamations +
+                               self.user_emoji_messages + self.other_emoji_messages)
+        energy_rate = expressive_messages / self.total_messages
+
+        if self.user_messages and self.other_messages:
+            balance = min(self.user_messages, self.other_messages) / max(self.user_messages, self.other_messages)
+        else:
+            balance = 0.0
+        question_rate = (self.user_questions + self.other_questions) / self.total_messages
+        engagement_score = 0.6 * balance + 0.4 * min(question_rate / 0.3, 1.0)
+
+        return {
+            "energy_balance": usage_level(energy_rate, 0.25, 0.6),
+            "engagement_level": usage_level(engagement_score, 0.35, 0.65)
+        }
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "user_avg_response_time": format_duration(self.user_response_seconds / self.user_responses) if self.user_responses else None,
+            "their_avg_response_time": format_duration(self.other_response_seconds / self.other_responses) if self.other_responses else None,
+            "their_words_per_message": round(self.other_words / self.other_messages) if self.other_messages else 0,
+            "their_question_rate": f"{round(100 * self.other_questions / self.other_messages)}%" if self.other_messages else "0%",
+            "their_emoji_usage": usage_level(self.other_emoji_messages / self.other_messages, 0.1, 0.3) if self.other_messages else "Low"
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(self.__dict__)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> Optional["ConversationAggregates"]:
+        if data.get("version") != cls.VERSION:
+            return None
+        aggregates = cls()
+        aggregates.__dict__.update(data)
+        return aggregates
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from token_budget import estimate_tokens
+
+PROFILES = {
+    "instant": {"latency_ms": 0, "jitter_ms": 0, "tokens_per_second": 0, "error_rate": 0.0},
+    "fast": {"latency_ms": 150, "jitter_ms": 50, "tokens_per_second": 400, "error_rate": 0.0},
+    "realistic": {"latency_ms": 400, "jitter_ms": 200, "tokens_per_second": 80, "error_rate": 0.01},
+    "slow": {"latency_ms": 1500, "jitter_ms": 500, "tokens_per_second": 30, "error_rate": 0.0},
+    "flaky": {"latency_ms": 400, "jitter_ms": 300, "tokens_per_second": 80, "error_rate": 0.1}
+}
+
+# OpenAI only caches prompts of at least 1024 tokens, in 128-token increments
+CACHE_MIN_TOKENS = 1024
+CACHE_INCREMENT = 128
+
+settings: Dict[str, Any] = {
+    **PROFILES[os.getenv("MOCK_LLM_PROFILE", "realistic")],
+    "error_status": int(os.getenv("MOCK_LLM_ERROR_STATUS", 429))
+}
+
+stats = {"requests": 0, "streams": 0, "errors": 0, "in_flight": 0, "max_in_flight": 0}
+seen_prefixes = set()
+
+app = FastAPI(title="Tona Mock LLM Server", version="1.0.0")
+
+TONE_RESPONSE = {
+    "Basic Communication Metrics": {
+        "formality_level": "casual", "response_length": "short", "emoji_usage": "medium",
+        "avg_message_length": 8, "question_rate": 0.3, "exclamation_rate": 0.4
+    },
+    "Communication Style": {
+        "writing_style": "conversational", "greeting_style": "friendly", "engagement_style": "engaged",
+        "emotional_expression": "expressive", "conversation_initiative": "balanced"
+    },
+    "Language Patterns": {
+        "abbreviation_usage": "low", "capitalization_style": "standard", "sentence_structure": "simple",
+        "vocabulary_complexity": "medium", "punctuality_style": "quick"
+    },
+    "Social and Cultural Elements": {
+        "cultural_references": "few", "humor_style": "playful", "empathy_level": "medium",
+        "assertiveness_level": "medium", "social_distance": "close"
+    },
+    "Communication Behaviors": {
+        "urgency_expression": "low", "agreement_style": "enthusiastic", "disagreement_style": "polite",
+        "apology_style": "polite", "gratitude_style": "polite", "compliment_style": "enthusiastic",
+        "boundary_setting": "moderate"
+    },
+    "Patterns and Phrases": {
+        "common_phrases": ["sounds good", "for sure", "haha"],
+        "response_patterns": ["asks_questions", "uses_emojis", "expresses_enthusiasm"]
+    }
+}
+
+STATS_RESPONSE = {
+    "conversation_topics": {"topics": [
+        {"topic": "Social Plans", "percentage": "45%"},
+        {"topic": "Work", "percentage": "30%"},
+        {"topic": "Personal Life", "percentage": "25%"}
+    ]},
+    "communication_style": {"style_points": [
+        "Uses enthusiasm to engage (exclamation marks)",
+        "Asks follow-up questions",
+        "Initiates social activities",
+        "Keeps messages short and friendly",
+        "Responds warmly to plans"
+    ]},
+    "conversation_tips": {"tips": [
+        "Match their energy - they're enthusiastic!",
+        "Ask follow-up questions to show interest",
+        "Suggest a concrete time when making plans",
+        "Share a bit more about your own day",
+        "Use an emoji or two to mirror their tone"
+    ]}
+}
+
+ADVICE_RESPONSE = """They sound keen and relaxed, so a light, friendly reply with a concrete next step will land well.
+
+Suggestions:
+- Sounds great! What time works for you?
+- I'm in! Want to grab food after?
+- Love that idea, count me in 😊
+- Perfect, let's lock in Saturday morning
+
+Feel free to choose one that fits your style!"""
+
+ADVICE_STRUCTURED = {
+    "response": ADVICE_RESPONSE.split("\n")[0],
+    "suggestions": [line[2:] for line in ADVICE_RESPONSE.split("\n") if line.startswith("- ")]
+}
+
+def fill_schema(schema: Dict[str, Any]) -> Any:
+    if "enum" in schema:
+        return schema["enum"][0]
+    schema_type = schema.get("type")
+    if schema_type == "object":
+        return {name: fill_schema(prop) for name, prop in schema.get("properties", {}).items()}
+    if schema_type == "array":
+        return [fill_schema(schema.get("items", {"type": "string"})) for _ in range(3)]
+    if schema_type in ("number", "integer"):
+        return 0.5 if schema_type == "number" else 1
+    if schema_type == "boolean":
+        return True
+    return "Sounds great, what time works for you?"
+
+def completion_text(body: Dict[str, Any]) -> str:
+    response_format = body.get("response_format") or {}
+    if response_format.get("type") == "json_schema":
+        if response_format["json_schema"].get("name") == "tona_advice":
+            return json.dumps(ADVICE_STRUCTURED)
+        return json.dumps(fill_schema(response_format["json_schema"]["schema"]))
+
+    system_prompt = body["messages"][0]["content"] if body.get("messages") else ""
+    if "Return only valid JSON" in system_prompt:
+        return json.dumps(STATS_RESPONSE)
+    if "communication analyst" in system_prompt:
+        return json.dumps(TONE_RESPONSE)
+    return ADVICE_RESPONSE
+
+def usage_for(body: Dict[str, Any], text: str) -> Dict[str, Any]:
+    messages = body.get("messages", [])
+    prompt_tokens = sum(estimate_tokens(message.get("content") or "") for message in messages)
+
+    cached_tokens = 0
+    if messages:
+        prefix = messages[0].get("content") or ""
+        prefix_tokens = estimate_tokens(prefix)
+        prefix_key = hashlib.sha256(prefix.encode("utf-8")).hexdigest()
+        if prefix_tokens >= CACHE_MIN_TOKENS and prefix_key in seen_prefixes:
+            cached_tokens = prefix_tokens // CACHE_INCREMENT * CACHE_INCREMENT
+        seen_prefixes.add(prefix_key)
+
+    completion_tokens = estimate_tokens(text)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        "prompt_tokens_details": {"cached_tokens": cached_tokens}
+    }
+
+def first_token_delay() -> float:
+    latency = settings["latency_ms"] + random.uniform(-settings["jitter_ms"], settings["jitter_ms"])
+    return max(latency, 0) / 1000
+
+def generation_delay(tokens: int) -> float:
+    return tokens / settings["tokens_per_second"] if settings["tokens_per_second"] else 0.0
+
+def error_response() -> JSONResponse:
+    stats["errors"] += 1
+    status = settings["error_status"]
+    headers = {"retry-after": "1"} if status == 429 else {}
+    return JSONResponse(
+        status_code=status,
+        headers=headers,
+        content={"error": {"message": "Injected error from mock LLM server", "type": "mock_error", "code": status}}
+    )
+
+def text_chunks(text: str, size: int = 12) -> List[str]:
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    stats["requests"] += 1
+
+    if random.random() < settings["error_rate"]:
+        await asyncio.sleep(first_token_delay())
+        return error_response()
+
+    completion_id = f"chatcmpl-mock-{uuid.uuid4().hex[:12]}"
+    created = int(time.time())
+    model = body.get("model", "mock")
+    text = completion_text(body)
+    usage = usage_for(body, text)
+
+    stats["in_flight"] += 1
+    stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+
+    if body.get("stream"):
+        stats["streams"] += 1
+        include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+
+        async def event_stream():
+            try:
+                await asyncio.sleep(first_token_delay())
+                for chunk_text in text_chunks(text):
+                    chunk = {
+                        "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                        "choices": [{"index": 0, "delta": {"content": chunk_text}, "finish_reason": None}]
+                    }
+                    yield f"data: {json.dumps(chunk)}\n\n"
+                    await asyncio.sleep(generation_delay(estimate_tokens(chunk_text)))
+                final = {
+                    "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]
+                }
+                yield f"data: {json.dumps(final)}\n\n"
+                if include_usage:
+                    usage_chunk = {
+                        "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                        "choices": [], "usage": usage
+                    }
+                    yield f"data: {json.dumps(usage_chunk)}\n\n"
+                yield "data: [DONE]\n\n"
+            finally:
+                stats["in_flight"] -= 1
+
+        return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+    try:
+        await asyncio.sleep(first_token_delay() + generation_delay(usage["completion_tokens"]))
+    finally:
+        stats["in_flight"] -= 1
+
+    return {
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": created,
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": text, "refusal": None},
+            "finish_reason": "stop"
+        }],
+        "usage": usage
+    }
+
+@app.get("/health")
+async def health_check():
+    return {"status": "healthy", "settings": settings}
+
+@app.get("/mock/stats")
+async def mock_stats():
+    return {**stats, "settings": settings}
+
+def parse_args(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="OpenAI-compatible stand-in for load testing the Tona servers")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--profile", choices=sorted(PROFILES), default=os.getenv("MOCK_LLM_PROFILE", "realistic"))
+    parser.add_argument("--latency-ms", type=float, help="time to first token")
+    parser.add_argument("--jitter-ms", type=float)
+    parser.add_argument("--tokens-per-second", type=float, help="generation rate; 0 returns the whole completion at once")
+    parser.add_argument("--error-rate", type=float, help="fraction of requests answered with --error-status")
+    parser.add_argument("--error-status", type=int, default=settings["error_status"])
+    parser.add_argument("--seed", type=int)
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    import uvicorn
+
+    args = parse_args()
+    settings.update(PROFILES[args.profile])
+    for name in ("latency_ms", "jitter_ms", "tokens_per_second", "error_rate"):
+        if getattr(args, name) is not None:
+            settings[name] = getattr(args, name)
+    settings["error_status"] = args.error_status
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    print(f"Mock LLM server on http://{args.host}:{args.port}/v1 with {settings}")
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
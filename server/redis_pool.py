@@ -0,0 +1,61 @@
+import logging
+import os
+import time
+from typing import Optional
+
+import redis.asyncio as aioredis
+from redis.asyncio.client import Pipeline
+
+from telemetry import REDIS_LATENCY
+
+logger = logging.getLogger(__name__)
+
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", 50))
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", 2))
+REDIS_CONNECT_TIMEOUT = float(os.getenv("REDIS_CONNECT_TIMEOUT", 2))
+REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", 30))
+# state both servers coordinate through; each server keeps its own data in its own db
+REDIS_SHARED_DB = int(os.getenv("REDIS_SHARED_DB", 2))
+
+class TimedPipeline(Pipeline):
+    async def execute(self, raise_on_error: bool = True):
+        started = time.perf_counter()
+        try:
+            return await super().execute(raise_on_error)
+        finally:
+            REDIS_LATENCY.labels("PIPELINE").observe(time.perf_counter() - started)
+
+class TimedRedis(aioredis.Redis):
+    async def execute_command(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            REDIS_LATENCY.labels(str(args[0]).upper()).observe(time.perf_counter() - started)
+
+    def pipeline(self, transaction: bool = True, shard_hint: Optional[str] = None) -> TimedPipeline:
+        return TimedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+def create_redis_client(db: int = 0) -> aioredis.Redis:
+    pool = aioredis.ConnectionPool(
+        host=os.getenv("REDIS_HOST", "localhost"),
+        port=int(os.getenv("REDIS_PORT", 6379)),
+        db=db,
+        max_connections=REDIS_MAX_CONNECTIONS,
+        socket_timeout=REDIS_SOCKET_TIMEOUT,
+        socket_connect_timeout=REDIS_CONNECT_TIMEOUT,
+        health_check_interval=REDIS_HEALTH_CHECK_INTERVAL,
+        decode_responses=True
+    )
+    return TimedRedis.from_pool(pool)
+
+async def connect_redis(db: int = 0) -> Optional[aioredis.Redis]:
+    redis_client = create_redis_client(db)
+    try:
+        await redis_client.ping()
+        logger.info("Redis connection established")
+        return redis_client
+    except Exception as e:
+        logger.warning(f"Redis connection failed: {e}. Using in-memory storage.")
+        await redis_client.aclose()
+        return None
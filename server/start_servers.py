@@ -1,64 +1,207 @@
 #!/usr/bin/env python3
 
+import argparse
+import os
+import shutil
+import signal
 import subprocess
-import time
 import sys
-import os
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
 from pathlib import Path
 
-def start_server(script_name, port, description):
-    try:
-        script_dir = Path(__file__).parent
-        server_path = script_dir / script_name
-        
-        print(f"Starting {description} on port {port}...")
-        
-        process = subprocess.Popen(
-            [sys.executable, str(server_path)],
+SCRIPT_DIR = Path(__file__).parent
+
+class ManagedServer:
+    def __init__(self, name, description, app_path, port, health_paths, workers, host, graceful_timeout):
+        self.name = name
+        self.description = description
+        self.app_path = app_path
+        self.port = port
+        self.health_paths = health_paths
+        self.workers = workers
+        self.host = host
+        self.graceful_timeout = graceful_timeout
+        self.process = None
+        self.started_at = 0.0
+        self.restarts = 0
+        self.metrics_dir = None
+
+    def command(self):
+        return [
+            sys.executable, "-m", "uvicorn", self.app_path,
+            "--host", self.host,
+            "--port", str(self.port),
+            "--workers", str(self.workers),
+            "--timeout-graceful-shutdown", str(self.graceful_timeout)
+        ]
+
+    def environment(self):
+        env = dict(os.environ)
+        if self.workers > 1 and "PROMETHEUS_MULTIPROC_DIR" not in env:
+            # workers share /metrics through files; a fresh directory per start drops series from dead workers
+            self.remove_metrics_dir()
+            self.metrics_dir = tempfile.mkdtemp(prefix=f"tona-metrics-{self.name}-")
+            env["PROMETHEUS_MULTIPROC_DIR"] = self.metrics_dir
+        return env
+
+    def remove_metrics_dir(self):
+        if self.metrics_dir:
+            shutil.rmtree(self.metrics_dir, ignore_errors=True)
+            self.metrics_dir = None
+
+    def start(self):
+        print(f"Starting {self.description} on port {self.port} with {self.workers} worker(s)...")
+        self.process = subprocess.Popen(
+            self.command(),
+            env=self.environment(),
             stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            cwd=script_dir
+            stderr=subprocess.STDOUT,
+            cwd=SCRIPT_DIR,
+            text=True,
+            bufsize=1,
+            # own process group so a terminal Ctrl+C reaches the launcher only and shutdown stays ordered
+            start_new_session=True
+        )
+        self.started_at = time.monotonic()
+        threading.Thread(target=self._forward_logs, args=(self.process,), daemon=True).start()
+
+    def _forward_logs(self, process):
+        for line in process.stdout:
+            sys.stdout.write(f"[{self.name}] {line}")
+            sys.stdout.flush()
+
+    def is_running(self):
+        return self.process is not None and self.process.poll() is None
+
+    def is_healthy(self):
+        for path in self.health_paths:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{self.port}{path}", timeout=2) as response:
+                    if response.status != 200:
+                        return False
+            except (urllib.error.URLError, OSError):
+                return False
+        return True
+
+    def wait_until_healthy(self, timeout):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if not self.is_running():
+                print(f"{self.description} exited during startup (code {self.process.returncode})")
+                return False
+            if self.is_healthy():
+                print(f"{self.description} is healthy at http://localhost:{self.port}")
+                return True
+            time.sleep(0.5)
+        print(f"{self.description} did not become healthy within {timeout}s")
+        return False
+
+    def stop(self):
+        if self.is_running():
+            print(f"Stopping {self.description}...")
+            self.process.send_signal(signal.SIGTERM)
+            try:
+                self.process.wait(timeout=self.graceful_timeout + 5)
+            except subprocess.TimeoutExpired:
+                print(f"{self.description} did not stop in time, killing it")
+                self.process.kill()
+                self.process.wait()
+        self.remove_metrics_dir()
+
+def build_servers(args):
+    if args.combined:
+        return [ManagedServer(
+            "tona", "Tona Servers (AI Assistant + Statistics at /stats)", "asgi:app", args.main_port,
+            ["/health", "/stats/health"], args.main_workers or args.workers, args.host, args.graceful_timeout
+        )]
+    return [
+        ManagedServer(
+            "main", "AI Assistant Server", "main:app", args.main_port,
+            ["/health"], args.main_workers or args.workers, args.host, args.graceful_timeout
+        ),
+        ManagedServer(
+            "stats", "Statistics & Insights Server", "stats_server:app", args.stats_port,
+            ["/health"], args.stats_workers or args.workers, args.host, args.graceful_timeout
         )
-        
-        time.sleep(3)
-        
-        if process.poll() is None:
-            print(f"{description} started successfully on port {port}")
-            return process
-        else:
-            stdout, stderr = process.communicate()
-            print(f"Failed to start {description}")
-            print(f"Error: {stderr.decode()}")
-            return None
-            
-    except Exception as e:
-        print(f"Error starting {description}: {e}")
-        return None
+    ]
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Start and supervise the Tona servers")
+    parser.add_argument("--host", default=os.getenv("TONA_HOST", "0.0.0.0"))
+    parser.add_argument("--main-port", type=int, default=int(os.getenv("TONA_MAIN_PORT", 8000)))
+    parser.add_argument("--stats-port", type=int, default=int(os.getenv("TONA_STATS_PORT", 8001)))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("TONA_WORKERS", 1)),
+                        help="uvicorn worker processes per app")
+    parser.add_argument("--main-workers", type=int, default=None)
+    parser.add_argument("--stats-workers", type=int, default=None)
+    parser.add_argument("--combined", action="store_true",
+                        help="serve both apps from one process, with the stats server mounted at /stats")
+    parser.add_argument("--health-timeout", type=float, default=30.0)
+    parser.add_argument("--graceful-timeout", type=int, default=15)
+    parser.add_argument("--max-restarts", type=int, default=5,
+                        help="restarts allowed per server before giving up; reset after a minute of uptime")
+    parser.add_argument("--no-restart", action="store_true")
+    return parser.parse_args()
 
 def main():
+    args = parse_args()
+    servers = build_servers(args)
+    stopping = threading.Event()
+
+    def request_stop(signum, frame):
+        stopping.set()
+
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+
     print("Starting Tona Servers")
     print("=" * 40)
-    
-    main_server = start_server("main.py", 8000, "AI Assistant Server")
-    stats_server = start_server("stats_server.py", 8001, "Statistics & Insights Server")
-    
-    if main_server and stats_server:
-        print("\nBoth servers started successfully")
-        print("\nServer Information:")
-        print("AI Assistant Server: http://localhost:8000")
-        print("Statistics & Insights Server: http://localhost:8001")
-        
-        try:
-            while True:
-                time.sleep(1)
-        except KeyboardInterrupt:
-            print("\nStopping servers...")
-            main_server.terminate()
-            stats_server.terminate()
-            print("Servers stopped")
-    else:
+
+    for server in servers:
+        server.start()
+    if not all(server.wait_until_healthy(args.health_timeout) for server in servers):
         print("\nFailed to start one or more servers")
+        for server in servers:
+            server.stop()
         sys.exit(1)
 
+    print("\nAll servers are healthy")
+    print("\nServer Information:")
+    for server in servers:
+        print(f"{server.description}: http://localhost:{server.port}")
+
+    exit_code = 0
+    while not stopping.wait(1):
+        for server in servers:
+            if server.is_running():
+                if server.restarts and time.monotonic() - server.started_at > 60:
+                    server.restarts = 0
+                continue
+
+            print(f"{server.description} exited with code {server.process.returncode}")
+            if args.no_restart or server.restarts >= args.max_restarts:
+                print(f"Not restarting {server.description}")
+                stopping.set()
+                exit_code = 1
+                break
+
+            server.restarts += 1
+            backoff = min(2 ** server.restarts, 30)
+            print(f"Restarting {server.description} in {backoff}s (attempt {server.restarts}/{args.max_restarts})")
+            if stopping.wait(backoff):
+                break
+            server.start()
+            server.wait_until_healthy(args.health_timeout)
+
+    print("\nStopping servers...")
+    for server in servers:
+        server.stop()
+    print("Servers stopped")
+    sys.exit(exit_code)
+
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
@@ -1,14 +1,13 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
-import openai
+from pydantic import BaseModel, Field
+from typing import List, Optional, Dict, Any, Callable, Tuple
 import os
 import json
-import redis
-import re
 from datetime import datetime
 import logging
+import asyncio
+import uuid
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -24,26 +23,77 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Request-ID", "Server-Timing"],
 )
 
-from openai import OpenAI
-
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+from llm_client import LLMClient, LLMUnavailable
+from cache import SingleFlight, StaleWhileRevalidateCache, content_hash
+from metrics_engine import ConversationAggregates
+from stats_session import StatsSessionStore
+from memory_store import MemoryLog
+from redis_pool import REDIS_SHARED_DB, connect_redis
+from telemetry import FALLBACKS, current_request_id, instrument_app, stage
+from deadline import latency_budget, mark_degraded
+from admission import (AdmissionController, AdmittedStreamingResponse, QueueFull, admit_or_reject, busy_error,
+                       rate_limit_or_reject)
+from analysis_store import SharedAnalysisStore, chat_fingerprint
+from jobs import JOB_MAX_WAIT_SECONDS, JobPool, JobStore
+from lexicon import topic_hits
+from token_budget import STATS_HISTORY_TOKENS, prompt_tokens_used, window_texts
+
+instrument_app(app, "stats")
+
+client = LLMClient()
 if not os.getenv("OPENAI_API_KEY"):
     logger.warning("OPENAI_API_KEY not found in environment variables")
 
-redis_client = None
-try:
-    redis_client = redis.Redis(
-        host=os.getenv("REDIS_HOST", "localhost"),
-        port=int(os.getenv("REDIS_PORT", 6379)),
-        db=1,
-        decode_responses=True
-    )
-    redis_client.ping()
-    logger.info("Redis connection established for stats server")
-except Exception as e:
-    logger.warning(f"Redis connection failed: {e}. Using in-memory storage.")
+def set_llm_client(llm_client: LLMClient):
+    global client
+    client = llm_client
+
+redis_client = None  # connected in the startup hook
+shared_redis_client = None
+
+stats_cache = StaleWhileRevalidateCache(
+    "tona_stats_result_v2",
+    redis_client=redis_client,
+    max_entries=int(os.getenv("STATS_CACHE_MAX_ENTRIES", 512)),
+    fresh_seconds=float(os.getenv("STATS_CACHE_FRESH_SECONDS", 600)),
+    stale_seconds=float(os.getenv("STATS_CACHE_STALE_SECONDS", 86400))
+)
+
+session_store = StatsSessionStore(
+    redis_client=redis_client,
+    ttl_seconds=int(os.getenv("STATS_SESSION_TTL_SECONDS", 86400)),
+    local_max_sessions=int(os.getenv("SESSION_FALLBACK_MAX_SESSIONS", 1000)),
+    local_max_bytes=int(os.getenv("SESSION_FALLBACK_MAX_BYTES", 32 * 1024 * 1024))
+)
+
+stats_flights = SingleFlight()
+
+# shared with the main server: its tone profile of the user feeds the tips prompt, and it reads
+# the local metrics and topics published here into its conversation summary
+analysis_store = SharedAnalysisStore()
+
+admission = AdmissionController("stats")
+
+STATS_BATCH_MAX_ITEMS = int(os.getenv("STATS_BATCH_MAX_ITEMS", 100))
+
+# the extension aborts stats requests after 10s, so answer with local metrics before that
+STATS_LATENCY_BUDGET_MS = int(os.getenv("STATS_LATENCY_BUDGET_MS", 9000))
+STATS_BATCH_LATENCY_BUDGET_MS = int(os.getenv("STATS_BATCH_LATENCY_BUDGET_MS", 60000))
+STATS_JOB_LATENCY_BUDGET_MS = int(os.getenv("STATS_JOB_LATENCY_BUDGET_MS", 60000))
+STATS_JOB_WORKERS = int(os.getenv("STATS_JOB_WORKERS", 4))
+STATS_JOB_MAX_QUEUED = int(os.getenv("STATS_JOB_MAX_QUEUED", 100))
+
+stats_memory_log = MemoryLog(
+    "tona_stats_memory",
+    max_entries=20,
+    ttl_seconds=86400 * 30,
+    local_max_users=int(os.getenv("MEMORY_FALLBACK_MAX_USERS", 1000)),
+    local_max_bytes=int(os.getenv("MEMORY_FALLBACK_MAX_BYTES", 16 * 1024 * 1024))
+)
+
 class ChatMessage(BaseModel):
     text: str
     timestamp: str
@@ -53,6 +103,8 @@ class ChatMessage(BaseModel):
 class StatsRequest(BaseModel):
     chat_history: List[ChatMessage]
     user_id: Optional[str] = "default"
+    session_id: Optional[str] = None
+    cursor: Optional[int] = None  # when set, chat_history holds only messages after this cursor
 
 class ConversationDynamics(BaseModel):
     energy_balance: str  # "Low", "Medium", "High"
@@ -79,35 +131,35 @@ class StatsResponse(BaseModel):
     conversation_topics: ConversationTopics
     communication_style: CommunicationStyle
     conversation_tips: ConversationTips
+    session_id: Optional[str] = None
+    cursor: Optional[int] = None
+    prompt_tokens: Optional[int] = None
+    degraded: bool = False
+
+class StatsBatchRequest(BaseModel):
+    requests: List[StatsRequest] = Field(..., min_length=1, max_length=STATS_BATCH_MAX_ITEMS)
+
+class StatsJobError(BaseModel):
+    status_code: int
+    detail: Any
+
+class StatsJob(BaseModel):
+    job_id: str
+    status: str  # "queued", "running", "done", "failed"
+    created_at: float
+    updated_at: float
+    request_id: Optional[str] = None
+    result: Optional[StatsResponse] = None
+    error: Optional[StatsJobError] = None
+
+class LocalStatsResponse(BaseModel):
+    conversation_dynamics: ConversationDynamics
+    response_patterns: ResponsePatterns
+    session_id: Optional[str] = None
+    cursor: Optional[int] = None
 
-stats_memory_storage = {}
-
-def get_user_stats_memory(user_id: str) -> List[Dict[str, Any]]:
-    if redis_client:
-        try:
-            memory_data = redis_client.get(f"tona_stats_{user_id}")
-            if memory_data:
-                return json.loads(memory_data)
-        except Exception as e:
-            logger.error(f"Error reading from Redis: {e}")
-    
-    return stats_memory_storage.get(user_id, [])
-
-def save_user_stats_memory(user_id: str, memory: List[Dict[str, Any]]):
-    if redis_client:
-        try:
-            redis_client.setex(
-                f"tona_stats_{user_id}",
-                86400 * 30,  # 30 days expiration
-                json.dumps(memory)
-            )
-        except Exception as e:
-            logger.error(f"Error writing to Redis: {e}")
-    
-    stats_memory_storage[user_id] = memory
-
-def analyze_conversation_metrics(messages: List[ChatMessage]) -> Dict[str, Any]:
-    if not messages:
+def analyze_conversation_metrics(aggregates: ConversationAggregates) -> Dict[str, Any]:
+    if not aggregates.total_messages:
         return {
             "total_messages": 0,
             "user_messages": 0,
@@ -115,69 +167,58 @@ def analyze_conversation_metrics(messages: List[ChatMessage]) -> Dict[str, Any]:
             "conversation_text": ""
         }
     
-    user_messages = [msg for msg in messages if msg.isOutgoing]
-    other_messages = [msg for msg in messages if not msg.isOutgoing]
+    window = window_texts([msg["text"] for msg in aggregates.recent], STATS_HISTORY_TOKENS)
+    recent_messages = aggregates.recent[len(aggregates.recent) - len(window):]
+    conversation_text = "".join(
+        f"{'You' if msg['isOutgoing'] else 'Them'}: {text}\n" for msg, text in zip(recent_messages, window)
+    )
     
-    conversation_text = ""
-    for msg in messages[-50:]:
-        sender = "You" if msg.isOutgoing else "Them"
-        conversation_text += f"{sender}: {msg.text}\n"
+    local_metrics = {
+        **aggregates.conversation_dynamics(),
+        **aggregates.response_patterns(),
+        **aggregates.summary()
+    }
     
     return {
-        "total_messages": len(messages),
-        "user_messages": len(user_messages),
-        "other_messages": len(other_messages),
+        "total_messages": aggregates.total_messages,
+        "user_messages": aggregates.user_messages,
+        "other_messages": aggregates.other_messages,
+        "local_metrics": local_metrics,
         "conversation_text": conversation_text
     }
 
-def create_stats_prompt(messages: List[ChatMessage], metrics: Dict[str, Any]) -> str:
-    
-    conversation_text = metrics.get('conversation_text', '')
-    total_messages = metrics.get('total_messages', 0)
-    user_messages = metrics.get('user_messages', 0)
-    other_messages = metrics.get('other_messages', 0)
+async def ingest_chat_history(request: StatsRequest, persist: bool = True):
+    if request.session_id and request.cursor is not None:
+        aggregates = await session_store.load(request.session_id)
+        if aggregates is None or aggregates.cursor != request.cursor:
+            raise HTTPException(
+                status_code=409,
+                detail="Stats session expired or cursor mismatch; resend the full chat history"
+            )
+        session_id = request.session_id
+    else:
+        aggregates = ConversationAggregates()
+        session_id = request.session_id or uuid.uuid4().hex
     
-    prompt = f"""You are Tona, an expert AI assistant that analyzes WhatsApp conversations and provides comprehensive insights. Your task is to analyze the conversation below and generate detailed statistics and insights.
+    aggregates.add(request.chat_history)
+    if persist:
+        await session_store.save(session_id, aggregates)
+    return session_id, aggregates
 
-CONVERSATION DATA:
-- Total Messages: {total_messages}
-- Your Messages: {user_messages}
-- Their Messages: {other_messages}
+STATS_SYSTEM_PROMPT = """You are Tona, an AI assistant that analyzes WhatsApp conversations and provides insights. Return only valid JSON in the exact format requested.
 
-CONVERSATION HISTORY:
-{conversation_text}
+Your task is to analyze the conversation in the next message and generate detailed statistics and insights.
 
 ANALYSIS INSTRUCTIONS:
 
-1. CONVERSATION DYNAMICS:
-   Analyze the overall energy and engagement level of the conversation:
-   - energy_balance: Determine "Low", "Medium", or "High" based on:
-     * Exclamation marks and enthusiasm indicators
-     * Emoji usage frequency and variety
-     * Overall tone and excitement level
-     * Use of positive language and expressions
-   
-   - engagement_level: Determine "Low", "Medium", or "High" based on:
-     * Response frequency and timing
-     * Question asking patterns
-     * Active participation vs passive responses
-     * Interest shown in the other person's messages
-
-2. RESPONSE PATTERNS:
-   Analyze the communication patterns in detail:
-   - avg_response_time: Estimate based on conversation flow, message timing, and response patterns (e.g., "2m", "5m", "10m", "15m")
-   - words_per_message: Calculate average words per message from the user's messages
-   - question_rate: Calculate percentage of user messages that contain questions
-   - emoji_usage: Determine "Low", "Medium", or "High" based on emoji frequency in user messages
-
-3. CONVERSATION TOPICS:
+1. CONVERSATION TOPICS:
    Identify the main topics discussed and their relative importance:
    - Analyze all messages for topic keywords and themes
    - Calculate percentage distribution of topics
    - Include 3-4 most prominent topics
    - Topics can include: Sports, Work/Life Balance, Social Plans, Personal Life, Technology, Travel, Entertainment, Food, Family, etc.
 
-4. THEIR COMMUNICATION STYLE:
+2. THEIR COMMUNICATION STYLE:
    Analyze the other person's communication patterns and provide 5-6 specific insights:
    - Look for patterns in their messaging style
    - Identify their tone, formality level, and engagement style
@@ -185,11 +226,12 @@ ANALYSIS INSTRUCTIONS:
    - Consider their use of emojis, questions, and expressions
    - Examples: "Uses enthusiasm to engage (exclamation marks)", "Shows genuine concern for your wellbeing", "Initiates social activities"
 
-5. GENERAL CONVERSATION TIPS:
+3. GENERAL CONVERSATION TIPS:
    Provide 5-6 actionable, specific tips based on the conversation analysis:
    - Tips should be personalized to this specific conversation
    - Focus on improving engagement and connection
    - Consider the other person's communication style
+   - When the user's own style is given, make the tips fit how they already write
    - Make tips practical and implementable
    - Examples: "Match their energy - they're enthusiastic!", "Ask follow-up questions to show interest"
 
@@ -198,27 +240,17 @@ IMPORTANT ANALYSIS GUIDELINES:
 - Consider context, tone, and relationship dynamics
 - Look for patterns across the entire conversation
 - Provide specific, actionable insights
-- Ensure all percentages and metrics are realistic and well-calculated
+- Ensure all topic percentages are realistic and add up to 100%
 - Make the analysis feel personalized and relevant
 
 Return ONLY valid JSON with this exact structure:
-{{
-  "conversation_dynamics": {{
-    "energy_balance": "Low/Medium/High",
-    "engagement_level": "Low/Medium/High"
-  }},
-  "response_patterns": {{
-    "avg_response_time": "Xm",
-    "words_per_message": X,
-    "question_rate": "X%",
-    "emoji_usage": "Low/Medium/High"
-  }},
-  "conversation_topics": {{
+{
+  "conversation_topics": {
     "topics": [
-      {{"topic": "Topic Name", "percentage": "X%"}}
+      {"topic": "Topic Name", "percentage": "X%"}
     ]
-  }},
-  "communication_style": {{
+  },
+  "communication_style": {
     "style_points": [
       "Point 1",
       "Point 2",
@@ -226,8 +258,8 @@ Return ONLY valid JSON with this exact structure:
       "Point 4",
       "Point 5"
     ]
-  }},
-  "conversation_tips": {{
+  },
+  "conversation_tips": {
     "tips": [
       "Tip 1",
       "Tip 2",
@@ -235,162 +267,369 @@ Return ONLY valid JSON with this exact structure:
       "Tip 4",
       "Tip 5"
     ]
-  }}
-}}"""
+  }
+}"""
+
+STATS_TONE_FIELDS = {
+    "formality_level": "Formality",
+    "engagement_style": "engagement",
+    "emoji_usage": "emoji usage",
+    "response_length": "message length",
+    "writing_style": "writing style",
+    "humor_style": "humor",
+    "emotional_expression": "emotional expression"
+}
+
+def tone_context(tone_profile: Optional[Dict[str, Any]]) -> str:
+    if not isinstance(tone_profile, dict):
+        return ""
+    parts = [f"{label}: {tone_profile[field]}" for field, label in STATS_TONE_FIELDS.items()
+             if isinstance(tone_profile.get(field), (str, int, float))]
+    return ", ".join(parts)
+
+def create_stats_messages(metrics: Dict[str, Any], tone_profile: Optional[Dict[str, Any]] = None) -> List[Dict[str, str]]:
+    
+    conversation_text = metrics.get('conversation_text', '')
+    total_messages = metrics.get('total_messages', 0)
+    user_messages = metrics.get('user_messages', 0)
+    other_messages = metrics.get('other_messages', 0)
+    local_metrics = metrics.get('local_metrics', {})
     
-    return prompt
+    prompt = f"""CONVERSATION DATA:
+- Total Messages: {total_messages}
+- Your Messages: {user_messages}
+- Their Messages: {other_messages}
 
-@app.post("/generate_stats", response_model=StatsResponse)
-async def generate_stats(request: StatsRequest):
-    try:
-        user_memory = get_user_stats_memory(request.user_id)
-        metrics = analyze_conversation_metrics(request.chat_history)
-        prompt = create_stats_prompt(request.chat_history, metrics)
-        
-        if not os.getenv("OPENAI_API_KEY"):
-            return StatsResponse(
-                conversation_dynamics=ConversationDynamics(
-                    energy_balance="Medium",
-                    engagement_level="Medium"
-                ),
-                response_patterns=ResponsePatterns(
-                    avg_response_time="5m",
-                    words_per_message=8,
-                    question_rate="20%",
-                    emoji_usage="Medium"
-                ),
-                conversation_topics=ConversationTopics(
-                    topics=[{"topic": "General Conversation", "percentage": "100%"}]
-                ),
-                communication_style=CommunicationStyle(
-                    style_points=[
-                        "Shows interest in conversation",
-                        "Responds to messages",
-                        "Maintains conversation flow",
-                        "Uses appropriate tone",
-                        "Engages in dialogue"
-                    ]
-                ),
-                conversation_tips=ConversationTips(
-                    tips=[
-                        "Ask follow-up questions to show interest",
-                        "Share your own experiences when relevant",
-                        "Use emojis to match their energy level",
-                        "Be genuine and authentic in your responses",
-                        "Show appreciation for their messages"
-                    ]
-                )
-            )
-        
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "You are Tona, an AI assistant that analyzes WhatsApp conversations and provides insights. Return only valid JSON in the exact format requested."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=1000,
-            temperature=0.3
+MEASURED METRICS (already computed, use them as context only):
+- Energy: {local_metrics.get('energy_balance', 'Unknown')}, engagement: {local_metrics.get('engagement_level', 'Unknown')}
+- Your words per message: {local_metrics.get('words_per_message', 'Unknown')}, their words per message: {local_metrics.get('their_words_per_message', 'Unknown')}
+- Your question rate: {local_metrics.get('question_rate', 'Unknown')}, their question rate: {local_metrics.get('their_question_rate', 'Unknown')}
+- Your emoji usage: {local_metrics.get('emoji_usage', 'Unknown')}, their emoji usage: {local_metrics.get('their_emoji_usage', 'Unknown')}
+- Your average reply time: {local_metrics.get('user_avg_response_time') or 'Unknown'}, their average reply time: {local_metrics.get('their_avg_response_time') or 'Unknown'}
+"""
+    
+    # the main server has usually analysed the user's tone for this chat already
+    user_style = tone_context(tone_profile)
+    if user_style:
+        prompt += f"""
+YOUR OWN STYLE (from the tone analysis):
+- {user_style}
+"""
+    
+    prompt += f"""
+CONVERSATION HISTORY:
+{conversation_text}"""
+    
+    return [
+        {"role": "system", "content": STATS_SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+
+DEFAULT_TOPICS = [{"topic": "General Conversation", "percentage": "100%"}]
+
+DEFAULT_STYLE_POINTS = [
+    "Shows interest in conversation",
+    "Responds to messages",
+    "Maintains conversation flow",
+    "Uses appropriate tone",
+    "Engages in dialogue"
+]
+
+DEFAULT_TIPS = [
+    "Ask follow-up questions to show interest",
+    "Share your own experiences when relevant",
+    "Use emojis to match their energy level",
+    "Be genuine and authentic in your responses",
+    "Show appreciation for their messages"
+]
+
+def build_local_metrics(aggregates: ConversationAggregates):
+    dynamics = aggregates.conversation_dynamics()
+    patterns = aggregates.response_patterns()
+    
+    conversation_dynamics = ConversationDynamics(
+        energy_balance=dynamics.get("energy_balance", "Medium"),
+        engagement_level=dynamics.get("engagement_level", "Medium")
+    )
+    response_patterns = ResponsePatterns(
+        avg_response_time=patterns.get("avg_response_time", "N/A"),
+        words_per_message=patterns.get("words_per_message", 0),
+        question_rate=patterns.get("question_rate", "0%"),
+        emoji_usage=patterns.get("emoji_usage", "Low")
+    )
+    return conversation_dynamics, response_patterns
+
+def build_stats_response(llm_response: Dict[str, Any], aggregates: ConversationAggregates) -> StatsResponse:
+    conversation_dynamics, response_patterns = build_local_metrics(aggregates)
+    
+    return StatsResponse(
+        conversation_dynamics=conversation_dynamics,
+        response_patterns=response_patterns,
+        conversation_topics=ConversationTopics(
+            topics=llm_response.get("conversation_topics", {}).get("topics", DEFAULT_TOPICS)
+        ),
+        communication_style=CommunicationStyle(
+            style_points=llm_response.get("communication_style", {}).get("style_points", DEFAULT_STYLE_POINTS)
+        ),
+        conversation_tips=ConversationTips(
+            tips=llm_response.get("conversation_tips", {}).get("tips", DEFAULT_TIPS)
         )
-        
-        try:
-            llm_response = json.loads(response.choices[0].message.content)
-        except json.JSONDecodeError:
-            logger.error("Failed to parse JSON response from LLM")
-            return StatsResponse(
-                conversation_dynamics=ConversationDynamics(
-                    energy_balance="Medium",
-                    engagement_level="Medium"
-                ),
-                response_patterns=ResponsePatterns(
-                    avg_response_time="5m",
-                    words_per_message=8,
-                    question_rate="20%",
-                    emoji_usage="Medium"
-                ),
-                conversation_topics=ConversationTopics(
-                    topics=[{"topic": "General Conversation", "percentage": "100%"}]
-                ),
-                communication_style=CommunicationStyle(
-                    style_points=[
-                        "Shows interest in conversation",
-                        "Responds to messages",
-                        "Maintains conversation flow",
-                        "Uses appropriate tone",
-                        "Engages in dialogue"
-                    ]
-                ),
-                conversation_tips=ConversationTips(
-                    tips=[
-                        "Ask follow-up questions to show interest",
-                        "Share your own experiences when relevant",
-                        "Use emojis to match their energy level",
-                        "Be genuine and authentic in your responses",
-                        "Show appreciation for their messages"
-                    ]
-                )
-            )
-        
-        stats_response = StatsResponse(
-            conversation_dynamics=ConversationDynamics(
-                energy_balance=llm_response.get("conversation_dynamics", {}).get("energy_balance", "Medium"),
-                engagement_level=llm_response.get("conversation_dynamics", {}).get("engagement_level", "Medium")
-            ),
-            response_patterns=ResponsePatterns(
-                avg_response_time=llm_response.get("response_patterns", {}).get("avg_response_time", "5m"),
-                words_per_message=llm_response.get("response_patterns", {}).get("words_per_message", 8),
-                question_rate=llm_response.get("response_patterns", {}).get("question_rate", "20%"),
-                emoji_usage=llm_response.get("response_patterns", {}).get("emoji_usage", "Medium")
-            ),
-            conversation_topics=ConversationTopics(
-                topics=llm_response.get("conversation_topics", {}).get("topics", [{"topic": "General Conversation", "percentage": "100%"}])
-            ),
-            communication_style=CommunicationStyle(
-                style_points=llm_response.get("communication_style", {}).get("style_points", [
-                    "Shows interest in conversation",
-                    "Responds to messages",
-                    "Maintains conversation flow",
-                    "Uses appropriate tone",
-                    "Engages in dialogue"
-                ])
-            ),
-            conversation_tips=ConversationTips(
-                tips=llm_response.get("conversation_tips", {}).get("tips", [
-                    "Ask follow-up questions to show interest",
-                    "Share your own experiences when relevant",
-                    "Use emojis to match their energy level",
-                    "Be genuine and authentic in your responses",
-                    "Show appreciation for their messages"
-                ])
-            )
+    )
+
+def local_topic_breakdown(aggregates: ConversationAggregates) -> List[Dict[str, str]]:
+    hits = topic_hits("\n".join(msg["text"] for msg in aggregates.recent))
+    if not hits:
+        return DEFAULT_TOPICS
+    
+    total = sum(hits.values())
+    ranked = sorted(hits.items(), key=lambda item: item[1], reverse=True)[:4]
+    return [{"topic": label.title(), "percentage": f"{round(100 * count / total)}%"} for label, count in ranked]
+
+def default_stats_response(aggregates: ConversationAggregates,
+                           topics: Optional[List[Dict[str, str]]] = None) -> StatsResponse:
+    return build_stats_response({"conversation_topics": {"topics": topics or local_topic_breakdown(aggregates)}}, aggregates)
+
+async def fallback_stats_response(aggregates: ConversationAggregates, chat_key: str,
+                                  local_metrics: Optional[Dict[str, Any]], shared: Dict[str, Any]) -> StatsResponse:
+    # an earlier LLM topic breakdown for this chat is still better than the keyword scan
+    await analysis_store.publish(chat_key, local_metrics=local_metrics)
+    return default_stats_response(aggregates, shared.get("topics"))
+
+def conversation_fingerprint(aggregates: ConversationAggregates, metrics: Dict[str, Any],
+                             tone_profile: Optional[Dict[str, Any]] = None) -> str:
+    normalized = [
+        f"{metrics.get('total_messages', 0)}:{metrics.get('user_messages', 0)}:{metrics.get('other_messages', 0)}",
+        json.dumps(metrics.get('local_metrics', {}), sort_keys=True),
+        tone_context(tone_profile)
+    ]
+    for msg in aggregates.recent:
+        sender = "You" if msg["isOutgoing"] else "Them"
+        normalized.append(f"{sender}:{' '.join(msg['text'].split())}")
+    return content_hash(normalized)
+
+async def request_stats_analysis(llm_messages: List[Dict[str, str]],
+                                 on_response: Optional[Callable[[Any], None]] = None) -> Optional[Dict[str, Any]]:
+    response = await client.chat_completion(
+        call_name="stats_analysis",
+        model="gpt-4o-mini",
+        messages=llm_messages,
+        max_tokens=1000,
+        temperature=0.3
+    )
+    if on_response:
+        on_response(response)
+    
+    try:
+        with stage("stats.parse"):
+            return json.loads(response.choices[0].message.content)
+    except json.JSONDecodeError:
+        logger.error("Failed to parse JSON response from LLM")
+        FALLBACKS.labels("stats", "json_decode").inc()
+        return None
+
+async def compute_stats(request: StatsRequest) -> Tuple[StatsResponse, Optional[Dict[str, Any]]]:
+    with stage("stats.ingest"):
+        session_id, aggregates = await ingest_chat_history(request)
+    with stage("stats.metrics"):
+        metrics = analyze_conversation_metrics(aggregates)
+        chat_key = chat_fingerprint(aggregates.recent, aggregates.total_messages)
+    with stage("stats.shared"):
+        shared = await analysis_store.get(chat_key)
+    session_fields = {"session_id": session_id, "cursor": aggregates.cursor}
+    
+    if not os.getenv("OPENAI_API_KEY"):
+        FALLBACKS.labels("stats", "no_api_key").inc()
+        stats_response = await fallback_stats_response(aggregates, chat_key, metrics.get("local_metrics"), shared)
+        return stats_response.model_copy(update=session_fields), None
+    
+    with stage("stats.prompt"):
+        fingerprint = conversation_fingerprint(aggregates, metrics, shared.get("tone_profile"))
+        llm_messages = create_stats_messages(metrics, shared.get("tone_profile"))
+    # only a call made for this request has a prompt to count; cache hits and background refreshes report none
+    sent = []
+    try:
+        llm_response = await stats_cache.get_or_compute(
+            fingerprint, lambda: request_stats_analysis(llm_messages, sent.append)
         )
-        
-        memory_entry = {
-            "timestamp": datetime.now().isoformat(),
-            "metrics": metrics,
-            "response": llm_response,
-            "chat_history_length": len(request.chat_history)
-        }
-        
-        user_memory.append(memory_entry)
-        if len(user_memory) > 20:
-            user_memory = user_memory[-20:]
-        
-        save_user_stats_memory(request.user_id, user_memory)
-        
-        return stats_response
-        
+    except LLMUnavailable as e:
+        logger.warning(f"Stats degraded to local metrics: {e}")
+        FALLBACKS.labels("stats", "degraded").inc()
+        mark_degraded()
+        stats_response = await fallback_stats_response(aggregates, chat_key, metrics.get("local_metrics"), shared)
+        return stats_response.model_copy(update={**session_fields, "degraded": True}), None
+    
+    if llm_response is None:
+        stats_response = await fallback_stats_response(aggregates, chat_key, metrics.get("local_metrics"), shared)
+        return stats_response.model_copy(update=session_fields), None
+    
+    session_fields["prompt_tokens"] = prompt_tokens_used(sent[-1], llm_messages) if sent else None
+    stats_response = build_stats_response(llm_response, aggregates).model_copy(update=session_fields)
+    await analysis_store.publish(
+        chat_key,
+        local_metrics=metrics.get("local_metrics"),
+        topics=llm_response.get("conversation_topics", {}).get("topics")
+    )
+    
+    memory_entry = {
+        "timestamp": datetime.now().isoformat(),
+        "metrics": metrics,
+        "response": llm_response,
+        "chat_history_length": aggregates.total_messages
+    }
+    
+    return stats_response, memory_entry
+
+def request_fingerprint(request: BaseModel) -> str:
+    # user_id only decides where memory is written, so it is left out of the coalescing key
+    return content_hash([json.dumps(request.model_dump(exclude={"user_id"}), sort_keys=True)])
+
+async def generate_stats_for(request: StatsRequest) -> StatsResponse:
+    stats_response, memory_entry = await stats_flights.do(
+        request_fingerprint(request),
+        lambda: compute_stats(request)
+    )
+    
+    if memory_entry is not None:
+        with stage("stats.memory_save"):
+            await stats_memory_log.append(request.user_id, memory_entry)
+    
+    return stats_response
+
+@app.post("/generate_stats", response_model=StatsResponse)
+async def generate_stats(request: StatsRequest, http_request: Request, x_deadline_ms: Optional[str] = Header(None)):
+    try:
+        with latency_budget(x_deadline_ms, STATS_LATENCY_BUDGET_MS):
+            admitted_at = await admit_or_reject(admission, request.user_id, http_request)
+            try:
+                return await generate_stats_for(request)
+            finally:
+                admission.release(admitted_at)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in generate_stats: {e}")
         raise HTTPException(status_code=500, detail=f"Statistics generation failed: {str(e)}")
 
+async def compute_batch_item(index: int, request: StatsRequest) -> Dict[str, Any]:
+    try:
+        stats_response = await generate_stats_for(request)
+        return {"index": index, "status": "ok", "result": stats_response.model_dump()}
+    except HTTPException as e:
+        return {"index": index, "status": "error", "status_code": e.status_code, "detail": e.detail}
+    except Exception as e:
+        logger.error(f"Error in generate_stats batch item {index}: {e}")
+        return {"index": index, "status": "error", "status_code": 500, "detail": f"Statistics generation failed: {str(e)}"}
+
+@app.post("/generate_stats/batch")
+async def generate_stats_batch(batch: StatsBatchRequest, http_request: Request, x_deadline_ms: Optional[str] = Header(None)):
+    # items may belong to different users, so the batch is charged per item against the caller's IP only
+    admitted_at = await admit_or_reject(admission, None, http_request, cost=len(batch.requests))
+    
+    # LLM calls from every item share client's concurrency cap, so results arrive as the cap allows
+    async def result_stream():
+        # tasks copy the budget when created, so items still queued when it runs out come back degraded
+        with latency_budget(x_deadline_ms, STATS_BATCH_LATENCY_BUDGET_MS):
+            tasks = [asyncio.create_task(compute_batch_item(i, item)) for i, item in enumerate(batch.requests)]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                yield json.dumps(await finished) + "\n"
+        finally:
+            for task in tasks:
+                task.cancel()
+    
+    return AdmittedStreamingResponse(result_stream(), admission, admitted_at, media_type="application/x-ndjson")
+
+async def run_stats_job(request: StatsRequest) -> Dict[str, Any]:
+    # nobody is holding a connection open for it, so a job gets far more time than /generate_stats
+    with latency_budget(None, STATS_JOB_LATENCY_BUDGET_MS):
+        stats_response = await generate_stats_for(request)
+    return stats_response.model_dump()
+
+stats_jobs = JobPool(
+    "stats",
+    run_stats_job,
+    JobStore("tona_stats_job", redis_client=redis_client),
+    workers=STATS_JOB_WORKERS,
+    max_queued=STATS_JOB_MAX_QUEUED
+)
+
+@app.post("/generate_stats/jobs", response_model=StatsJob, status_code=202)
+async def submit_stats_job(request: StatsRequest, http_request: Request, response: Response):
+    await rate_limit_or_reject(admission, request.user_id, http_request)
+    try:
+        job = await stats_jobs.submit(request, current_request_id())
+    except QueueFull as e:
+        raise busy_error(e)
+    response.headers["Location"] = f"{http_request.url.path}/{job['job_id']}"
+    return job
+
+@app.get("/generate_stats/jobs/{job_id}", response_model=StatsJob)
+async def get_stats_job(job_id: str, wait: float = Query(0, ge=0, le=JOB_MAX_WAIT_SECONDS)):
+    job = await stats_jobs.wait(job_id, wait)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Stats job not found or expired")
+    return job
+
+@app.on_event("startup")
+async def startup():
+    global redis_client, shared_redis_client
+    redis_client = await connect_redis(db=1)
+    shared_redis_client = await connect_redis(db=REDIS_SHARED_DB)
+    client.limiter.redis_client = shared_redis_client
+    analysis_store.redis_client = shared_redis_client
+    stats_cache.redis_client = redis_client
+    session_store.redis_client = redis_client
+    stats_memory_log.redis_client = redis_client
+    admission.set_redis(redis_client)
+    stats_jobs.store.redis_client = redis_client
+    stats_jobs.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await stats_jobs.stop()
+    await client.close()
+    if redis_client:
+        await redis_client.aclose()
+    if shared_redis_client:
+        await shared_redis_client.aclose()
+
+@app.post("/generate_stats/metrics", response_model=LocalStatsResponse)
+async def generate_local_stats(request: StatsRequest):
+    _, aggregates = await ingest_chat_history(request, persist=False)
+    conversation_dynamics, response_patterns = build_local_metrics(aggregates)
+    return LocalStatsResponse(
+        conversation_dynamics=conversation_dynamics,
+        response_patterns=response_patterns,
+        session_id=request.session_id,
+        cursor=aggregates.cursor
+    )
+
 @app.get("/health")
 async def health_check():
     return {"status": "healthy", "timestamp": datetime.now().isoformat()}
 
+@app.get("/cache_stats")
+async def cache_stats():
+    return {
+        "llm_usage": client.get_usage_stats(),
+        "stats_cache": stats_cache.get_stats(),
+        "memory_fallback": stats_memory_log.get_stats(),
+        "session_fallback": session_store.get_stats(),
+        "stats_flights": stats_flights.get_stats(),
+        "llm_breaker": client.breaker.get_stats(),
+        "llm_limiter": await client.limiter.get_stats(),
+        "analysis_store": analysis_store.get_stats(),
+        "admission": admission.get_stats(),
+        "stats_jobs": stats_jobs.get_stats()
+    }
+
 @app.get("/user_stats_memory/{user_id}")
-async def get_stats_memory(user_id: str):
-    memory = get_user_stats_memory(user_id)
-    return {"user_id": user_id, "memory_entries": len(memory), "memory": memory}
+async def get_stats_memory(user_id: str, offset: int = Query(0, ge=0), limit: int = Query(20, ge=1, le=500)):
+    memory_entries, memory = await asyncio.gather(
+        stats_memory_log.count(user_id),
+        stats_memory_log.read(user_id, offset, limit)
+    )
+    return {"user_id": user_id, "memory_entries": memory_entries, "offset": offset, "limit": limit, "memory": memory}
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,41 @@
+import json
+import logging
+from typing import Any, Dict, Optional
+
+from cache import LRUCache
+from metrics_engine import ConversationAggregates
+
+logger = logging.getLogger(__name__)
+
+class StatsSessionStore:
+    def __init__(self, redis_client=None, ttl_seconds: int = 86400,
+                 local_max_sessions: int = 1000, local_max_bytes: int = 32 * 1024 * 1024):
+        self.redis_client = redis_client
+        self.ttl_seconds = ttl_seconds
+        self._local = LRUCache(local_max_sessions, ttl_seconds, max_bytes=local_max_bytes, sizeof=len)
+
+    async def load(self, session_id: str) -> Optional[ConversationAggregates]:
+        if self.redis_client:
+            try:
+                data = await self.redis_client.get(f"tona_stats_session_{session_id}")
+                if data:
+                    return ConversationAggregates.from_dict(json.loads(data))
+            except Exception as e:
+                logger.error(f"Error reading stats session from Redis: {e}")
+
+        data = self._local.get(session_id)
+        return ConversationAggregates.from_dict(json.loads(data)) if data else None
+
+    async def save(self, session_id: str, aggregates: ConversationAggregates):
+        data = json.dumps(aggregates.to_dict())
+        if self.redis_client:
+            try:
+                await self.redis_client.setex(f"tona_stats_session_{session_id}", self.ttl_seconds, data)
+                return
+            except Exception as e:
+                logger.error(f"Error writing stats session to Redis: {e}")
+
+        self._local.set(session_id, data)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return self._local.get_stats()
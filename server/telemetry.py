@@ -0,0 +1,211 @@
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Dict, List, Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client import REGISTRY, multiprocess
+from starlette.responses import Response
+from starlette.routing import Match
+
+logger = logging.getLogger(__name__)
+
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH")
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", 1.0))
+REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+# LLM calls dominate request time, so the buckets reach well past the usual 10s ceiling
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+REDIS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+
+REQUEST_LATENCY = Histogram(
+    "tona_request_duration_seconds", "HTTP request latency, including streamed bodies",
+    ["app", "endpoint", "method", "status"], buckets=LATENCY_BUCKETS
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "tona_requests_in_flight", "HTTP requests currently being served",
+    ["app", "endpoint"], multiprocess_mode="livesum"
+)
+STAGE_LATENCY = Histogram(
+    "tona_stage_duration_seconds", "Latency of the stages inside a request",
+    ["stage"], buckets=LATENCY_BUCKETS
+)
+LLM_CALLS = Counter(
+    "tona_llm_calls", "LLM completions by call and outcome (ok, error, deadline, circuit_open, cancelled)", ["call", "outcome"]
+)
+LLM_TOKENS = Counter("tona_llm_tokens", "LLM tokens by call and kind (prompt, cached, completion)", ["call", "kind"])
+LLM_IN_FLIGHT = Gauge("tona_llm_in_flight", "LLM completions currently running", multiprocess_mode="livesum")
+LLM_CIRCUIT_STATE = Gauge(
+    "tona_llm_circuit_state", "LLM circuit breaker state: 0 closed, 1 half open, 2 open", multiprocess_mode="max"
+)
+# cluster-wide values read back from Redis, so every worker reports the same number
+LLM_CLUSTER_SLOTS = Gauge(
+    "tona_llm_cluster_slots", "Cluster-wide LLM slots by state (held, waiting)", ["state"], multiprocess_mode="mostrecent"
+)
+LLM_CLUSTER_TOKENS = Gauge(
+    "tona_llm_cluster_tokens_available", "Tokens left in the cluster-wide tokens-per-minute bucket",
+    multiprocess_mode="mostrecent"
+)
+RATE_LIMITED = Counter("tona_rate_limited", "Requests rejected with 429 by scope (user, ip, queue)", ["app", "scope"])
+ADMISSION_QUEUE = Gauge(
+    "tona_admission_queue", "Requests holding or waiting for an admission slot", ["app", "state"], multiprocess_mode="livesum"
+)
+JOBS = Gauge("tona_jobs", "Background jobs by state (queued, running)", ["pool", "state"], multiprocess_mode="livesum")
+JOBS_FINISHED = Counter("tona_jobs_finished", "Background jobs by final status (done, failed)", ["pool", "status"])
+FALLBACKS = Counter("tona_fallbacks", "Responses served from a fallback path", ["component", "reason"])
+REDIS_LATENCY = Histogram(
+    "tona_redis_command_duration_seconds", "Redis command and pipeline latency",
+    ["command"], buckets=REDIS_BUCKETS
+)
+
+class Trace:
+    def __init__(self, request_id: str):
+        self.request_id = request_id
+        self.started = time.perf_counter()
+        self.started_at = time.time()
+        self.spans: List[Dict[str, Any]] = []
+
+    def add_span(self, name: str, started: float, duration: float, parent: Optional[str]):
+        self.spans.append({
+            "name": name,
+            "parent": parent,
+            "start_ms": round((started - self.started) * 1000, 2),
+            "duration_ms": round(duration * 1000, 2)
+        })
+
+    def server_timing(self) -> str:
+        entries = [f"{span['name']};dur={span['duration_ms']}" for span in self.spans]
+        entries.append(f"total;dur={round((time.perf_counter() - self.started) * 1000, 2)}")
+        return ", ".join(entries)
+
+current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+current_span: ContextVar[Optional[str]] = ContextVar("current_span", default=None)
+
+def current_request_id() -> Optional[str]:
+    trace = current_trace.get()
+    return trace.request_id if trace else None
+
+@contextmanager
+def stage(name: str):
+    trace = current_trace.get()
+    parent = current_span.get()
+    token = current_span.set(name)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - started
+        current_span.reset(token)
+        STAGE_LATENCY.labels(name).observe(duration)
+        if trace is not None:
+            trace.add_span(name, started, duration, parent)
+
+class TraceExporter:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "a", buffering=1, encoding="utf-8")
+
+    def export(self, record: Dict[str, Any]):
+        line = json.dumps(record)
+        with self._lock:
+            self._file.write(line + "\n")
+
+trace_exporter: Optional[TraceExporter] = None
+if TRACE_EXPORT_PATH:
+    try:
+        trace_exporter = TraceExporter(TRACE_EXPORT_PATH)
+    except OSError as e:
+        logger.error(f"Could not open trace export file {TRACE_EXPORT_PATH}: {e}")
+
+def metrics_response() -> Response:
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        # uvicorn --workers runs separate processes; each writes to the shared directory
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+
+def route_label(app: Any, scope: Dict[str, Any]) -> str:
+    # label by route template so /user_memory/{user_id} doesn't create a series per user
+    for route in app.router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, "path", scope["path"])
+    return "unmatched"
+
+def request_id_from(scope: Dict[str, Any]) -> str:
+    for name, value in scope.get("headers", []):
+        if name == b"x-request-id":
+            request_id = value.decode("latin-1")
+            if REQUEST_ID_PATTERN.match(request_id):
+                return request_id
+    return uuid.uuid4().hex
+
+class RequestTelemetryMiddleware:
+    def __init__(self, app, app_name: str, fastapi_app: Any):
+        self.app = app
+        self.app_name = app_name
+        self.fastapi_app = fastapi_app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        endpoint = route_label(self.fastapi_app, scope)
+        status = {"code": 500}
+        trace = Trace(request_id_from(scope))
+        trace_token = current_trace.set(trace)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                # streamed responses only carry the stages that finished before the first byte
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [
+                    (b"x-request-id", trace.request_id.encode("latin-1")),
+                    (b"server-timing", trace.server_timing().encode("latin-1")),
+                    (b"timing-allow-origin", b"*")
+                ]
+            await send(message)
+
+        in_flight = REQUESTS_IN_FLIGHT.labels(self.app_name, endpoint)
+        in_flight.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_trace.reset(trace_token)
+            in_flight.dec()
+            duration = time.perf_counter() - trace.started
+            REQUEST_LATENCY.labels(self.app_name, endpoint, scope["method"], str(status["code"])).observe(duration)
+            if trace_exporter is not None and endpoint != "/metrics" and random.random() < TRACE_SAMPLE_RATE:
+                trace_exporter.export({
+                    "request_id": trace.request_id,
+                    "app": self.app_name,
+                    "endpoint": endpoint,
+                    "method": scope["method"],
+                    "status": status["code"],
+                    "timestamp": trace.started_at,
+                    "duration_ms": round(duration * 1000, 2),
+                    "spans": trace.spans
+                })
+
+def instrument_app(app: Any, app_name: str):
+    app.add_middleware(RequestTelemetryMiddleware, app_name=app_name, fastapi_app=app)
+
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics():
+        return metrics_response()
+
+async def timed(name: str, awaitable: Awaitable[Any]) -> Any:
+    with stage(name):
+        return await awaitable
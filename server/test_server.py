@@ -58,6 +58,8 @@ def test_server():
             print(f"Response: {result.get('response', 'No response')}")
             print(f"Suggestions: {len(result.get('suggestions', []))} suggestions provided")
             print(f"User tone analysis: {result.get('user_tone_analysis', {}).get('engagement_style', 'Unknown')}")
+            print(f"Request id: {response.headers.get('X-Request-ID')}")
+            print(f"Server-Timing: {response.headers.get('Server-Timing')}")
             return True
         else:
             print(f"Chat analysis failed: {response.status_code}")
@@ -68,15 +70,49 @@ def test_server():
         print(f"Request failed: {e}")
         return False
 
+def test_stream():
+    base_url = "http://localhost:8000"
+    
+    test_data = {
+        "chat_history": [
+            {
+                "text": "Great! I was thinking we should grab lunch sometime this week",
+                "timestamp": "2:34 PM",
+                "isOutgoing": False,
+                "sender": "Alex"
+            }
+        ],
+        "user_query": "How should I reply?",
+        "user_id": "test_user"
+    }
+    
+    try:
+        response = requests.post(f"{base_url}/analyze_chat/stream", json=test_data, stream=True)
+        if response.status_code != 200:
+            print(f"Streaming endpoint failed: {response.status_code}")
+            return False
+        
+        events = {}
+        for line in response.iter_lines(decode_unicode=True):
+            if line and line.startswith("event: "):
+                event = line[len("event: "):]
+                events[event] = events.get(event, 0) + 1
+        
+        print(f"Streaming endpoint working - {events.get('token', 0)} tokens, {events.get('suggestion', 0)} suggestions streamed")
+        return events.get("result", 0) == 1
+    except requests.exceptions.RequestException as e:
+        print(f"Streaming request failed: {e}")
+        return False
+
 def test_memory():
     base_url = "http://localhost:8000"
     
     try:
-        response = requests.get(f"{base_url}/user_memory/test_user")
+        response = requests.get(f"{base_url}/user_memory/test_user", params={"offset": 0, "limit": 5})
         if response.status_code == 200:
             result = response.json()
-            print(f"Memory endpoint working - {result.get('memory_entries', 0)} entries")
-            return True
+            print(f"Memory endpoint working - {result.get('memory_entries', 0)} entries, {len(result.get('memory', []))} in page")
+            return len(result.get('memory', [])) <= 5
         else:
             print(f"Memory endpoint failed: {response.status_code}")
             return False
@@ -84,13 +120,32 @@ def test_memory():
         print(f"Memory request failed: {e}")
         return False
 
+def test_metrics():
+    base_url = "http://localhost:8000"
+    
+    try:
+        response = requests.get(f"{base_url}/metrics")
+        if response.status_code == 200:
+            stages = sorted({line.split('stage="')[1].split('"')[0] for line in response.text.splitlines()
+                             if line.startswith("tona_stage_duration_seconds_count")})
+            print(f"Metrics endpoint working - stages recorded: {', '.join(stages) or 'none yet'}")
+            return True
+        else:
+            print(f"Metrics endpoint failed: {response.status_code}")
+            return False
+    except requests.exceptions.RequestException as e:
+        print(f"Metrics request failed: {e}")
+        return False
+
 if __name__ == "__main__":
     print("Tona LLM Server Test Suite")
     print("=" * 40)
     
     if test_server():
         print("\nAll basic tests passed")
+        test_stream()
         test_memory()
+        test_metrics()
         print("\nServer is working correctly")
     else:
         print("\nTests failed")
@@ -125,6 +125,67 @@ def test_stats_server():
     except Exception as e:
         print(f"Error testing stats generation: {e}")
     
+    print("\nTesting local metrics endpoint...")
+    try:
+        response = requests.post(f"{base_url}/generate_stats/metrics", json={"chat_history": test_chat_history})
+        if response.status_code == 200:
+            local_stats = response.json()
+            print(f"Local metrics: {local_stats['conversation_dynamics']} {local_stats['response_patterns']}")
+        else:
+            print(f"Local metrics error: {response.status_code} - {response.text}")
+    except Exception as e:
+        print(f"Error testing local metrics: {e}")
+    
+    print("\nTesting incremental stats session...")
+    try:
+        first = requests.post(f"{base_url}/generate_stats", json={
+            "chat_history": test_chat_history[:6],
+            "user_id": "test_user"
+        }).json()
+        delta = requests.post(f"{base_url}/generate_stats", json={
+            "chat_history": test_chat_history[6:],
+            "user_id": "test_user",
+            "session_id": first["session_id"],
+            "cursor": first["cursor"]
+        })
+        if delta.status_code == 200:
+            print(f"Session {first['session_id']} advanced from cursor {first['cursor']} to {delta.json()['cursor']}")
+        else:
+            print(f"Delta error: {delta.status_code} - {delta.text}")
+    except Exception as e:
+        print(f"Error testing incremental stats: {e}")
+    
+    print("\nTesting batch stats endpoint...")
+    try:
+        batch = {"requests": [
+            {"chat_history": test_chat_history, "user_id": "test_user"},
+            {"chat_history": test_chat_history[:4], "user_id": "test_user"},
+            {"chat_history": test_chat_history, "session_id": "missing", "cursor": 3}
+        ]}
+        response = requests.post(f"{base_url}/generate_stats/batch", json=batch, stream=True)
+        if response.status_code == 200:
+            for line in response.iter_lines():
+                if line:
+                    item = json.loads(line)
+                    print(f"Batch item {item['index']}: {item['status']}")
+        else:
+            print(f"Batch error: {response.status_code} - {response.text}")
+    except Exception as e:
+        print(f"Error testing batch stats: {e}")
+    
+    print("\nTesting stats job endpoint...")
+    try:
+        response = requests.post(f"{base_url}/generate_stats/jobs", json={"chat_history": test_chat_history, "user_id": "test_user"})
+        if response.status_code == 202:
+            job = response.json()
+            while job["status"] in ("queued", "running"):
+                job = requests.get(f"{base_url}/generate_stats/jobs/{job['job_id']}", params={"wait": 25}).json()
+            print(f"Job {job['job_id']}: {job['status']}")
+        else:
+            print(f"Job error: {response.status_code} - {response.text}")
+    except Exception as e:
+        print(f"Error testing stats jobs: {e}")
+    
     print("\nTesting memory endpoint...")
     try:
         response = requests.get(f"{base_url}/user_stats_memory/test_user")
@@ -135,6 +196,17 @@ def test_stats_server():
             print(f"Memory error: {response.status_code}")
     except Exception as e:
         print(f"Error testing memory: {e}")
+    
+    print("\nTesting metrics endpoint...")
+    try:
+        response = requests.get(f"{base_url}/metrics")
+        if response.status_code == 200:
+            series = [line for line in response.text.splitlines() if line.startswith("tona_llm_tokens_total")]
+            print(f"Metrics retrieved: {len(series)} token series")
+        else:
+            print(f"Metrics error: {response.status_code}")
+    except Exception as e:
+        print(f"Error testing metrics: {e}")
 
 if __name__ == "__main__":
     print("Testing Tona Statistics & Insights Server")
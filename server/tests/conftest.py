@@ -0,0 +1,6 @@
+import os
+import sys
+
+# the servers import each other as flat modules and build their OpenAI client at import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "test")
@@ -0,0 +1,83 @@
+import asyncio
+import json
+
+import fakeredis
+import pytest
+
+import main
+import stats_server
+from admission import AdmissionController, RateLimited, TokenBucketLimiter
+
+CHAT = [
+    {"text": "Hey want to get dinner?", "timestamp": "2024-01-01T10:00:00Z", "isOutgoing": False, "sender": "them"},
+    {"text": "Sure! when?", "timestamp": "2024-01-01T10:01:00Z", "isOutgoing": True, "sender": "you"}
+]
+
+STREAMING_ENDPOINTS = [
+    (main, "/analyze_chat/stream", {"chat_history": CHAT, "user_query": "what now?", "user_id": "disconnect"}),
+    (stats_server, "/generate_stats/batch", {"requests": [{"chat_history": CHAT}]})
+]
+
+async def call_app(app, path, payload, send):
+    body = json.dumps(payload).encode()
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+
+    async def receive():
+        # the client goes away as soon as the request body has been read
+        return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "", "query_string": b"",
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        "client": ("127.0.0.1", 50000), "server": ("testserver", 80)
+    }
+    await app(scope, receive, send)
+
+@pytest.mark.parametrize("module,path,payload", STREAMING_ENDPOINTS)
+def test_slot_released_when_client_disconnects_before_first_chunk(module, path, payload):
+    async def send(message):
+        # a slow socket: the disconnect is noticed before the body generator is ever started
+        if message["type"] == "http.response.start":
+            await asyncio.sleep(0.1)
+
+    for _ in range(3):
+        asyncio.run(call_app(module.app, path, payload, send))
+    assert module.admission.queue.active == 0
+
+@pytest.mark.parametrize("module,path,payload", STREAMING_ENDPOINTS)
+def test_slot_released_when_response_start_fails(module, path, payload):
+    async def send(message):
+        if message["type"] == "http.response.start":
+            raise ConnectionResetError("client went away")
+
+    with pytest.raises(ConnectionResetError):
+        asyncio.run(call_app(module.app, path, payload, send))
+    assert module.admission.queue.active == 0
+
+@pytest.mark.parametrize("use_redis", [False, True])
+def test_ip_rejection_does_not_spend_the_users_tokens(use_redis):
+    controller = AdmissionController("refund_test")
+    controller.user_limiter = TokenBucketLimiter("tona_rl_refund_test_user", per_minute=1, burst=3)
+    controller.ip_limiter = TokenBucketLimiter("tona_rl_refund_test_ip", per_minute=1, burst=2)
+
+    async def run():
+        if use_redis:
+            controller.set_redis(fakeredis.FakeAsyncRedis(decode_responses=True))
+        # someone else on the same IP uses up its bucket
+        for _ in range(2):
+            await controller.check_rate_limits("noisy", "10.0.0.1")
+        for _ in range(5):
+            with pytest.raises(RateLimited) as rejected:
+                await controller.check_rate_limits("alice", "10.0.0.1")
+            assert rejected.value.scope == "ip"
+
+        # from other addresses alice still has her whole burst
+        for i in range(3):
+            await controller.check_rate_limits("alice", f"10.0.1.{i}")
+        with pytest.raises(RateLimited) as rejected:
+            await controller.check_rate_limits("alice", "10.0.2.1")
+        assert rejected.value.scope == "user"
+
+    asyncio.run(run())
+    assert controller.user_limiter.refunded == 5
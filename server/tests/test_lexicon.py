@@ -0,0 +1,54 @@
+import pytest
+
+from lexicon import LEXICON, topic_hits
+
+@pytest.mark.parametrize("line", [
+    "Key insights from the chat:",
+    "Considering their mood, keep it light.",
+    "My observations so far:",
+    "Based on the conversation, they seem busy.",
+    "Here are some good responses"
+])
+def test_analysis_text_is_recognised(line):
+    assert "analysis_phrase" in LEXICON.categories(line)
+
+@pytest.mark.parametrize("query", [
+    "reply more casually",
+    "can you say it more formally?",
+    "make it sound friendlier",
+    "something funnier please",
+    "give me a professional reply"
+])
+def test_tone_requests_are_recognised(query):
+    assert "tone_request" in LEXICON.categories(query)
+
+@pytest.mark.parametrize("text", [
+    "Sounds great! What time works for you?",
+    "I'm in! Want to grab food after?"
+])
+def test_ordinary_suggestions_are_not_analysis(text):
+    assert "analysis_phrase" not in LEXICON.categories(text)
+
+def test_whole_words_only():
+    # "hi" is casual, but not inside "this" or "which"
+    assert "casual" not in LEXICON.categories("which one is this")
+    assert "casual" in LEXICON.categories("hi there")
+
+def test_nested_phrases_keep_both_categories():
+    categories = LEXICON.categories("Here are some options")
+    assert {"analysis_phrase", "skip_phrase"} <= categories
+
+def test_topic_hits_count_every_mention():
+    assert topic_hits("The project deadline moved and the team game is Friday") == {"work": 2, "sports": 2}
+
+@pytest.mark.parametrize("text,topic", [
+    ("working late again", "work"),
+    ("my coworkers are great", "work"),
+    ("planning a trip", "social plans"),
+    ("meeting tomorrow?", "social plans"),
+    ("we planned lunches all week", "social plans"),
+    ("their teammates were great", "sports"),
+    ("both families came over", "personal life")
+])
+def test_inflected_topic_words_are_recognised(text, topic):
+    assert topic in topic_hits(text)
@@ -0,0 +1,148 @@
+import asyncio
+
+import fakeredis
+import pytest
+
+import llm_limiter
+from llm_limiter import ClusterLLMLimiter
+
+def make_limiter(redis_client, max_concurrency=1, tokens_per_minute=0):
+    # the scripts run on fakeredis' embedded Lua (lupa)
+    return ClusterLLMLimiter(namespace="test_limiter", max_concurrency=max_concurrency,
+                             tokens_per_minute=tokens_per_minute, redis_client=redis_client)
+
+async def bucket_tokens(limiter):
+    return float(await limiter.redis_client.hget(limiter.keys[4], "tokens"))
+
+@pytest.fixture
+def redis_client():
+    return fakeredis.FakeAsyncRedis(decode_responses=True)
+
+def test_waiters_are_admitted_in_arrival_order(redis_client):
+    limiter = make_limiter(redis_client)
+    admitted = []
+
+    async def wait_turn(name):
+        lease = await limiter.acquire(10, timeout=5)
+        admitted.append(name)
+        await asyncio.sleep(0.02)
+        await limiter.release(lease, 10)
+
+    async def run():
+        holder = await limiter.acquire(10, timeout=1)
+        waiters = []
+        for name in "abcde":
+            waiters.append(asyncio.create_task(wait_turn(name)))
+            await asyncio.sleep(0.02)
+        await limiter.release(holder, 10)
+        await asyncio.gather(*waiters)
+
+    asyncio.run(run())
+    assert admitted == list("abcde")
+
+def test_concurrency_is_capped_across_limiters(redis_client):
+    # two limiters on one Redis stand in for two workers
+    first, second = make_limiter(redis_client, max_concurrency=2), make_limiter(redis_client, max_concurrency=2)
+
+    async def run():
+        leases = [await first.acquire(10, timeout=1), await second.acquire(10, timeout=1)]
+        with pytest.raises(asyncio.TimeoutError):
+            await first.acquire(10, timeout=0.2)
+        await second.release(leases[1], 10)
+        leases[1] = await first.acquire(10, timeout=1)
+        return leases
+
+    assert all(asyncio.run(run()))
+    assert first.timed_out == 1
+
+def test_an_abandoned_lease_expires(redis_client, monkeypatch):
+    monkeypatch.setattr(llm_limiter, "LLM_LIMITER_LEASE_SECONDS", 0.3)
+    limiter = make_limiter(redis_client)
+
+    async def run():
+        # a worker that crashed while holding the slot never releases it
+        assert await limiter.acquire(10, timeout=1)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        lease = await limiter.acquire(10, timeout=3)
+        return lease, loop.time() - started
+
+    lease, waited = asyncio.run(run())
+    assert lease is not None
+    assert 0.2 <= waited < 2
+
+def test_token_quota_is_settled_against_real_usage(redis_client):
+    limiter = make_limiter(redis_client, max_concurrency=0, tokens_per_minute=1000)
+    assert limiter.tokens_per_minute == 900
+
+    async def run():
+        lease = await limiter.acquire(500, timeout=1)
+        reserved = await bucket_tokens(limiter)
+        await limiter.release(lease, 500, tokens_used=100)
+        settled = await bucket_tokens(limiter)
+        await limiter.release(await limiter.acquire(200, timeout=1), 200, tokens_used=None)
+        charged = await bucket_tokens(limiter)
+        return reserved, settled, charged
+
+    reserved, settled, charged = asyncio.run(run())
+    # the bucket refills at 15 tokens a second, so allow a little drift
+    assert 400 <= reserved < 405
+    assert 800 <= settled < 810
+    assert 600 <= charged < 615
+
+def test_settlement_never_overfills_the_bucket(redis_client):
+    limiter = make_limiter(redis_client, max_concurrency=0, tokens_per_minute=1000)
+
+    async def run():
+        lease = await limiter.acquire(300, timeout=1)
+        await limiter.release(lease, 300, tokens_used=0)
+        return await bucket_tokens(limiter)
+
+    assert asyncio.run(run()) <= 900
+
+def test_a_request_waits_for_the_quota_to_refill(redis_client):
+    limiter = make_limiter(redis_client, max_concurrency=0, tokens_per_minute=1000)
+
+    async def run():
+        await limiter.acquire(850, timeout=1)
+        with pytest.raises(asyncio.TimeoutError):
+            await limiter.acquire(200, timeout=0.3)
+        # the timed-out request left the queue, so a small one behind it isn't blocked
+        return await limiter.acquire(40, timeout=1)
+
+    assert asyncio.run(run()) is not None
+
+def test_provider_429_drains_the_bucket(redis_client):
+    limiter = make_limiter(redis_client, max_concurrency=0, tokens_per_minute=1000)
+
+    async def run():
+        lease = await limiter.acquire(100, timeout=1)
+        await limiter.release(lease, 100, drain=True)
+        drained = await bucket_tokens(limiter)
+        with pytest.raises(asyncio.TimeoutError):
+            await limiter.acquire(50, timeout=0.3)
+        return drained
+
+    assert asyncio.run(run()) <= 0
+
+def test_cancelled_waiter_leaves_the_queue(redis_client):
+    limiter = make_limiter(redis_client)
+
+    async def run():
+        holder = await limiter.acquire(10, timeout=1)
+        waiter = asyncio.create_task(limiter.acquire(10, timeout=5))
+        await asyncio.sleep(0.1)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        waiting = await redis_client.zcard(limiter.keys[1])
+        await limiter.release(holder, 10)
+        return waiting, await limiter.acquire(10, timeout=0.5)
+
+    waiting, lease = asyncio.run(run())
+    assert waiting == 0
+    assert lease is not None
+
+def test_disabled_without_redis():
+    limiter = make_limiter(None)
+    assert not limiter.enabled
+    assert asyncio.run(limiter.acquire(10)) is None
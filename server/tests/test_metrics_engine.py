@@ -0,0 +1,88 @@
+import json
+import random
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from metrics_engine import RECENT_WINDOW, ConversationAggregates, count_emojis, parse_timestamp, timestamp_gap
+
+@pytest.mark.parametrize("timestamp,expected", [
+    ("2024-01-15T09:30:00Z", ("absolute", datetime(2024, 1, 15, 9, 30, tzinfo=timezone.utc).timestamp())),
+    ("2024-01-15T09:30:00+02:00", ("absolute", datetime(2024, 1, 15, 7, 30, tzinfo=timezone.utc).timestamp())),
+    ("14:05", ("clock", 14 * 3600 + 5 * 60.0)),
+    ("14:05:59", ("clock", 14 * 3600 + 5 * 60.0)),
+    ("2:30 PM", ("clock", 14 * 3600 + 30 * 60.0)),
+    ("2:30pm", ("clock", 14 * 3600 + 30 * 60.0)),
+    ("12:15 a.m.", ("clock", 15 * 60.0)),
+    ("12:15 PM", ("clock", 12 * 3600 + 15 * 60.0)),
+    ("[15/01/2024, 9:07 am]", ("clock", 9 * 3600 + 7 * 60.0))
+])
+def test_parse_timestamp_formats(timestamp, expected):
+    assert parse_timestamp(timestamp) == expected
+
+@pytest.mark.parametrize("timestamp", [None, "", "yesterday", "25:10", "9:75", "13:00 PM", "0:30 AM"])
+def test_parse_timestamp_rejects_invalid(timestamp):
+    assert parse_timestamp(timestamp) is None
+
+def test_clock_gap_wraps_past_midnight():
+    assert timestamp_gap(parse_timestamp("11:50 PM"), parse_timestamp("12:10 AM")) == 20 * 60
+    assert timestamp_gap(parse_timestamp("23:59"), parse_timestamp("00:01")) == 2 * 60
+    assert timestamp_gap(parse_timestamp("9:00"), parse_timestamp("9:05")) == 5 * 60
+
+def test_absolute_gap_does_not_wrap_and_formats_do_not_mix():
+    assert timestamp_gap(parse_timestamp("2024-01-15T10:00:00Z"), parse_timestamp("2024-01-15T09:00:00Z")) is None
+    assert timestamp_gap(parse_timestamp("2024-01-15T10:00:00Z"), parse_timestamp("10:05")) is None
+
+@pytest.mark.parametrize("text,expected", [
+    ("no emoji here", 0),
+    ("great 😊", 1),
+    ("😂😂😂", 3),
+    ("family 👨‍👩‍👧‍👦 time", 1),  # ZWJ sequence
+    ("🏳️‍🌈", 1),  # flag with variation selector and ZWJ
+    ("🇬🇧 and 🇫🇷", 2),  # regional indicator flags
+    ("👍🏽 thanks", 1),  # skin tone modifier
+    ("🧑🏾‍💻 coding", 1),  # skin tone inside a ZWJ sequence
+    ("❤️ and ☀", 2),
+    ("press 1️⃣", 1)
+])
+def test_count_emojis_counts_whole_sequences(text, expected):
+    assert count_emojis(text) == expected
+
+def make_chat(length, seed=3):
+    rng = random.Random(seed)
+    texts = ["hey!", "how are you?", "good 😊", "lol 😂😂", "see you at 8", "👍🏽", "really?! 🇬🇧", "ok"]
+    minutes = 23 * 60
+    chat = []
+    for _ in range(length):
+        # clock times with no date, so replies regularly cross midnight
+        minutes = (minutes + rng.randint(1, 90)) % (24 * 60)
+        chat.append(SimpleNamespace(
+            text=rng.choice(texts),
+            timestamp=f"{minutes // 60}:{minutes % 60:02d}",
+            isOutgoing=rng.random() < 0.5,
+            sender="you"
+        ))
+    return chat
+
+@pytest.mark.parametrize("batch_size", [1, 7, 50, 199])
+def test_batched_ingest_matches_a_single_pass(batch_size):
+    chat = make_chat(RECENT_WINDOW + 60)
+    full = ConversationAggregates()
+    full.add(chat)
+
+    batched = ConversationAggregates()
+    for start in range(0, len(chat), batch_size):
+        # sessions store the aggregates as JSON between requests
+        batched = ConversationAggregates.from_dict(json.loads(json.dumps(batched.to_dict())))
+        batched.add(chat[start:start + batch_size])
+
+    assert batched.to_dict() == full.to_dict()
+    assert batched.cursor == len(chat)
+    assert len(batched.recent) == RECENT_WINDOW
+    assert full.user_responses + full.other_responses > 0
+
+def test_from_dict_rejects_other_versions():
+    data = ConversationAggregates().to_dict()
+    data["version"] = ConversationAggregates.VERSION - 1
+    assert ConversationAggregates.from_dict(data) is None
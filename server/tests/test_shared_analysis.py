@@ -0,0 +1,63 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import fakeredis
+
+import main
+import stats_server
+
+CHAT = [
+    {"text": "Hey! Are we still on for the match Saturday?", "timestamp": "2024-01-01T10:00:00Z", "isOutgoing": False, "sender": "them"},
+    {"text": "yesss cant wait 😂 bringing snacks", "timestamp": "2024-01-01T10:02:00Z", "isOutgoing": True, "sender": "you"},
+    {"text": "Amazing, see you at 3!", "timestamp": "2024-01-01T10:05:00Z", "isOutgoing": False, "sender": "them"},
+    {"text": "lol perfect", "timestamp": "2024-01-01T10:06:00Z", "isOutgoing": True, "sender": "you"}
+]
+
+TONE = {"formality_level": "very casual", "engagement_style": "playful", "emoji_usage": "high", "humor_style": "teasing"}
+
+STATS = {
+    "conversation_topics": {"topics": [{"topic": "Sports", "percentage": "70%"}, {"topic": "Social Plans", "percentage": "30%"}]},
+    "communication_style": {"style_points": ["Confirms plans quickly"]},
+    "conversation_tips": {"tips": ["Keep the banter going"]}
+}
+
+def completion(content, prompts):
+    async def chat_completion(**kwargs):
+        prompts.append(kwargs["messages"][-1]["content"])
+        message = SimpleNamespace(content=json.dumps(content), refusal=None)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+    return chat_completion
+
+def test_stats_prompt_uses_the_tone_profile_main_published(monkeypatch):
+    shared_redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+    monkeypatch.setattr(main.analysis_store, "redis_client", shared_redis)
+    monkeypatch.setattr(stats_server.analysis_store, "redis_client", shared_redis)
+    tone_prompts, stats_prompts = [], []
+    monkeypatch.setattr(main.client, "chat_completion", completion(TONE, tone_prompts))
+    monkeypatch.setattr(stats_server.client, "chat_completion", completion(STATS, stats_prompts))
+
+    async def run():
+        messages = [main.ChatMessage(**msg) for msg in CHAT]
+        await main.analyze_user_tone(messages, None, main.shared_fingerprint(messages))
+        return await stats_server.compute_stats(stats_server.StatsRequest(chat_history=CHAT, user_id="shared_test"))
+
+    stats_response, _ = asyncio.run(run())
+
+    assert len(tone_prompts) == 1
+    assert "YOUR OWN STYLE" in stats_prompts[0]
+    assert "Formality: very casual, engagement: playful, emoji usage: high" in stats_prompts[0]
+    assert stats_response.conversation_topics.topics[0]["topic"] == "Sports"
+
+def test_stats_prompt_without_a_tone_profile():
+    metrics = {"conversation_text": "You: hi", "total_messages": 1, "user_messages": 1, "other_messages": 0}
+    prompt = stats_server.create_stats_messages(metrics)[-1]["content"]
+    assert "YOUR OWN STYLE" not in prompt
+    assert prompt.endswith("CONVERSATION HISTORY:\nYou: hi")
+
+def test_tone_profile_is_part_of_the_stats_cache_key():
+    aggregates = stats_server.ConversationAggregates()
+    aggregates.add([stats_server.ChatMessage(**msg) for msg in CHAT])
+    metrics = stats_server.analyze_conversation_metrics(aggregates)
+    assert (stats_server.conversation_fingerprint(aggregates, metrics)
+            != stats_server.conversation_fingerprint(aggregates, metrics, TONE))
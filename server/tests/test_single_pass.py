@@ -0,0 +1,43 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import main
+
+CHAT = [
+    {"text": "Are you coming tonight?", "timestamp": "2024-01-01T18:00:00Z", "isOutgoing": False, "sender": "them"},
+    {"text": "yeah should be!", "timestamp": "2024-01-01T18:02:00Z", "isOutgoing": True, "sender": "you"}
+]
+
+VALID = {
+    "response": "They're checking you're still on, so confirm and add a detail.",
+    "suggestions": ["Yep, see you at 8!", "Wouldn't miss it, want me to bring anything?", "On my way soon 😊"],
+    "tone_profile": {"formality_level": "casual"}
+}
+
+def run_single_pass(monkeypatch, content):
+    async def chat_completion(**kwargs):
+        message = SimpleNamespace(content=content, refusal=None)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+    monkeypatch.setattr(main.client, "chat_completion", chat_completion)
+    request = main.AnalysisRequest(chat_history=CHAT, user_query="what now?", user_id="single_pass_test")
+    return asyncio.run(main.analyze_chat_single_pass(request))
+
+def test_valid_result_is_used(monkeypatch):
+    analysis = run_single_pass(monkeypatch, json.dumps(VALID))
+    assert analysis.suggestions == VALID["suggestions"]
+    assert analysis.user_tone_analysis["formality_level"] == "casual"
+
+@pytest.mark.parametrize("result", [
+    ["not", "an", "object"],
+    {key: value for key, value in VALID.items() if key != "tone_profile"},
+    {**VALID, "tone_profile": "casual"},
+    {**VALID, "suggestions": "Yep, see you at 8!"},
+    {**VALID, "suggestions": ["Yep, see you at 8!", {"text": "On my way"}]},
+    {**VALID, "response": None}
+])
+def test_schema_mismatch_falls_back_to_two_step(monkeypatch, result):
+    assert run_single_pass(monkeypatch, json.dumps(result)) is None
@@ -0,0 +1,39 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import stats_server
+
+CHAT = [
+    {"text": "Did you finish the report?", "timestamp": "2024-02-01T09:00:00Z", "isOutgoing": False, "sender": "them"},
+    {"text": "Almost, sending it after lunch", "timestamp": "2024-02-01T09:03:00Z", "isOutgoing": True, "sender": "you"}
+]
+
+STATS = {
+    "conversation_topics": {"topics": [{"topic": "Work", "percentage": "100%"}]},
+    "communication_style": {"style_points": ["Direct and to the point"]},
+    "conversation_tips": {"tips": ["Give them a time"]}
+}
+
+def test_prompt_tokens_come_from_the_provider_and_not_from_cache_hits(monkeypatch):
+    calls = []
+
+    async def chat_completion(**kwargs):
+        calls.append(kwargs)
+        message = SimpleNamespace(content=json.dumps(STATS), refusal=None)
+        usage = SimpleNamespace(prompt_tokens=777, completion_tokens=50, total_tokens=827)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=usage)
+
+    monkeypatch.setattr(stats_server.client, "chat_completion", chat_completion)
+
+    async def run():
+        first, _ = await stats_server.compute_stats(stats_server.StatsRequest(chat_history=CHAT, user_id="tokens_a"))
+        second, _ = await stats_server.compute_stats(stats_server.StatsRequest(chat_history=CHAT, user_id="tokens_b"))
+        return first, second
+
+    first, second = asyncio.run(run())
+
+    assert len(calls) == 1
+    assert first.prompt_tokens == 777
+    assert second.prompt_tokens is None
+    assert second.conversation_tips.tips == first.conversation_tips.tips
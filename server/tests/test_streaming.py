@@ -0,0 +1,104 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from llm_client import LLMClient
+from mock_llm_server import ADVICE_RESPONSE
+
+CHAT = [
+    {"text": "Want to go climbing Saturday?", "timestamp": "2024-01-01T10:00:00Z", "isOutgoing": False, "sender": "them"},
+    {"text": "Ooh maybe!", "timestamp": "2024-01-01T10:01:00Z", "isOutgoing": True, "sender": "you"}
+]
+
+NUMBERED_ADVICE = """Considering the plan, keep it short and upbeat since they already asked you.
+
+Here are some suggestions:
+1. "Saturday works, what time?"
+2. Yes! I've been wanting to try that place
+3. Count me in, should I bring anything?
+
+Choose one that feels right!"""
+
+def stream_events(monkeypatch, llm_text, usage=None):
+    async def prepare_analysis(request, structured=False):
+        return {}, "summary", [{"role": "user", "content": "advice please"}]
+
+    async def stream_chat_completion(on_usage=None, **kwargs):
+        # a few characters at a time, so lines arrive split across tokens like a real stream
+        for i in range(0, len(llm_text), 7):
+            yield llm_text[i:i + 7]
+        if usage and on_usage:
+            on_usage(SimpleNamespace(usage=usage, choices=[]))
+
+    monkeypatch.setattr(main, "prepare_analysis", prepare_analysis)
+    monkeypatch.setattr(main.client, "stream_chat_completion", stream_chat_completion)
+
+    with TestClient(main.app) as http:
+        response = http.post("/analyze_chat/stream", json={"chat_history": CHAT, "user_query": "what now?",
+                                                           "user_id": "streaming_test"})
+    assert response.status_code == 200
+
+    events = []
+    for raw_event in response.text.strip().split("\n\n"):
+        name, data = raw_event.split("\n", 1)
+        events.append((name[len("event: "):], json.loads(data[len("data: "):])))
+    return events
+
+@pytest.mark.parametrize("llm_text", [ADVICE_RESPONSE, NUMBERED_ADVICE])
+def test_streamed_suggestions_match_result(monkeypatch, llm_text):
+    events = stream_events(monkeypatch, llm_text)
+
+    streamed = [data["text"] for name, data in events if name == "suggestion"]
+    name, result = events[-1]
+    assert name == "result"
+    assert streamed
+    assert streamed == result["suggestions"]
+    assert "".join(data["text"] for name, data in events if name == "token") == llm_text
+
+def test_advice_without_a_suggestions_section_is_not_streamed(monkeypatch):
+    llm_text = "They seem relaxed, so keep it light.\n- Sounds fun, I'm in!\n- What time were you thinking?\n"
+    events = stream_events(monkeypatch, llm_text)
+
+    assert not [data for name, data in events if name == "suggestion"]
+    assert events[-1][1]["suggestions"][:2] == ["Sounds fun, I'm in!", "What time were you thinking?"]
+
+def test_result_reports_the_providers_prompt_tokens(monkeypatch):
+    usage = SimpleNamespace(prompt_tokens=1234, completion_tokens=56, total_tokens=1290)
+    events = stream_events(monkeypatch, ADVICE_RESPONSE, usage)
+    assert events[-1][1]["prompt_tokens"] == 1234
+
+def test_result_estimates_prompt_tokens_without_usage(monkeypatch):
+    events = stream_events(monkeypatch, ADVICE_RESPONSE)
+    assert events[-1][1]["prompt_tokens"] == main.prompt_tokens_used(None, [{"role": "user", "content": "advice please"}])
+
+def test_stream_chat_completion_hands_over_the_usage_chunk():
+    usage = SimpleNamespace(prompt_tokens=40, completion_tokens=2, total_tokens=42)
+    chunks = [
+        SimpleNamespace(usage=None, choices=[SimpleNamespace(delta=SimpleNamespace(content="Hi"))]),
+        SimpleNamespace(usage=None, choices=[SimpleNamespace(delta=SimpleNamespace(content=" there"))]),
+        SimpleNamespace(usage=usage, choices=[])
+    ]
+
+    async def create(**kwargs):
+        async def stream():
+            for chunk in chunks:
+                yield chunk
+        return stream()
+
+    openai_client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    client = LLMClient(openai_client=openai_client)
+    received = []
+
+    async def consume():
+        return [token async for token in client.stream_chat_completion(
+            call_name="test_stream", on_usage=received.append, model="gpt-4o-mini",
+            messages=[{"role": "user", "content": "hi"}]
+        )]
+
+    assert asyncio.run(consume()) == ["Hi", " there"]
+    assert [chunk.usage for chunk in received] == [usage]
+    assert client.usage["test_stream"]["prompt_tokens"] == 40
@@ -0,0 +1,45 @@
+import os
+from typing import Any, Dict, List, Sequence
+
+# roughly 4 bytes of UTF-8 per token; emoji and other non-Latin text cost more, which bytes capture
+BYTES_PER_TOKEN = 4
+
+MAX_MESSAGE_TOKENS = int(os.getenv("MAX_MESSAGE_TOKENS", 150))
+TONE_HISTORY_TOKENS = int(os.getenv("TONE_HISTORY_TOKENS", 800))
+ANALYSIS_HISTORY_TOKENS = int(os.getenv("ANALYSIS_HISTORY_TOKENS", 1500))
+SUMMARY_HISTORY_TOKENS = int(os.getenv("SUMMARY_HISTORY_TOKENS", 1000))
+STATS_HISTORY_TOKENS = int(os.getenv("STATS_HISTORY_TOKENS", 2500))
+
+def estimate_tokens(text: str) -> int:
+    if not text:
+        return 0
+    return (len(text.encode("utf-8")) + BYTES_PER_TOKEN - 1) // BYTES_PER_TOKEN
+
+def prompt_tokens_used(response: Any, messages: List[Dict[str, str]]) -> int:
+    # the provider's count when it reported one, otherwise the same estimate the budgets use
+    usage = getattr(response, "usage", None)
+    if usage and getattr(usage, "prompt_tokens", None):
+        return usage.prompt_tokens
+    return sum(estimate_tokens(message["content"]) for message in messages)
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    cut = text.encode("utf-8")[:max(max_tokens - 1, 0) * BYTES_PER_TOKEN].decode("utf-8", errors="ignore")
+    return cut.rstrip() + "…"
+
+def window_texts(texts: Sequence[str], budget: int, max_item_tokens: int = MAX_MESSAGE_TOKENS,
+                 item_overhead: int = 3) -> List[str]:
+    # keeps the newest texts that fit the budget, each truncated to max_item_tokens;
+    # item_overhead covers the "You: " / "Message 12: " prefix and newline each caller adds
+    window = []
+    used = 0
+    for text in reversed(texts):
+        text = truncate_to_tokens(text, max_item_tokens)
+        cost = estimate_tokens(text) + item_overhead
+        if used + cost > budget and window:
+            break
+        window.append(text)
+        used += cost
+    window.reverse()
+    return window